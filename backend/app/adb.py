@@ -0,0 +1,137 @@
+import asyncio
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from app.db import DB_CONFIG, POOL_MIN_SIZE, POOL_MAX_SIZE, POOL_ACQUIRE_TIMEOUT, PoolTimeoutError
+from app.metrics import stage
+from app.profiling import record_sql
+
+# ==============================
+# Async Data Layer Settings
+# ==============================
+# "true": read and ingest routes await asyncpg on the event loop;
+# "false": they run the psycopg2 path on the threadpool (the old behaviour)
+ASYNC_DB_ENABLED = os.getenv("ASYNC_DB", "true").lower() == "true"
+
+_PLACEHOLDER = re.compile(r"%s")
+
+
+def to_asyncpg(sql):
+    """Rewrite psycopg2 %s placeholders as asyncpg's $1, $2, ... so both drivers share SQL."""
+    counter = iter(range(1, 1000))
+    return _PLACEHOLDER.sub(lambda _: f"${next(counter)}", sql)
+
+
+class AsyncConnectionPool:
+    """
+    asyncpg pool with the same sizing and acquire timeout as the psycopg2
+    pool in app/db.py. Created on first use so startup never blocks on the
+    database.
+    """
+
+    def __init__(self, min_size, max_size, acquire_timeout):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+
+        self._pool = None
+        self._pool_lock = None
+
+        self._acquired_total = 0
+        self._timeouts_total = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def _get_pool(self):
+        if self._pool is not None:
+            return self._pool
+
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+        async with self._pool_lock:
+            if self._pool is None:
+                self._pool = await asyncpg.create_pool(
+                    host=DB_CONFIG["host"],
+                    database=DB_CONFIG["database"],
+                    user=DB_CONFIG["user"],
+                    password=DB_CONFIG["password"],
+                    port=int(DB_CONFIG["port"]),
+                    min_size=self.min_size,
+                    max_size=self.max_size
+                )
+        return self._pool
+
+    @asynccontextmanager
+    async def connection(self):
+        start = time.perf_counter()
+        try:
+            with stage("db_acquire"):
+                pool = await self._get_pool()
+                conn = await pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._timeouts_total += 1
+            raise PoolTimeoutError(
+                f"No database connection available within {self.acquire_timeout}s"
+            )
+
+        waited = time.perf_counter() - start
+        self._acquired_total += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+        try:
+            yield conn
+        finally:
+            await pool.release(conn)
+
+    async def fetch(self, sql, *params):
+        async with self.connection() as conn:
+            start = time.perf_counter()
+            with stage("db_query"):
+                rows = await conn.fetch(to_asyncpg(sql), *params)
+            record_sql(sql, time.perf_counter() - start, len(rows))
+            return rows
+
+    async def execute(self, sql, *params):
+        async with self.connection() as conn:
+            start = time.perf_counter()
+            with stage("db_query"):
+                status = await conn.execute(to_asyncpg(sql), *params)
+            record_sql(sql, time.perf_counter() - start)
+            return status
+
+    async def copy_records(self, table, columns, records):
+        async with self.connection() as conn:
+            start = time.perf_counter()
+            with stage("db_query"):
+                status = await conn.copy_records_to_table(table, records=records, columns=columns)
+            record_sql(f"COPY {table} ({', '.join(columns)})", time.perf_counter() - start, len(records))
+            return status
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    def stats(self):
+        size = self._pool.get_size() if self._pool is not None else 0
+        idle = self._pool.get_idle_size() if self._pool is not None else 0
+        return {
+            "enabled": ASYNC_DB_ENABLED,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "acquired_total": self._acquired_total,
+            "timeouts_total": self._timeouts_total,
+            "wait_time_avg_ms": round(self._wait_total / self._acquired_total * 1000, 3) if self._acquired_total else 0.0,
+            "wait_time_max_ms": round(self._wait_max * 1000, 3),
+        }
+
+
+async_db_pool = AsyncConnectionPool(POOL_MIN_SIZE, POOL_MAX_SIZE, POOL_ACQUIRE_TIMEOUT)
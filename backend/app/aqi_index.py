@@ -0,0 +1,239 @@
+import logging
+import os
+import random
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# AQI Categories
+# ==============================
+# The one mapping from AQI to category: used for model predictions, the
+# sub-index AQI below and the /top-polluted SQL.
+CATEGORY_BOUNDS = [50, 100, 200, 300, 400]
+CATEGORY_LABELS = np.array(["Good", "Satisfactory", "Moderate", "Poor", "Very Poor", "Severe"])
+
+
+def get_category(aqi):
+    # NaN / inf (no AQI, e.g. the formula without enough pollutants) has no category
+    if aqi is None or not np.isfinite(aqi):
+        return None
+    return str(CATEGORY_LABELS[np.searchsorted(CATEGORY_BOUNDS, aqi, side="left")])
+
+
+def get_categories(aqi_values):
+    # Vectorized get_category: index of the first bound the AQI does not exceed
+    aqi_values = np.asarray(aqi_values, dtype=np.float64)
+    categories = CATEGORY_LABELS.astype(object)[np.searchsorted(CATEGORY_BOUNDS, aqi_values, side="left")]
+    categories[~np.isfinite(aqi_values)] = None
+    return categories.tolist()
+
+
+def category_sql(expr):
+    """SQL CASE expression giving the category of `expr` (a trusted SQL snippet)."""
+    whens = " ".join(
+        f"WHEN {expr} <= {bound} THEN '{label}'"
+        for bound, label in zip(CATEGORY_BOUNDS, CATEGORY_LABELS)
+    )
+    return f"CASE WHEN {expr} IS NULL OR {expr} = 'NaN' THEN NULL {whens} ELSE '{CATEGORY_LABELS[-1]}' END"
+
+
+# ==============================
+# CPCB Sub-index AQI
+# ==============================
+# National AQI breakpoints (CPCB): concentration at the top of each
+# category, for AQI 50, 100, 200, 300, 400. Units as in the dataset and
+# /predict: µg/m³, CO in mg/m³. The official averaging periods (24 h, 8 h
+# for CO and O3) are not applied; each reading is scored as given.
+POLLUTANTS = ["PM2.5", "PM10", "NO2", "CO", "SO2", "O3", "NH3"]
+BREAKPOINTS = {
+    "PM2.5": [30, 60, 90, 120, 250],
+    "PM10": [50, 100, 250, 350, 430],
+    "NO2": [40, 80, 180, 280, 400],
+    "CO": [1.0, 2.0, 10, 17, 34],
+    "SO2": [40, 80, 380, 800, 1600],
+    "O3": [50, 100, 168, 208, 748],
+    "NH3": [200, 400, 800, 1200, 1800],
+}
+INDEX_POINTS = np.array([0, 50, 100, 200, 300, 400], dtype=np.float64)
+# CPCB needs at least three pollutants, one of them PM2.5 or PM10
+MIN_POLLUTANTS = 3
+PARTICULATES = [POLLUTANTS.index("PM2.5"), POLLUTANTS.index("PM10")]
+
+# Above the last breakpoint the index keeps rising at the last band's
+# slope: one far-away extra point lets np.interp extrapolate on its own
+_FAR = 1e6
+
+
+def _interp_points(breakpoints):
+    c = np.array([0] + breakpoints, dtype=np.float64)
+    band = c[-1] - c[-2]
+    return (np.append(c, c[-1] + _FAR * band),
+            np.append(INDEX_POINTS, INDEX_POINTS[-1] + _FAR * (INDEX_POINTS[-1] - INDEX_POINTS[-2])))
+
+
+_INTERP_POINTS = [_interp_points(BREAKPOINTS[p]) for p in POLLUTANTS]
+
+
+def _columns(concentrations):
+    concentrations = np.asarray(concentrations, dtype=np.float64)
+    # Column-major copy so every pollutant is one contiguous array
+    return np.ascontiguousarray(concentrations[:, :len(POLLUTANTS)].T)
+
+
+def sub_indices(concentrations):
+    """
+    (n, 7) concentrations in POLLUTANTS order -> (n, 7) sub-indices, linear
+    within each breakpoint band. NaN (missing) concentrations stay NaN.
+    """
+    columns = _columns(concentrations)
+    return np.column_stack([np.interp(col, c, i) for col, (c, i) in zip(columns, _INTERP_POINTS)])
+
+
+def compute_aqi(concentrations):
+    """
+    CPCB AQI per row: the highest sub-index. NaN where fewer than
+    MIN_POLLUTANTS are present or neither PM2.5 nor PM10 is.
+    """
+    columns = _columns(concentrations)
+    n = columns.shape[1]
+    aqi = np.full(n, np.nan)
+    present = np.zeros(n, dtype=np.int8)
+    for col, (c, i) in zip(columns, _INTERP_POINTS):
+        index = np.interp(col, c, i)
+        np.fmax(aqi, index, out=aqi)
+        present += ~np.isnan(col)
+
+    valid = present >= MIN_POLLUTANTS
+    valid &= ~(np.isnan(columns[PARTICULATES[0]]) & np.isnan(columns[PARTICULATES[1]]))
+    aqi[~valid] = np.nan
+    return aqi
+
+
+def prominent_pollutants(concentrations):
+    """Name of the pollutant with the highest sub-index per row (None if no AQI)."""
+    indices = sub_indices(concentrations)
+    names = np.array(POLLUTANTS, dtype=object)
+    filled = np.where(np.isnan(indices), -np.inf, indices)
+    result = names[np.argmax(filled, axis=1)]
+    result[np.isnan(compute_aqi(concentrations))] = None
+    return result.tolist()
+
+
+class SubIndexModel:
+    """
+    The CPCB formula behind the same predict() as a CatBoost model, for the
+    /predict feature layout (the seven pollutants first, time features
+    after, which it ignores). Served as the "cpcb" fast model.
+    """
+
+    feature_names_ = POLLUTANTS
+
+    def predict(self, features):
+        return compute_aqi(features)
+
+
+SUB_INDEX_MODEL_NAME = "cpcb"
+sub_index_model = SubIndexModel()
+
+
+# ==============================
+# Drift Check (model vs formula)
+# ==============================
+# Fraction of /predict calls cross-checked (~50 µs for a single row)
+AQI_DRIFT_SAMPLE = float(os.getenv("AQI_DRIFT_SAMPLE", "0.1"))
+AQI_DRIFT_WINDOW = int(os.getenv("AQI_DRIFT_WINDOW", "1000"))
+# Mean absolute model-minus-formula gap (AQI points) over the window that counts as drift
+AQI_DRIFT_THRESHOLD = float(os.getenv("AQI_DRIFT_THRESHOLD", "50"))
+
+
+class DriftMonitor:
+    """
+    Scores served predictions with the sub-index formula and tracks how far
+    the model is from it: running totals plus the last `window` rows. A
+    model whose recent mean absolute gap passes the threshold is logged
+    once, until it comes back.
+    """
+
+    def __init__(self, sample, window, threshold):
+        self.sample = sample
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        # Ring buffers over the last `window` rows
+        self._recent_abs = np.zeros(window)
+        self._recent_mismatch = np.zeros(window, dtype=bool)
+        self._next = 0
+        self._filled = 0
+        self._rows = 0
+        self._delta_sum = 0.0
+        self._abs_delta_sum = 0.0
+        self._category_mismatches = 0
+        self._drifting = False
+
+    def maybe_observe(self, model, features, predictions):
+        """Cross-check a sample of calls; never raises into the request."""
+        if self.sample <= 0 or random.random() >= self.sample:
+            return
+        try:
+            self.observe(model, features, predictions)
+        except Exception:
+            logger.exception("AQI drift check failed")
+
+    def observe(self, model, features, predictions):
+        formula = sub_index_model.predict(features)
+        predictions = np.asarray(predictions, dtype=np.float64)
+        scored = ~np.isnan(formula) & np.isfinite(predictions)
+        if not scored.any():
+            return
+        formula, predictions = formula[scored], predictions[scored]
+
+        delta = predictions - formula
+        abs_delta = np.abs(delta)
+        mismatched = (np.searchsorted(CATEGORY_BOUNDS, predictions, side="left")
+                      != np.searchsorted(CATEGORY_BOUNDS, formula, side="left"))
+
+        window = len(self._recent_abs)
+        with self._lock:
+            self._rows += len(delta)
+            self._delta_sum += float(delta.sum())
+            self._abs_delta_sum += float(abs_delta.sum())
+            self._category_mismatches += int(mismatched.sum())
+
+            tail = slice(-window, None)
+            slots = (self._next + np.arange(len(abs_delta[tail]))) % window
+            self._recent_abs[slots] = abs_delta[tail]
+            self._recent_mismatch[slots] = mismatched[tail]
+            self._next = int(slots[-1] + 1) % window
+            self._filled = min(window, self._filled + len(slots))
+
+            recent_mae = float(self._recent_abs[:self._filled].mean())
+            drifting = self._filled == window and recent_mae > self.threshold
+            changed = drifting != self._drifting
+            self._drifting = drifting
+
+        if changed and drifting:
+            logger.warning("AQI model %s drifted from the CPCB formula: recent MAE %.1f > %.1f",
+                           model, recent_mae, self.threshold)
+        elif changed:
+            logger.info("AQI model %s back within %.1f of the CPCB formula", model, self.threshold)
+
+    def stats(self):
+        with self._lock:
+            rows, filled = self._rows, self._filled
+            return {
+                "rows": rows,
+                "mean_delta": round(self._delta_sum / rows, 3) if rows else 0.0,
+                "mean_abs_delta": round(self._abs_delta_sum / rows, 3) if rows else 0.0,
+                "category_mismatch_rate": round(self._category_mismatches / rows, 4) if rows else 0.0,
+                "recent_rows": filled,
+                "recent_mean_abs_delta": round(float(self._recent_abs[:filled].mean()), 3) if filled else 0.0,
+                "recent_category_mismatch_rate": round(float(self._recent_mismatch[:filled].mean()), 4) if filled else 0.0,
+                "sample": self.sample,
+                "threshold": self.threshold,
+                "drifting": int(self._drifting),
+            }
+
+
+drift_monitor = DriftMonitor(AQI_DRIFT_SAMPLE, AQI_DRIFT_WINDOW, AQI_DRIFT_THRESHOLD)
@@ -0,0 +1,241 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+# ==============================
+# Cache Settings
+# ==============================
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+# Seconds each public read endpoint may be served from memory
+CACHE_TTL = {
+    "latest": float(os.getenv("CACHE_TTL_LATEST", "5")),
+    "top_polluted": float(os.getenv("CACHE_TTL_TOP_POLLUTED", "10")),
+    "public_sensors": float(os.getenv("CACHE_TTL_PUBLIC_SENSORS", "60")),
+    "history": float(os.getenv("CACHE_TTL_HISTORY", "15")),
+}
+
+# Live sensors invalidate "readings" many times a second, which would empty
+# the cache faster than it fills. Invalidations of these tags are applied
+# at most once per interval (entries are at most that much staler than the
+# database); other tags are invalidated immediately.
+CACHE_INVALIDATE_INTERVAL = {
+    "readings": float(os.getenv("CACHE_INVALIDATE_INTERVAL_READINGS", "1")),
+}
+
+
+class _Inflight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU of endpoint results with per-entry TTLs.
+
+    Concurrent misses for the same key wait on a single loader call.
+    Entries carry tags; invalidate(tag) drops every entry with that tag and
+    stops any load already in flight from storing a now-stale result. Tags
+    in CACHE_INVALIDATE_INTERVAL are coalesced: repeats within the interval
+    are held back and applied together once it has passed.
+    """
+
+    def __init__(self, max_entries, enabled=True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._inflight = {}
+        self._async_inflight = {}  # key -> asyncio.Future, for get_or_load_async
+        self._tag_versions = defaultdict(int)
+        self._tag_applied_at = defaultdict(float)
+        self._pending_tags = set()
+
+        self._hits = defaultdict(int)
+        self._misses = defaultdict(int)
+        self._coalesced = defaultdict(int)
+        self._evictions = 0
+        self._invalidations = defaultdict(int)
+        self._coalesced_invalidations = defaultdict(int)
+
+    def get_or_load(self, key, ttl, loader, tags=()):
+        """key is a tuple whose first element names the endpoint."""
+        if not self.enabled or ttl <= 0:
+            return loader()
+
+        name = key[0]
+        leader = False
+
+        with self._lock:
+            if self._pending_tags:
+                self._apply_pending(time.monotonic())
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits[name] += 1
+                    return entry[1]
+                del self._entries[key]
+
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self._coalesced[name] += 1
+            else:
+                self._misses[name] += 1
+                inflight = _Inflight()
+                self._inflight[key] = inflight
+                versions = {tag: self._tag_versions[tag] for tag in tags}
+                leader = True
+
+        if not leader:
+            inflight.done.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.value
+
+        try:
+            value = loader()
+        except BaseException as e:
+            inflight.error = e
+            with self._lock:
+                self._inflight.pop(key, None)
+            inflight.done.set()
+            raise
+
+        inflight.value = value
+        with self._lock:
+            self._inflight.pop(key, None)
+            # Skip storing if a write invalidated these tags mid-load
+            if all(self._tag_versions[tag] == v for tag, v in versions.items()):
+                self._store(key, ttl, value, tags)
+        inflight.done.set()
+
+        return value
+
+    async def get_or_load_async(self, key, ttl, loader, tags=()):
+        """get_or_load for async loaders; concurrent misses await one loader() call."""
+        if not self.enabled or ttl <= 0:
+            return await loader()
+
+        name = key[0]
+        leader = False
+
+        with self._lock:
+            if self._pending_tags:
+                self._apply_pending(time.monotonic())
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits[name] += 1
+                    return entry[1]
+                del self._entries[key]
+
+            future = self._async_inflight.get(key)
+            if future is not None:
+                self._coalesced[name] += 1
+            else:
+                self._misses[name] += 1
+                future = asyncio.get_running_loop().create_future()
+                self._async_inflight[key] = future
+                versions = {tag: self._tag_versions[tag] for tag in tags}
+                leader = True
+
+        if not leader:
+            # shield: a waiter being cancelled must not cancel the shared load
+            return await asyncio.shield(future)
+
+        try:
+            value = await loader()
+        except BaseException as e:
+            with self._lock:
+                self._async_inflight.pop(key, None)
+            future.set_exception(e)
+            future.exception()  # retrieved; no "never retrieved" warning without waiters
+            raise
+
+        with self._lock:
+            self._async_inflight.pop(key, None)
+            if all(self._tag_versions[tag] == v for tag, v in versions.items()):
+                self._store(key, ttl, value, tags)
+        future.set_result(value)
+
+        return value
+
+    def _store(self, key, ttl, value, tags):
+        # Caller holds self._lock
+        self._entries[key] = (time.monotonic() + ttl, value, tuple(tags))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            now = time.monotonic()
+            due = []
+            for tag in tags:
+                self._invalidations[tag] += 1
+                interval = CACHE_INVALIDATE_INTERVAL.get(tag, 0.0)
+                if now - self._tag_applied_at[tag] < interval:
+                    self._pending_tags.add(tag)
+                    self._coalesced_invalidations[tag] += 1
+                else:
+                    due.append(tag)
+            self._apply(due, now)
+
+    def _apply_pending(self, now):
+        # Caller holds self._lock
+        due = [tag for tag in self._pending_tags
+               if now - self._tag_applied_at[tag] >= CACHE_INVALIDATE_INTERVAL.get(tag, 0.0)]
+        self._apply(due, now)
+
+    def _apply(self, tags, now):
+        # Caller holds self._lock
+        if not tags:
+            return
+        for tag in tags:
+            self._tag_versions[tag] += 1
+            self._tag_applied_at[tag] = now
+            self._pending_tags.discard(tag)
+
+        tags = set(tags)
+        stale = [k for k, entry in self._entries.items() if tags.intersection(entry[2])]
+        for key in stale:
+            del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            endpoints = {}
+            for name in set(self._hits) | set(self._misses) | set(self._coalesced):
+                hits, misses = self._hits[name], self._misses[name]
+                endpoints[name] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "coalesced": self._coalesced[name],
+                    "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+                    "ttl_s": CACHE_TTL.get(name),
+                }
+
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self._evictions,
+                "invalidations": dict(self._invalidations),
+                "invalidations_coalesced": dict(self._coalesced_invalidations),
+                "endpoints": endpoints,
+            }
+
+
+response_cache = ResponseCache(CACHE_MAX_ENTRIES, CACHE_ENABLED)
@@ -0,0 +1,227 @@
+-- Convert an existing, unpartitioned sensor_readings table to the
+-- day-partitioned layout used by schema.sql and add the rollup tables.
+--
+--   psql -d air_quality_db -f app/database/migrations/partition_sensor_readings.sql
+--
+-- Runs in one transaction. Stop the API and simulator first: the table is
+-- rewritten and the sensor_latest trigger is moved to the new table.
+-- The old rows stay in sensor_readings_legacy until you drop it yourself.
+
+BEGIN;
+
+ALTER TABLE sensor_readings RENAME TO sensor_readings_legacy;
+ALTER INDEX idx_readings_sensor_time RENAME TO idx_readings_legacy_sensor_time;
+DROP TRIGGER IF EXISTS trg_sensor_latest ON sensor_readings_legacy;
+
+-- >>> shared:partitioning (generated from schema.sql by scripts/sync_schema.py; edit it there)
+CREATE TABLE sensor_readings (
+    id BIGSERIAL,
+    sensor_id INTEGER REFERENCES sensors(id),
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    pm25 FLOAT,
+    pm10 FLOAT,
+    no2 FLOAT,
+    co FLOAT,
+    so2 FLOAT,
+    o3 FLOAT,
+    nh3 FLOAT,
+
+    predicted_aqi FLOAT,
+    category VARCHAR(50),
+
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- Catches rows that fall outside every pre-created partition
+CREATE TABLE sensor_readings_default PARTITION OF sensor_readings DEFAULT;
+
+-- Index for fast queries (created on every partition)
+CREATE INDEX idx_readings_sensor_time
+ON sensor_readings(sensor_id, timestamp DESC);
+
+-- Create the partition for one day, moving any rows that already landed
+-- in the default partition for that day. Returns NULL if it already exists.
+CREATE OR REPLACE FUNCTION create_reading_partition(day DATE) RETURNS TEXT AS $$
+DECLARE
+    part_name TEXT := 'sensor_readings_p' || to_char(day, 'YYYYMMDD');
+BEGIN
+    IF to_regclass(part_name) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE sensor_readings INCLUDING DEFAULTS)', part_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM sensor_readings_default WHERE timestamp >= %L AND timestamp < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        day, day + 1, part_name
+    );
+    EXECUTE format(
+        'ALTER TABLE sensor_readings ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        part_name, day, day + 1
+    );
+
+    RETURN part_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Drop every daily partition that ends on or before the cutoff day.
+CREATE OR REPLACE FUNCTION drop_reading_partitions_before(cutoff DATE) RETURNS SETOF TEXT AS $$
+DECLARE
+    part RECORD;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'sensor_readings'::regclass
+          AND c.relname ~ '^sensor_readings_p[0-9]{8}$'
+          AND to_date(substring(c.relname FROM 18), 'YYYYMMDD') + 1 <= cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('DROP TABLE %I', part.relname);
+        RETURN NEXT part.relname;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+-- <<< shared:partitioning
+
+-- One partition per day that has data, plus the next week
+SELECT create_reading_partition(d::date)
+FROM generate_series(
+    COALESCE((SELECT MIN(timestamp) FROM sensor_readings_legacy)::date, CURRENT_DATE),
+    CURRENT_DATE + 7,
+    interval '1 day'
+) AS d;
+
+INSERT INTO sensor_readings
+    (id, sensor_id, timestamp, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category)
+SELECT id, sensor_id, timestamp, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category
+FROM sensor_readings_legacy
+WHERE timestamp IS NOT NULL;
+
+SELECT setval(
+    pg_get_serial_sequence('sensor_readings', 'id'),
+    COALESCE((SELECT MAX(id) FROM sensor_readings), 1)
+);
+
+-- Re-attach the sensor_latest trigger (sensor_latest itself is unchanged)
+DO $$
+BEGIN
+    IF to_regproc('sensor_latest_upsert') IS NOT NULL THEN
+        CREATE TRIGGER trg_sensor_latest
+        AFTER INSERT ON sensor_readings
+        FOR EACH ROW EXECUTE FUNCTION sensor_latest_upsert();
+    END IF;
+END;
+$$;
+
+-- ==============================
+-- Rollups
+-- ==============================
+-- >>> shared:rollups (generated from schema.sql by scripts/sync_schema.py; edit it there)
+-- Per-sensor aggregates (region_id is carried along so region series are a
+-- GROUP BY away). Filled incrementally by app/storage.py; rollup_watermarks
+-- records how far each rollup has been computed. <metric>_count is how many
+-- readings had that metric (NULLs are skipped by the average), and is the
+-- weight when averages are combined; reading_count counts every reading.
+
+-- Hourly rollup (kept for STORAGE_HOURLY_RETENTION_DAYS)
+CREATE TABLE IF NOT EXISTS sensor_readings_hourly (
+    bucket TIMESTAMP NOT NULL,
+    sensor_id INTEGER NOT NULL REFERENCES sensors(id) ON DELETE CASCADE,
+    region_id INTEGER REFERENCES regions(id),
+    reading_count INTEGER NOT NULL,
+
+    aqi_count INTEGER NOT NULL DEFAULT 0,
+    aqi_avg FLOAT,
+    aqi_min FLOAT,
+    aqi_max FLOAT,
+    pm25_count INTEGER NOT NULL DEFAULT 0,
+    pm25_avg FLOAT,
+    pm25_min FLOAT,
+    pm25_max FLOAT,
+    pm10_count INTEGER NOT NULL DEFAULT 0,
+    pm10_avg FLOAT,
+    pm10_min FLOAT,
+    pm10_max FLOAT,
+    no2_count INTEGER NOT NULL DEFAULT 0,
+    no2_avg FLOAT,
+    no2_min FLOAT,
+    no2_max FLOAT,
+    co_count INTEGER NOT NULL DEFAULT 0,
+    co_avg FLOAT,
+    co_min FLOAT,
+    co_max FLOAT,
+    so2_count INTEGER NOT NULL DEFAULT 0,
+    so2_avg FLOAT,
+    so2_min FLOAT,
+    so2_max FLOAT,
+    o3_count INTEGER NOT NULL DEFAULT 0,
+    o3_avg FLOAT,
+    o3_min FLOAT,
+    o3_max FLOAT,
+    nh3_count INTEGER NOT NULL DEFAULT 0,
+    nh3_avg FLOAT,
+    nh3_min FLOAT,
+    nh3_max FLOAT,
+
+    PRIMARY KEY (bucket, sensor_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_hourly_region_bucket
+ON sensor_readings_hourly(region_id, bucket);
+
+-- Daily rollup (kept indefinitely)
+CREATE TABLE IF NOT EXISTS sensor_readings_daily (
+    bucket TIMESTAMP NOT NULL,
+    sensor_id INTEGER NOT NULL REFERENCES sensors(id) ON DELETE CASCADE,
+    region_id INTEGER REFERENCES regions(id),
+    reading_count INTEGER NOT NULL,
+
+    aqi_count INTEGER NOT NULL DEFAULT 0,
+    aqi_avg FLOAT,
+    aqi_min FLOAT,
+    aqi_max FLOAT,
+    pm25_count INTEGER NOT NULL DEFAULT 0,
+    pm25_avg FLOAT,
+    pm25_min FLOAT,
+    pm25_max FLOAT,
+    pm10_count INTEGER NOT NULL DEFAULT 0,
+    pm10_avg FLOAT,
+    pm10_min FLOAT,
+    pm10_max FLOAT,
+    no2_count INTEGER NOT NULL DEFAULT 0,
+    no2_avg FLOAT,
+    no2_min FLOAT,
+    no2_max FLOAT,
+    co_count INTEGER NOT NULL DEFAULT 0,
+    co_avg FLOAT,
+    co_min FLOAT,
+    co_max FLOAT,
+    so2_count INTEGER NOT NULL DEFAULT 0,
+    so2_avg FLOAT,
+    so2_min FLOAT,
+    so2_max FLOAT,
+    o3_count INTEGER NOT NULL DEFAULT 0,
+    o3_avg FLOAT,
+    o3_min FLOAT,
+    o3_max FLOAT,
+    nh3_count INTEGER NOT NULL DEFAULT 0,
+    nh3_avg FLOAT,
+    nh3_min FLOAT,
+    nh3_max FLOAT,
+
+    PRIMARY KEY (bucket, sensor_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_region_bucket
+ON sensor_readings_daily(region_id, bucket);
+
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    name VARCHAR(50) PRIMARY KEY,
+    computed_until TIMESTAMP NOT NULL
+);
+-- <<< shared:rollups
+
+COMMIT;
@@ -0,0 +1,51 @@
+-- Add the per-metric reading counts to rollup tables created before they
+-- existed. Averages are now weighted by <metric>_count instead of
+-- reading_count, because AVG skips NULLs.
+--
+--   psql -d air_quality_db -f app/database/migrations/rollup_metric_counts.sql
+--
+-- Existing rows are backfilled with reading_count, which was the weight they
+-- were combined with until now (0 where the average is NULL). Run it once:
+-- the backfill would overwrite counts the rollup job has written since.
+
+BEGIN;
+
+ALTER TABLE sensor_readings_hourly
+    ADD COLUMN IF NOT EXISTS aqi_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS pm25_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS pm10_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS no2_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS co_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS so2_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS o3_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS nh3_count INTEGER NOT NULL DEFAULT 0;
+UPDATE sensor_readings_hourly SET
+    aqi_count = CASE WHEN aqi_avg IS NULL THEN 0 ELSE reading_count END,
+    pm25_count = CASE WHEN pm25_avg IS NULL THEN 0 ELSE reading_count END,
+    pm10_count = CASE WHEN pm10_avg IS NULL THEN 0 ELSE reading_count END,
+    no2_count = CASE WHEN no2_avg IS NULL THEN 0 ELSE reading_count END,
+    co_count = CASE WHEN co_avg IS NULL THEN 0 ELSE reading_count END,
+    so2_count = CASE WHEN so2_avg IS NULL THEN 0 ELSE reading_count END,
+    o3_count = CASE WHEN o3_avg IS NULL THEN 0 ELSE reading_count END,
+    nh3_count = CASE WHEN nh3_avg IS NULL THEN 0 ELSE reading_count END;
+
+ALTER TABLE sensor_readings_daily
+    ADD COLUMN IF NOT EXISTS aqi_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS pm25_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS pm10_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS no2_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS co_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS so2_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS o3_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS nh3_count INTEGER NOT NULL DEFAULT 0;
+UPDATE sensor_readings_daily SET
+    aqi_count = CASE WHEN aqi_avg IS NULL THEN 0 ELSE reading_count END,
+    pm25_count = CASE WHEN pm25_avg IS NULL THEN 0 ELSE reading_count END,
+    pm10_count = CASE WHEN pm10_avg IS NULL THEN 0 ELSE reading_count END,
+    no2_count = CASE WHEN no2_avg IS NULL THEN 0 ELSE reading_count END,
+    co_count = CASE WHEN co_avg IS NULL THEN 0 ELSE reading_count END,
+    so2_count = CASE WHEN so2_avg IS NULL THEN 0 ELSE reading_count END,
+    o3_count = CASE WHEN o3_avg IS NULL THEN 0 ELSE reading_count END,
+    nh3_count = CASE WHEN nh3_avg IS NULL THEN 0 ELSE reading_count END;
+
+COMMIT;
@@ -0,0 +1,177 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# ==============================
+# Processed Dataset Layout
+# ==============================
+# Written by scripts/clean_data.py, read by the training and check scripts.
+#
+#   data/processed/air_quality/year_month=2017-11/part-0.parquet
+#
+# One directory per calendar month (Hive-style, so readers prune months
+# from a date range). Rows are sorted by Datetime, StationId is dictionary
+# encoded, pollutants are float32 and the calendar features are precomputed.
+DATASET_DIR = "data/processed/air_quality"
+# Written by older versions of clean_data.py; read when no dataset exists
+LEGACY_CSV_PATH = "data/processed/clean_air_quality.csv"
+
+PARTITION_KEY = "year_month"
+POLLUTANT_COLUMNS = ["PM2.5", "PM10", "NO2", "CO", "SO2", "O3", "NH3", "AQI"]
+DERIVED_COLUMNS = ["hour", "day", "month", "weekday"]
+COLUMNS = ["StationId", "Datetime"] + POLLUTANT_COLUMNS + DERIVED_COLUMNS
+
+SCHEMA = pa.schema(
+    [("StationId", pa.dictionary(pa.int32(), pa.string())), ("Datetime", pa.timestamp("ms"))]
+    + [(col, pa.float32()) for col in POLLUTANT_COLUMNS]
+    + [(col, pa.int8()) for col in DERIVED_COLUMNS]
+)
+
+# Rows per Parquet row group (the unit a reader can skip or load)
+ROW_GROUP_SIZE = 128_000
+
+
+def add_derived_columns(df):
+    """Calendar features used by the models, computed once at clean time."""
+    dt = df["Datetime"].dt
+    return df.assign(
+        hour=dt.hour.astype(np.int8),
+        day=dt.day.astype(np.int8),
+        month=dt.month.astype(np.int8),
+        weekday=dt.weekday.astype(np.int8),
+    )
+
+
+class DatasetWriter:
+    """
+    Streams Datetime-sorted blocks into one Parquet file per month.
+
+    Writes go to a staging directory that replaces the dataset on close(),
+    so readers never see a half-written dataset.
+    """
+
+    def __init__(self, path=DATASET_DIR, row_group_size=ROW_GROUP_SIZE):
+        self.path = path
+        self.row_group_size = row_group_size
+        self._staging = path.rstrip("/\\") + ".tmp"
+        shutil.rmtree(self._staging, ignore_errors=True)
+        os.makedirs(self._staging)
+
+        self._month = None
+        self._writer = None
+        self._pending = []
+        self._pending_rows = 0
+        self.rows = 0
+        self.partitions = 0
+
+    def write(self, df):
+        df = add_derived_columns(df)
+        # year * 100 + month; much cheaper than formatting every timestamp
+        months = df["Datetime"].dt.year.to_numpy() * 100 + df["month"].to_numpy()
+        # Blocks arrive sorted, so each month is one contiguous slice
+        bounds = np.flatnonzero(months[1:] != months[:-1]) + 1
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(df)]):
+            if months[start] != self._month:
+                self._open(months[start])
+            self._append(df.iloc[start:end])
+
+    def _open(self, month):
+        self._close_writer()
+        label = f"{month // 100:04d}-{month % 100:02d}"
+        directory = os.path.join(self._staging, f"{PARTITION_KEY}={label}")
+        os.makedirs(directory, exist_ok=True)
+        self._writer = pq.ParquetWriter(os.path.join(directory, "part-0.parquet"), SCHEMA,
+                                        compression="zstd")
+        self._month = month
+        self.partitions += 1
+
+    def _append(self, df):
+        self._pending.append(df)
+        self._pending_rows += len(df)
+        self.rows += len(df)
+        if self._pending_rows >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        df = pd.concat(self._pending, ignore_index=True)[COLUMNS]
+        df["StationId"] = df["StationId"].astype("category")
+        table = pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self._pending = []
+        self._pending_rows = 0
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._flush()
+            self._writer.close()
+            self._writer = None
+
+    def close(self):
+        self._close_writer()
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self._staging, self.path)
+
+
+def load_dataset(columns=None, stations=None, start=None, end=None, path=DATASET_DIR):
+    """
+    Load the processed dataset as a DataFrame.
+
+    Only `columns` are read (all by default). `stations` filters on
+    StationId, and `start`/`end` (inclusive, anything pd.Timestamp accepts)
+    on Datetime, skipping whole months outside the range. Falls back to the
+    legacy CSV if the Parquet dataset has not been built yet.
+    """
+    columns = list(columns) if columns is not None else COLUMNS
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+
+    if not os.path.isdir(path):
+        if os.path.exists(LEGACY_CSV_PATH):
+            return _load_legacy_csv(columns, stations, start, end)
+        raise FileNotFoundError(f"{path} not found; run scripts/clean_data.py first")
+
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+
+    expr = None
+    conditions = []
+    if stations is not None:
+        conditions.append(ds.field("StationId").isin(list(stations)))
+    if start is not None:
+        conditions.append(ds.field(PARTITION_KEY) >= start.strftime("%Y-%m"))
+        conditions.append(ds.field("Datetime") >= start.to_datetime64())
+    if end is not None:
+        conditions.append(ds.field(PARTITION_KEY) <= end.strftime("%Y-%m"))
+        conditions.append(ds.field("Datetime") <= end.to_datetime64())
+    for condition in conditions:
+        expr = condition if expr is None else expr & condition
+
+    table = dataset.to_table(columns=columns, filter=expr)
+    df = table.to_pandas()
+    if "StationId" in df.columns:
+        # Month files have their own dictionaries; make one categorical
+        df["StationId"] = df["StationId"].astype("category")
+    if "Datetime" in df.columns:
+        df["Datetime"] = df["Datetime"].astype("datetime64[ns]")
+    return df
+
+
+def _load_legacy_csv(columns, stations, start, end):
+    df = pd.read_csv(LEGACY_CSV_PATH, dtype={"StationId": "category"})
+    df["Datetime"] = pd.to_datetime(df["Datetime"])
+    df = add_derived_columns(df)
+    df[POLLUTANT_COLUMNS] = df[POLLUTANT_COLUMNS].astype(np.float32)
+
+    if stations is not None:
+        df = df[df["StationId"].isin(list(stations))]
+    if start is not None:
+        df = df[df["Datetime"] >= start]
+    if end is not None:
+        df = df[df["Datetime"] <= end]
+    return df[columns].reset_index(drop=True)
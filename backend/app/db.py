@@ -1,14 +1,230 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+from dotenv import load_dotenv
+
+from app.metrics import stage
+from app.profiling import record_sql
+
+load_dotenv()
 
 DB_CONFIG = {
-    "host": "localhost",
-    "database": "air_quality_db",
-    "user": "postgres",
-    "password": "Satya@2005",
-    "port": "5432"
+    "host": os.getenv("DB_HOST", "localhost"),
+    "database": os.getenv("DB_NAME", "air_quality_db"),
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD", "Satya@2005"),
+    "port": os.getenv("DB_PORT", "5432")
 }
 
+# ==============================
+# Pool Settings
+# ==============================
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5"))
+# Connections idle for longer than this are pinged before being handed out
+POOL_HEALTH_CHECK_AFTER = float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30"))
+
 
 def get_connection():
+    """Open a standalone connection (used by scripts outside the API)."""
     conn = psycopg2.connect(**DB_CONFIG)
-    return conn
\ No newline at end of file
+    return conn
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ProfiledCursor(extensions.cursor):
+    """Cursor that reports each statement's duration to the request profiler."""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_sql(query, time.perf_counter() - start, self.rowcount)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_sql(sql, time.perf_counter() - start, self.rowcount)
+
+
+class ConnectionPool:
+    """
+    Bounded psycopg2 pool.
+
+    A semaphore caps concurrent checkouts at max_size so callers wait
+    (up to acquire_timeout) instead of psycopg2 raising PoolError.
+    """
+
+    def __init__(self, min_size, max_size, acquire_timeout, health_check_after):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_after = health_check_after
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._released_at = {}
+
+        self._stats_lock = threading.Lock()
+        self._in_use = 0
+        self._acquired_total = 0
+        self._timeouts_total = 0
+        self._health_check_failures = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(
+                        self.min_size, self.max_size, cursor_factory=ProfiledCursor, **DB_CONFIG
+                    )
+        return self._pool
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+
+        released_at = self._released_at.get(id(conn))
+        if released_at is not None and time.monotonic() - released_at < self.health_check_after:
+            return True
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def acquire(self):
+        with stage("db_acquire"):
+            return self._acquire()
+
+    def _acquire(self):
+        start = time.monotonic()
+
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._stats_lock:
+                self._timeouts_total += 1
+            raise PoolTimeoutError(
+                f"Timed out after {self.acquire_timeout}s waiting for a database connection"
+            )
+
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+
+            if not self._is_healthy(conn):
+                with self._stats_lock:
+                    self._health_check_failures += 1
+                self._released_at.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        waited = time.monotonic() - start
+        with self._stats_lock:
+            self._in_use += 1
+            self._acquired_total += 1
+            self._wait_time_total += waited
+            self._wait_time_max = max(self._wait_time_max, waited)
+
+        return conn
+
+    def release(self, conn, discard=False):
+        try:
+            if not conn.closed and not discard:
+                status = conn.get_transaction_status()
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    # Never hand a half-finished transaction to the next request
+                    conn.rollback()
+
+            discard = discard or bool(conn.closed)
+            if discard:
+                self._released_at.pop(id(conn), None)
+            else:
+                self._released_at[id(conn)] = time.monotonic()
+
+            self._get_pool().putconn(conn, close=discard)
+        finally:
+            with self._stats_lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except psycopg2.Error:
+            self.release(conn, discard=bool(conn.closed))
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def stats(self):
+        with self._stats_lock:
+            acquired = self._acquired_total
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._pool._pool) if self._pool is not None else 0,
+                "acquired_total": acquired,
+                "timeouts_total": self._timeouts_total,
+                "health_check_failures": self._health_check_failures,
+                "wait_time_avg_ms": round(self._wait_time_total / acquired * 1000, 3) if acquired else 0.0,
+                "wait_time_max_ms": round(self._wait_time_max * 1000, 3),
+            }
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                self._released_at.clear()
+
+
+db_pool = ConnectionPool(
+    POOL_MIN_SIZE,
+    POOL_MAX_SIZE,
+    POOL_ACQUIRE_TIMEOUT,
+    POOL_HEALTH_CHECK_AFTER,
+)
+
+
+# ==============================
+# FastAPI Dependency
+# ==============================
+def get_db():
+    with db_pool.connection() as conn:
+        yield conn
+
+
+def run_with_connection(fn, *args):
+    """Call fn(conn, *args) with a pooled connection, for work done outside a route's dependencies."""
+    with db_pool.connection() as conn:
+        return fn(conn, *args)
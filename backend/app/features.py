@@ -0,0 +1,211 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ==============================
+# Forecast Feature Settings
+# ==============================
+# Shared by scripts/train_forecast_model.py and the /forecast routes, so the
+# features a model is trained on are the ones it is served with.
+DEFAULT_LAGS = (1, 2, 3, 6)
+FEATURE_WORKERS = int(os.getenv("FEATURE_WORKERS", str(os.cpu_count() or 1)))
+
+TIME_OF_DAY_NAMES = ["hour", "hour_sin", "hour_cos"]
+
+_LAG_NAME = re.compile(r"^AQI_lag_(\d+)$")
+_ROLL_NAME = re.compile(r"^AQI_roll_(mean|std)_(\d+)$")
+
+
+class FeatureSpec:
+    """
+    Which forecast features a model uses.
+
+    Every feature is computed from a window of the sensor's last `window`
+    AQI values (oldest first) and the time being predicted:
+      AQI_lag_k           value k steps back
+      AQI_roll_mean_w     mean of the last w values
+      AQI_roll_std_w      population std of the last w values
+      hour, hour_sin/cos  hour of day of the predicted reading
+
+    The spec can be rebuilt from a trained model's feature names, so serving
+    always matches whatever the active model was trained with.
+    """
+
+    def __init__(self, lags=DEFAULT_LAGS, rolling=(), time_of_day=False):
+        self.lags = tuple(sorted(set(int(k) for k in lags)))
+        self.rolling = tuple(sorted(set(int(w) for w in rolling)))
+        self.time_of_day = bool(time_of_day)
+
+        if not self.lags and not self.rolling:
+            raise ValueError("A feature spec needs at least one lag or rolling window")
+        if min(self.lags + self.rolling) < 1:
+            raise ValueError("Lags and rolling windows must be >= 1")
+
+    @property
+    def window(self):
+        """How many past values a prediction needs."""
+        return max(self.lags + self.rolling)
+
+    @property
+    def names(self):
+        names = [f"AQI_lag_{k}" for k in self.lags]
+        for w in self.rolling:
+            names += [f"AQI_roll_mean_{w}", f"AQI_roll_std_{w}"]
+        if self.time_of_day:
+            names += TIME_OF_DAY_NAMES
+        return names
+
+    def to_dict(self):
+        return {"lags": list(self.lags), "rolling": list(self.rolling), "time_of_day": self.time_of_day}
+
+    @classmethod
+    def from_names(cls, names):
+        lags, rolling, time_of_day = [], set(), False
+        for name in names:
+            if (m := _LAG_NAME.match(name)):
+                lags.append(int(m.group(1)))
+            elif (m := _ROLL_NAME.match(name)):
+                rolling.add(int(m.group(2)))
+            elif name in TIME_OF_DAY_NAMES:
+                time_of_day = True
+            else:
+                raise ValueError(f"Unknown forecast feature {name!r}")
+
+        spec = cls(lags, rolling, time_of_day)
+        if spec.names != list(names):
+            raise ValueError(f"Feature order {list(names)} does not match {spec.names}")
+        return spec
+
+    @classmethod
+    def for_model(cls, model):
+        """Spec of a trained model; models without usable names get the default lags."""
+        names = list(getattr(model, "feature_names_", None) or [])
+        try:
+            return cls.from_names(names)
+        except ValueError:
+            default = cls()
+            if len(names) == len(default.names):
+                return default
+            raise
+
+    def __eq__(self, other):
+        return isinstance(other, FeatureSpec) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"FeatureSpec(lags={self.lags}, rolling={self.rolling}, time_of_day={self.time_of_day})"
+
+
+def build_features(windows, target_times, spec):
+    """
+    windows: (n, spec.window) past AQI values, newest last.
+    target_times: n timestamps being predicted (only used for time of day).
+    Returns the (n, len(spec.names)) feature matrix, columns in spec.names order.
+    """
+    windows = np.asarray(windows, dtype=float)
+    columns = [windows[:, -k] for k in spec.lags]
+
+    for w in spec.rolling:
+        recent = windows[:, -w:]
+        columns.append(recent.mean(axis=1))
+        columns.append(recent.std(axis=1))
+
+    if spec.time_of_day:
+        hours = np.asarray(target_times, dtype="datetime64[h]").astype(np.int64) % 24
+        angle = hours * (2 * np.pi / 24)
+        columns += [hours.astype(float), np.sin(angle), np.cos(angle)]
+
+    return np.column_stack(columns)
+
+
+# ==============================
+# Training Sets
+# ==============================
+def station_features(values, times, spec):
+    """
+    Feature rows for one station's time-ordered series: row i predicts
+    values[spec.window + i] from the values before it. Uses build_features,
+    the same function the API calls when forecasting.
+    """
+    values = np.asarray(values, dtype=float)
+    times = np.asarray(times, dtype="datetime64[ns]")
+    w = spec.window
+    if len(values) <= w:
+        return np.empty((0, len(spec.names))), values[:0], times[:0]
+
+    windows = sliding_window_view(values, w)[:-1]
+    return build_features(windows, times[w:], spec), values[w:], times[w:]
+
+
+def _partition_features(task):
+    values, times, bounds, spec = task
+    parts = [station_features(values[a:b], times[a:b], spec) for a, b in bounds]
+    lengths = [len(p[1]) for p in parts]
+    return (
+        np.concatenate([p[0] for p in parts]) if parts else np.empty((0, len(spec.names))),
+        np.concatenate([p[1] for p in parts]) if parts else np.empty(0),
+        np.concatenate([p[2] for p in parts]) if parts else np.empty(0, dtype="datetime64[ns]"),
+        lengths,
+    )
+
+
+def build_training_frame(df, spec, workers=None):
+    """
+    Forecast training rows from a frame with StationId, Datetime and AQI.
+
+    Stations are split into contiguous partitions of roughly equal row
+    count, one per worker. Workers are threads: the per-partition work is
+    numpy code that releases the GIL, and threads share the result arrays
+    instead of pickling them back from another process.
+
+    Returns a DataFrame with StationId, Datetime, the spec's feature columns
+    and AQI (the target), ordered by station then time.
+    """
+    workers = max(1, workers or FEATURE_WORKERS)
+
+    stations = df["StationId"].astype("category")
+    codes = stations.cat.codes.to_numpy()
+    # Stable, so each station keeps its rows in time order
+    order = np.lexsort((df["Datetime"].to_numpy(), codes))
+    codes = codes[order]
+    values = df["AQI"].to_numpy(dtype=float)[order]
+    times = df["Datetime"].to_numpy(dtype="datetime64[ns]")[order]
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], len(codes)]
+    station_codes = codes[starts]
+
+    # Cut points at station boundaries nearest to equal row shares
+    targets = np.linspace(0, len(codes), workers + 1)[1:-1]
+    cuts = np.unique(np.searchsorted(ends, targets, side="left") + 1)
+    cuts = cuts[(cuts > 0) & (cuts < len(starts))]
+    groups = np.split(np.arange(len(starts)), cuts)
+
+    tasks = []
+    for group in groups:
+        if not len(group):
+            continue
+        lo, hi = starts[group[0]], ends[group[-1]]
+        bounds = [(a - lo, b - lo) for a, b in zip(starts[group], ends[group])]
+        tasks.append((values[lo:hi], times[lo:hi], bounds, spec))
+
+    if len(tasks) > 1:
+        with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="features") as pool:
+            results = list(pool.map(_partition_features, tasks))
+    else:
+        results = [_partition_features(task) for task in tasks]
+
+    X = np.concatenate([r[0] for r in results]) if results else np.empty((0, len(spec.names)))
+    y = np.concatenate([r[1] for r in results]) if results else np.empty(0)
+    target_times = np.concatenate([r[2] for r in results]) if results else np.empty(0, dtype="datetime64[ns]")
+    lengths = [n for r in results for n in r[3]]
+
+    categories = stations.cat.categories
+    frame = pd.DataFrame(X, columns=spec.names)
+    frame.insert(0, "StationId", pd.Categorical.from_codes(np.repeat(station_codes, lengths), categories))
+    frame.insert(1, "Datetime", target_times)
+    frame["AQI"] = y
+    return frame
@@ -0,0 +1,247 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from app.features import FeatureSpec, build_features
+from app.metrics import stage, inference_batch_size
+from app.model_registry import model_registry
+from app.shadow import shadow_scorer
+
+# ==============================
+# Forecast Settings
+# ==============================
+# Features come from the active model (app/features.py); a model trained with
+# more lags or rolling windows needs a longer window of readings.
+FORECAST_MAX_HORIZON = int(os.getenv("FORECAST_MAX_HORIZON", "24"))
+FORECAST_DEFAULT_HORIZONS = (1, 3, 6, 12, 24)
+# Spacing of forecast steps; also what the training rows are (hourly data)
+FORECAST_STEP = np.timedelta64(1, "h")
+
+
+# ==============================
+# Lag Windows
+# ==============================
+def fetch_lag_windows(conn, sensor_ids, window):
+    """
+    Last `window` AQI values (oldest first) and the latest timestamp for
+    every sensor, or only sensor_ids, in a single query.
+    """
+    cursor = conn.cursor()
+
+    # One LATERAL index scan per sensor on idx_readings_sensor_time instead of
+    # ranking every row in sensor_readings
+    where = "WHERE sl.sensor_id = ANY(%s)" if sensor_ids is not None else ""
+    params = [window] + ([list(sensor_ids)] if sensor_ids is not None else [])
+
+    cursor.execute(f"""
+        SELECT sl.sensor_id, w.last_timestamp, w.aqi_values
+        FROM sensor_latest sl
+        CROSS JOIN LATERAL (
+            SELECT MAX(t.timestamp) AS last_timestamp,
+                   array_agg(t.predicted_aqi ORDER BY t.timestamp) AS aqi_values
+            FROM (
+                SELECT sr.timestamp, sr.predicted_aqi
+                FROM sensor_readings sr
+                WHERE sr.sensor_id = sl.sensor_id
+                ORDER BY sr.timestamp DESC
+                LIMIT %s
+            ) t
+        ) w
+        {where}
+    """, params)
+
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+def recursive_forecast(model, history, steps, spec, last_times):
+    """
+    history: (n_sensors, spec.window) array, newest value last.
+    last_times: timestamp of each sensor's newest value.
+    Returns (n_sensors, steps) forecasts; each step feeds its prediction
+    back in as lag 1 and is one vectorized predict over all sensors.
+    """
+    window = np.asarray(history, dtype=float)
+    last_times = np.asarray(last_times, dtype="datetime64[ns]")
+    out = np.empty((window.shape[0], steps))
+
+    for step in range(steps):
+        features = build_features(window, last_times + (step + 1) * FORECAST_STEP, spec)
+        out[:, step] = model.predict(features)
+        inference_batch_size.observe(len(features), "forecast")
+        window = np.column_stack([window[:, 1:], out[:, step]])
+
+    return out
+
+
+# ==============================
+# Shadow Scoring
+# ==============================
+def _candidate_window():
+    """Values the shadow candidate's own spec needs, or 0 if nothing is shadowed."""
+    candidate = model_registry.candidate("forecast")
+    if candidate is None or shadow_scorer.fraction <= 0:
+        return 0
+    try:
+        return FeatureSpec.for_model(candidate[1]).window
+    except ValueError:
+        return 0
+
+
+def candidate_first_step(candidate, histories, last_times, first_step):
+    """
+    (features, primary predictions) of the first forecast step for the
+    sensors whose history is long enough for the candidate's own spec; the
+    candidate may use other lags or rolling windows than the active model.
+    None if no sensor has enough history.
+    """
+    spec = FeatureSpec.for_model(candidate)
+    keep = [i for i, values in enumerate(histories) if len(values) >= spec.window]
+    if not keep:
+        return None
+    history = np.asarray([histories[i][-spec.window:] for i in keep], dtype=float)
+    return build_features(history, last_times[keep] + FORECAST_STEP, spec), first_step[keep]
+
+
+# ==============================
+# Forecast Cache
+# ==============================
+class ForecastCache:
+    """
+    Per-sensor forecast paths (1..max_horizon hours), kept until a new
+    reading for that sensor is ingested.
+
+    Writers call invalidate(sensor_ids) after a write; only those sensors
+    are recomputed on the next request. A sensor invalidated while its
+    forecast was being computed is not stored.
+    """
+
+    def __init__(self, max_horizon):
+        self.max_horizon = max_horizon
+
+        self._lock = threading.Lock()
+        self._entries = {}  # sensor_id -> (as_of, np.ndarray path)
+        self._short = set()  # sensors with fewer readings than the model's window
+        self._stale = set()  # invalidated since the last full load
+        self._versions = {}
+        self._epoch = 0
+        self._complete = False  # entries + _short cover every sensor
+
+        self._sensor_hits = 0
+        self._sensors_computed = 0
+        self._invalidations = 0
+        self._last_compute_ms = 0.0
+
+    def invalidate(self, sensor_ids=None):
+        """Drop cached paths for sensor_ids, or everything if None."""
+        with self._lock:
+            self._invalidations += 1
+
+            if sensor_ids is None:
+                self._entries.clear()
+                self._short.clear()
+                self._stale.clear()
+                self._epoch += 1
+                self._complete = False
+                return
+
+            for sensor_id in sensor_ids:
+                self._entries.pop(sensor_id, None)
+                self._versions[sensor_id] = self._versions.get(sensor_id, 0) + 1
+                self._stale.add(sensor_id)
+
+    def get_paths(self, model, run_query, sensor_ids=None):
+        """
+        Returns ({sensor_id: (as_of, path)}, [sensor_ids without enough data]).
+        run_query(fn, *args) runs fn(conn, *args) on a pooled connection.
+        """
+        with self._lock:
+            if sensor_ids is None:
+                cached = dict(self._entries)
+                to_load = list(self._stale) if self._complete else None
+                short = set(self._short) - self._stale
+            else:
+                cached = {s: self._entries[s] for s in sensor_ids if s in self._entries}
+                short = {s for s in sensor_ids if s in self._short and s not in self._stale}
+                to_load = [s for s in sensor_ids if s not in cached and s not in short]
+
+            epoch = self._epoch
+            versions = dict(self._versions)
+            self._sensor_hits += len(cached)
+
+        if to_load == []:
+            return cached, sorted(short)
+
+        # Model swaps invalidate the cache, so cached paths match this spec
+        spec = FeatureSpec.for_model(model)
+        window = spec.window
+
+        start = time.perf_counter()
+        with stage("db_query"):
+            # Enough history for a shadow candidate with a longer window too
+            rows = run_query(fetch_lag_windows, to_load, max(window, _candidate_window()))
+
+        ready = [r for r in rows if r[2] is not None and len(r[2]) >= window]
+        loaded_short = {r[0] for r in rows if r[2] is None or len(r[2]) < window}
+        if to_load is not None:
+            # Asked for but no readings at all
+            loaded_short |= set(to_load) - {r[0] for r in rows}
+
+        computed = {}
+        if ready:
+            history = np.asarray([r[2][-window:] for r in ready], dtype=float)
+            last_times = np.asarray([r[1] for r in ready], dtype="datetime64[ns]")
+            predict_start = time.perf_counter()
+            with stage("inference"):
+                paths = recursive_forecast(model, history, self.max_horizon, spec, last_times)
+            step_ms = (time.perf_counter() - predict_start) * 1000 / self.max_horizon
+            computed = {r[0]: (r[1], paths[i]) for i, r in enumerate(ready)}
+
+            # Shadow-score the first step, the only one fed by real readings,
+            # with features built from the candidate's own spec
+            histories = [r[2] for r in ready]
+            first_step = paths[:, 0]
+            shadow_scorer.maybe_submit(
+                "forecast",
+                lambda candidate: candidate_first_step(candidate, histories, last_times, first_step),
+                None, step_ms,
+            )
+
+        with self._lock:
+            if self._epoch == epoch:
+                for sensor_id in list(computed) + list(loaded_short):
+                    if self._versions.get(sensor_id) != versions.get(sensor_id):
+                        continue
+                    if sensor_id in computed:
+                        self._entries[sensor_id] = computed[sensor_id]
+                        self._short.discard(sensor_id)
+                    else:
+                        self._short.add(sensor_id)
+                    self._stale.discard(sensor_id)
+                if to_load is None:
+                    self._complete = True
+
+            self._sensors_computed += len(computed)
+            self._last_compute_ms = (time.perf_counter() - start) * 1000
+
+        cached.update(computed)
+        return cached, sorted(short | loaded_short)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "stale": len(self._stale),
+                "complete": self._complete,
+                "max_horizon_h": self.max_horizon,
+                "sensor_hits": self._sensor_hits,
+                "sensors_computed": self._sensors_computed,
+                "invalidations": self._invalidations,
+                "last_compute_ms": round(self._last_compute_ms, 3),
+            }
+
+
+forecast_cache = ForecastCache(FORECAST_MAX_HORIZON)
@@ -0,0 +1,357 @@
+import base64
+import json
+import math
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# ==============================
+# History Range Settings
+# ==============================
+# /history returns at most this many points per response, however long the
+# range: buckets are widened, LTTB keeps this many readings and raw pages
+# hold at most HISTORY_PAGE_MAX rows.
+HISTORY_DEFAULT_POINTS = int(os.getenv("HISTORY_DEFAULT_POINTS", "500"))
+HISTORY_MAX_POINTS = int(os.getenv("HISTORY_MAX_POINTS", "2000"))
+HISTORY_DEFAULT_PAGE = 1000
+HISTORY_PAGE_MAX = int(os.getenv("HISTORY_PAGE_MAX", "5000"))
+HISTORY_DEFAULT_RANGE = timedelta(hours=24)
+# LTTB reads raw readings for ranges up to this long and hourly averages
+# beyond it; raw reads stop after HISTORY_LTTB_MAX_ROWS rows
+HISTORY_LTTB_RAW_MAX_HOURS = float(os.getenv("HISTORY_LTTB_RAW_MAX_HOURS", "168"))
+HISTORY_LTTB_MAX_ROWS = int(os.getenv("HISTORY_LTTB_MAX_ROWS", "200000"))
+# raw and lttb bounds snap to this grid (bucketed ranges snap to the bucket
+# width) so repeated loads of a sliding range share one cache key
+HISTORY_ALIGN_SECONDS = float(os.getenv("HISTORY_ALIGN_SECONDS", "15"))
+
+# Bucket widths /history may use, in seconds. Multiples of an hour read the
+# hourly rollup and multiples of a day the daily rollup, for every bucket
+# the rollups already cover; raw readings fill in the rest.
+BUCKET_WIDTHS = {
+    "1m": 60,
+    "5m": 300,
+    "15m": 900,
+    "1h": 3600,
+    "6h": 6 * 3600,
+    "1d": 86400,
+    "7d": 7 * 86400,
+    "30d": 30 * 86400,
+}
+RESOLUTIONS = ("auto", "raw", "lttb") + tuple(BUCKET_WIDTHS)
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class HistoryRequestError(ValueError):
+    """A /history request that cannot be answered within the response bounds."""
+
+
+# ==============================
+# Ranges and Cursors
+# ==============================
+def to_local(value):
+    """Readings are stored as local TIMESTAMPs; convert aware datetimes to match."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def align(value, width, up=False):
+    seconds = (value - _EPOCH).total_seconds()
+    rounded = (math.ceil if up else math.floor)(seconds / width) * width
+    return _EPOCH + timedelta(seconds=rounded)
+
+
+def auto_width(start, end, points):
+    """Narrowest bucket width that covers start..end in at most `points` buckets."""
+    span = (end - start).total_seconds()
+    for name, width in BUCKET_WIDTHS.items():
+        if span / width <= points:
+            return name
+    return name
+
+
+def resolve_range(start, end, resolution="auto", points=HISTORY_DEFAULT_POINTS):
+    """
+    (start, end, resolution) as the query will run them: bounds aligned to
+    the bucket width, or to HISTORY_ALIGN_SECONDS for raw and lttb, and auto
+    replaced by the width it picks.
+    """
+    if start >= end:
+        raise HistoryRequestError("from must be before to")
+    if resolution in ("raw", "lttb"):
+        return align(start, HISTORY_ALIGN_SECONDS), align(end, HISTORY_ALIGN_SECONDS, up=True), resolution
+
+    name = auto_width(start, end, points) if resolution == "auto" else resolution
+    width = BUCKET_WIDTHS[name]
+    return align(start, width), align(end, width, up=True), name
+
+
+def encode_cursor(timestamp, reading_id):
+    raw = json.dumps([timestamp.isoformat(), reading_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, reading_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(reading_id)
+    except (ValueError, TypeError):
+        raise HistoryRequestError("Invalid cursor")
+
+
+def _series_filter(sensor_id, region_id, raw):
+    """WHERE clause (and params) limiting readings or rollup rows to a sensor or region."""
+    if sensor_id is not None:
+        return "sensor_id = %s", [sensor_id]
+    if region_id is not None:
+        if raw:
+            return "sensor_id IN (SELECT id FROM sensors WHERE region_id = %s)", [region_id]
+        return "region_id = %s", [region_id]
+    return "TRUE", []
+
+
+def _watermark(name):
+    return f"COALESCE((SELECT computed_until FROM rollup_watermarks WHERE name = '{name}'), '-infinity'::timestamp)"
+
+
+# ==============================
+# Bucketed Series
+# ==============================
+def bucket_query(start, end, width, sensor_id=None, region_id=None):
+    """
+    Averages per `width`-second bucket over [start, end), each weighted by
+    how many readings had that value (NULLs carry no weight). Closed
+    buckets come from the widest rollup that holds them; whatever the
+    rollups have not absorbed yet comes from raw readings.
+    """
+    rollup_where, rollup_params = _series_filter(sensor_id, region_id, raw=False)
+    raw_where, raw_params = _series_filter(sensor_id, region_id, raw=True)
+
+    def rollup(table, lower, upper):
+        bounds = "".join(f" AND bucket {op} {wm}" for op, wm in ((">=", lower), ("<", upper)) if wm)
+        return f"""
+            SELECT bucket AS t, reading_count AS n,
+                   aqi_avg * aqi_count AS aqi_sum, aqi_count AS aqi_n, aqi_min, aqi_max,
+                   pm25_avg * pm25_count AS pm25_sum, pm25_count AS pm25_n,
+                   pm10_avg * pm10_count AS pm10_sum, pm10_count AS pm10_n
+            FROM {table}
+            WHERE {rollup_where} AND bucket >= %s AND bucket < %s{bounds}
+        """, rollup_params + [start, end]
+
+    def raw(lower):
+        bounds = f" AND timestamp >= {lower}" if lower else ""
+        return f"""
+            SELECT timestamp AS t, 1 AS n,
+                   predicted_aqi AS aqi_sum, (predicted_aqi IS NOT NULL)::int AS aqi_n,
+                   predicted_aqi AS aqi_min, predicted_aqi AS aqi_max,
+                   pm25 AS pm25_sum, (pm25 IS NOT NULL)::int AS pm25_n,
+                   pm10 AS pm10_sum, (pm10 IS NOT NULL)::int AS pm10_n
+            FROM sensor_readings
+            WHERE {raw_where} AND timestamp >= %s AND timestamp < %s{bounds}
+        """, raw_params + [start, end]
+
+    hourly, daily = _watermark("hourly"), _watermark("daily")
+    if width % 86400 == 0:
+        parts = [rollup("sensor_readings_daily", None, daily),
+                 rollup("sensor_readings_hourly", daily, hourly),
+                 raw(hourly)]
+    elif width % 3600 == 0:
+        parts = [rollup("sensor_readings_hourly", None, hourly), raw(hourly)]
+    else:
+        parts = [raw(None)]
+
+    params = [p for _, part_params in parts for p in part_params]
+    sql = f"""
+        SELECT to_timestamp(floor(extract(epoch FROM t) / {width}) * {width}) AT TIME ZONE 'UTC' AS bucket,
+               SUM(aqi_sum) / NULLIF(SUM(aqi_n), 0),
+               MIN(aqi_min),
+               MAX(aqi_max),
+               SUM(pm25_sum) / NULLIF(SUM(pm25_n), 0),
+               SUM(pm10_sum) / NULLIF(SUM(pm10_n), 0),
+               SUM(n)
+        FROM ({" UNION ALL ".join(part_sql for part_sql, _ in parts)}) src
+        GROUP BY 1
+        ORDER BY 1;
+    """
+
+    def shape(rows):
+        return [
+            {
+                "timestamp": r[0],
+                "aqi": r[1],
+                "aqi_min": r[2],
+                "aqi_max": r[3],
+                "pm25": r[4],
+                "pm10": r[5],
+                "readings": int(r[6]),
+            }
+            for r in rows
+        ]
+
+    return sql, params, shape
+
+
+# ==============================
+# Raw Pages (keyset)
+# ==============================
+def raw_page_query(start, end, limit, cursor=None, sensor_id=None, region_id=None):
+    """
+    One page of raw readings in (timestamp, id) order. The cursor is the
+    last row of the previous page, so each page is an index range scan from
+    there instead of an OFFSET that rereads every earlier row.
+    """
+    where, params = _series_filter(sensor_id, region_id, raw=True)
+    params += [start, end]
+    after = ""
+    if cursor is not None:
+        after = " AND (timestamp, id) > (%s, %s)"
+        params += list(decode_cursor(cursor))
+
+    sql = f"""
+        SELECT id, sensor_id, timestamp, predicted_aqi, category, pm25, pm10, no2, co, so2, o3, nh3
+        FROM sensor_readings
+        WHERE {where} AND timestamp >= %s AND timestamp < %s{after}
+        ORDER BY timestamp, id
+        LIMIT %s;
+    """
+    # One extra row says whether there is another page
+    params.append(limit + 1)
+
+    def shape(rows):
+        page = rows[:limit]
+        return {
+            "points": [
+                {
+                    "sensor_id": r[1],
+                    "timestamp": r[2],
+                    "aqi": r[3],
+                    "category": r[4],
+                    "PM2_5": r[5],
+                    "PM10": r[6],
+                    "NO2": r[7],
+                    "CO": r[8],
+                    "SO2": r[9],
+                    "O3": r[10],
+                    "NH3": r[11],
+                }
+                for r in page
+            ],
+            "next_cursor": encode_cursor(page[-1][2], page[-1][0]) if len(rows) > limit else None,
+        }
+
+    return sql, params, shape
+
+
+# ==============================
+# LTTB Downsampling
+# ==============================
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: indices of `threshold` points of (x, y)
+    (x ascending) that keep the shape of the series, peaks included. The
+    first and last points are always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Bucket i (1 .. threshold-2) covers points edges[i-1]:edges[i]; the
+    # first and last points are buckets of their own
+    every = (n - 2) / (threshold - 2)
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    starts, ends = edges[:-1], edges[1:]
+    # Mean of each bucket (the "next bucket" average), plus the last point
+    counts = ends - starts
+    mean_x = np.append(np.add.reduceat(x[:-1], starts) / counts, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:-1], starts) / counts, y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = starts[i], ends[i]
+        nx, ny = mean_x[i + 1], mean_y[i + 1]
+        area = np.abs((x[a] - nx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ny - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def lttb_query(start, end, points, sensor_id):
+    """
+    One sensor's AQI series between start and end reduced to `points`
+    readings with LTTB: raw readings for short ranges, hourly averages for
+    ranges past HISTORY_LTTB_RAW_MAX_HOURS.
+    """
+    if (end - start).total_seconds() > HISTORY_LTTB_RAW_MAX_HOURS * 3600:
+        sql, params, shape_buckets = bucket_query(start, end, BUCKET_WIDTHS["1h"], sensor_id=sensor_id)
+
+        def shape(rows):
+            series = [p for p in shape_buckets(rows) if p["aqi"] is not None]
+            return {"source": "1h", "truncated": False, "points": _downsample(series, points)}
+
+        return sql, params, shape
+
+    sql = """
+        SELECT timestamp, predicted_aqi, pm25, pm10
+        FROM sensor_readings
+        WHERE sensor_id = %s AND timestamp >= %s AND timestamp < %s AND predicted_aqi IS NOT NULL
+        ORDER BY timestamp
+        LIMIT %s;
+    """
+
+    def shape(rows):
+        truncated = len(rows) > HISTORY_LTTB_MAX_ROWS
+        series = [
+            {"timestamp": r[0], "aqi": r[1], "pm25": r[2], "pm10": r[3]}
+            for r in rows[:HISTORY_LTTB_MAX_ROWS]
+        ]
+        return {"source": "raw", "truncated": truncated, "points": _downsample(series, points)}
+
+    return sql, [sensor_id, start, end, HISTORY_LTTB_MAX_ROWS + 1], shape
+
+
+def _downsample(series, points):
+    if len(series) <= points:
+        return series
+    x = np.array([p["timestamp"] for p in series], dtype="datetime64[us]").astype(np.int64)
+    y = np.array([p["aqi"] for p in series], dtype=np.float64)
+    return [series[i] for i in lttb(x, y, points)]
+
+
+# ==============================
+# /history
+# ==============================
+def range_query(start, end, sensor_id=None, region_id=None, resolution="auto",
+                points=HISTORY_DEFAULT_POINTS, limit=HISTORY_DEFAULT_PAGE, cursor=None):
+    """(sql, params, shape) for one /history response; shape returns the whole body."""
+    start, end, resolution = resolve_range(start, end, resolution, points)
+    base = {"from": start, "to": end, "sensor_id": sensor_id, "region_id": region_id, "resolution": resolution}
+
+    if resolution == "raw":
+        sql, params, shape_page = raw_page_query(start, end, limit, cursor, sensor_id, region_id)
+        return sql, params, lambda rows: base | shape_page(rows)
+
+    if resolution == "lttb":
+        if sensor_id is None:
+            raise HistoryRequestError("resolution=lttb needs a sensor_id")
+        sql, params, shape_series = lttb_query(start, end, points, sensor_id)
+        return sql, params, lambda rows: base | shape_series(rows)
+
+    width = BUCKET_WIDTHS[resolution]
+    buckets = (end - start).total_seconds() / width
+    if buckets > HISTORY_MAX_POINTS:
+        raise HistoryRequestError(
+            f"{resolution} buckets over this range would be {buckets:.0f} points (max {HISTORY_MAX_POINTS}); "
+            "use a coarser resolution or auto"
+        )
+
+    sql, params, shape_buckets = bucket_query(start, end, width, sensor_id, region_id)
+    base["bucket_seconds"] = width
+    return sql, params, lambda rows: base | {"points": shape_buckets(rows)}
@@ -0,0 +1,312 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.metrics import inference_batch_size, inference_queue_delay
+from app.model_registry import model_registry, ModelNotFoundError
+from app.aqi_index import sub_index_model, SUB_INDEX_MODEL_NAME
+
+# ==============================
+# Inference Executor Settings
+# ==============================
+# Dedicated threads for CatBoost predict, separate from the threadpool that
+# runs sync routes, so inference never waits behind blocking DB calls and
+# never runs on the event loop.
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", str(min(4, os.cpu_count() or 1))))
+# Coalesce concurrent single-row predicts (the /predict hot path) into one call
+INFERENCE_BATCHING = os.getenv("INFERENCE_BATCHING", "true").lower() == "true"
+# Longest a row waits for others while every inference thread is busy
+INFERENCE_BATCH_WAIT_MS = float(os.getenv("INFERENCE_BATCH_WAIT_MS", "2"))
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "64"))
+
+# ==============================
+# Fast Model Settings
+# ==============================
+# "off": always the full model; "auto": the reduced-cost model while over
+# the latency budget or load threshold; "always": the reduced-cost model
+FAST_MODEL_MODE = os.getenv("FAST_MODEL_MODE", "off")
+# p95 of recent inference latency (queue wait + predict) that triggers it
+FAST_MODEL_LATENCY_BUDGET_MS = float(os.getenv("FAST_MODEL_LATENCY_BUDGET_MS", "25"))
+# Predict calls queued or running that trigger it (0 disables this check)
+FAST_MODEL_LOAD_THRESHOLD = int(os.getenv("FAST_MODEL_LOAD_THRESHOLD", str(INFERENCE_THREADS * 2)))
+# Minimum seconds on the fast model once switched, so it does not flap
+FAST_MODEL_HOLD_S = float(os.getenv("FAST_MODEL_HOLD_S", "5"))
+FAST_MODEL_MODES = ("off", "auto", "always")
+
+# What the AQI model falls back to: "aqi_fast" (the distilled model from
+# scripts/train_prediction_model.py) or "cpcb" (the sub-index formula in
+# app/aqi_index.py, no model at all)
+FAST_MODEL_VARIANT = os.getenv("FAST_MODEL_VARIANT", "aqi_fast")
+
+# Full model -> its reduced-cost variant
+FAST_MODELS = {"aqi": FAST_MODEL_VARIANT}
+
+LATENCY_WINDOW = 200
+# Recompute the p95 every this many calls rather than on every one
+P95_EVERY = 16
+
+
+def _variant_available(name):
+    return name == SUB_INDEX_MODEL_NAME or model_registry.available(name)
+
+
+def _get_model(name):
+    if name == SUB_INDEX_MODEL_NAME:
+        return sub_index_model
+    return model_registry.get(name)
+
+
+class LatencyGovernor:
+    """
+    Picks the full or the reduced-cost model for each predict call.
+
+    In "auto" mode the fast model is used while the p95 of the last
+    LATENCY_WINDOW calls is over the budget or too many calls are waiting,
+    and for at least hold_s after that. Falls back to the full model when
+    no fast model has been trained or published.
+    """
+
+    def __init__(self, mode, budget_ms, load_threshold, hold_s):
+        if mode not in FAST_MODEL_MODES:
+            raise ValueError(f"FAST_MODEL_MODE must be one of {FAST_MODEL_MODES}")
+        self.mode = mode
+        self.budget_ms = budget_ms
+        self.load_threshold = load_threshold
+        self.hold_s = hold_s
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._p95_ms = 0.0
+        self._fast_until = 0.0
+        self._switches = 0
+        self._served = {}
+
+    def route(self, name, in_flight):
+        fast = FAST_MODELS.get(name)
+        if self.mode == "off" or fast is None:
+            return name
+        if not _variant_available(fast):
+            return name
+        if self.mode == "always":
+            return fast
+
+        now = time.monotonic()
+        if now < self._fast_until:
+            return fast
+        over_load = self.load_threshold > 0 and in_flight > self.load_threshold
+        if over_load or self._p95_ms > self.budget_ms:
+            with self._lock:
+                self._fast_until = now + self.hold_s
+                self._switches += 1
+            return fast
+        return name
+
+    def observe(self, name, latency_ms):
+        with self._lock:
+            self._served[name] = self._served.get(name, 0) + 1
+            self._latencies.append(latency_ms)
+            if len(self._latencies) % P95_EVERY == 0 or len(self._latencies) == LATENCY_WINDOW:
+                self._p95_ms = float(np.percentile(self._latencies, 95))
+
+    def stats(self):
+        available = any(_variant_available(f) for f in FAST_MODELS.values())
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "latency_budget_ms": self.budget_ms,
+                "load_threshold": self.load_threshold,
+                "latency_p95_ms": round(self._p95_ms, 3),
+                "fast_available": int(available),
+                "fast_active": int(available and (self.mode == "always" or time.monotonic() < self._fast_until)),
+                "switches_to_fast": self._switches,
+                "served": dict(self._served),
+            }
+
+
+latency_governor = LatencyGovernor(
+    FAST_MODEL_MODE, FAST_MODEL_LATENCY_BUDGET_MS, FAST_MODEL_LOAD_THRESHOLD, FAST_MODEL_HOLD_S
+)
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.rows = []
+        self.futures = []
+        self.submitted = []
+        self.timer = None
+
+
+class InferenceExecutor:
+    """
+    Runs model predicts on dedicated threads.
+
+    With batching on, concurrent single-row calls for the same model are
+    coalesced into one vectorized predict. A row goes straight to a free
+    thread; while every thread is busy, rows wait until one frees up, up to
+    max_wait_ms, or until max_batch rows are waiting, and then run together.
+    A lone request therefore never waits for the timer.
+    """
+
+    def __init__(self, threads, batching=INFERENCE_BATCHING, max_wait_ms=INFERENCE_BATCH_WAIT_MS,
+                 max_batch=INFERENCE_MAX_BATCH):
+        self.threads = threads
+        self.batching = batching
+        self.max_wait_ms = max_wait_ms
+        self.max_batch = max_batch
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="inference")
+        # (name, served) -> _PendingBatch; only touched on the event loop
+        self._pending = {}
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._calls = 0
+        self._rows = 0
+        self._queue_ms_total = 0.0
+        self._predict_ms_total = 0.0
+        self._predict_ms_max = 0.0
+        self._coalesced_calls = 0
+        self._coalesced_rows = 0
+        self._coalesced_max = 0
+        self._flushes = {"idle": 0, "full": 0, "timer": 0, "freed": 0}
+
+    def _predict(self, name, served, features, submitted):
+        try:
+            started = time.perf_counter()
+            try:
+                model = _get_model(served)
+            except ModelNotFoundError:
+                # The fast variant turned out not to exist; route() stops picking it
+                served = name
+                model = model_registry.get(name)
+            predictions = model.predict(features)
+            finished = time.perf_counter()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        # submitted: one perf_counter() per row waiting on this call
+        queue_ms = [(started - t) * 1000 for t in submitted]
+        inference_batch_size.observe(len(features), served)
+        for delay in queue_ms:
+            inference_queue_delay.observe(delay / 1000, served)
+        latency_governor.observe(served, (finished - submitted[0]) * 1000)
+        with self._lock:
+            self._calls += 1
+            self._rows += len(features)
+            self._queue_ms_total += sum(queue_ms) / len(queue_ms)
+            self._predict_ms_total += (finished - started) * 1000
+            self._predict_ms_max = max(self._predict_ms_max, (finished - started) * 1000)
+
+        return predictions, (finished - started) * 1000, served
+
+    def _submit(self, loop, name, served, features, submitted):
+        with self._lock:
+            self._in_flight += 1
+        return loop.run_in_executor(self._executor, self._predict, name, served, features, submitted)
+
+    async def predict(self, name, features):
+        """
+        Returns (predictions, predict_ms, served) without blocking the event
+        loop; served is the model that ran (`name` or its fast variant).
+        """
+        served = latency_governor.route(name, self._in_flight)
+        loop = asyncio.get_running_loop()
+
+        if self.batching and len(features) == 1:
+            return await self._coalesce(loop, name, served, features)
+        return await self._submit(loop, name, served, features, [time.perf_counter()])
+
+    # ------------------------------
+    # Micro-batching
+    # ------------------------------
+    async def _coalesce(self, loop, name, served, features):
+        key = (name, served)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _PendingBatch()
+        future = loop.create_future()
+        batch.rows.append(features[0])
+        batch.futures.append(future)
+        batch.submitted.append(time.perf_counter())
+
+        if len(batch.rows) >= self.max_batch:
+            self._flush(loop, key, "full")
+        elif self._in_flight < self.threads:
+            self._flush(loop, key, "idle")
+        elif batch.timer is None:
+            batch.timer = loop.call_later(self.max_wait_ms / 1000, self._flush, loop, key, "timer")
+
+        return await future
+
+    def _flush(self, loop, key, reason):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+
+        with self._lock:
+            self._flushes[reason] += 1
+            if len(batch.rows) > 1:
+                self._coalesced_calls += 1
+                self._coalesced_rows += len(batch.rows)
+                self._coalesced_max = max(self._coalesced_max, len(batch.rows))
+
+        name, served = key
+        call = self._submit(loop, name, served, np.stack(batch.rows), batch.submitted)
+        call.add_done_callback(lambda done: self._deliver(loop, batch, done))
+
+    def _deliver(self, loop, batch, done):
+        # Runs on the event loop
+        if done.cancelled():
+            error = asyncio.CancelledError()
+        else:
+            error = done.exception()
+
+        if error is not None:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(error)
+        else:
+            predictions, predict_ms, served = done.result()
+            for i, future in enumerate(batch.futures):
+                # A caller may have gone away (client disconnect)
+                if not future.done():
+                    future.set_result((predictions[i:i + 1], predict_ms, served))
+
+        # A thread just freed up: send whatever gathered meanwhile
+        for key in list(self._pending):
+            if self._in_flight >= self.threads:
+                break
+            self._flush(loop, key, "freed")
+
+    def stats(self):
+        with self._lock:
+            calls = self._calls
+            coalesced = self._coalesced_calls
+            return {
+                "threads": self.threads,
+                "in_flight": self._in_flight,
+                "calls": calls,
+                "rows": self._rows,
+                "queue_wait_avg_ms": round(self._queue_ms_total / calls, 3) if calls else 0.0,
+                "predict_avg_ms": round(self._predict_ms_total / calls, 3) if calls else 0.0,
+                "predict_max_ms": round(self._predict_ms_max, 3),
+                "batching": self.batching,
+                "batch_wait_ms": self.max_wait_ms,
+                "max_batch": self.max_batch,
+                "pending_rows": sum(len(b.rows) for b in list(self._pending.values())),
+                "coalesced_calls": coalesced,
+                "coalesced_rows": self._coalesced_rows,
+                "coalesced_avg_rows": round(self._coalesced_rows / coalesced, 2) if coalesced else 0.0,
+                "coalesced_max_rows": self._coalesced_max,
+                "flushes": dict(self._flushes),
+            }
+
+
+inference_executor = InferenceExecutor(INFERENCE_THREADS)
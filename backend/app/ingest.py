@@ -0,0 +1,241 @@
+import io
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from app.cache import response_cache
+from app.db import db_pool
+from app.metrics import stage
+from app.forecast import forecast_cache
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Ingestion Settings
+# ==============================
+# "sync": /predict commits its INSERT before responding (default)
+# "buffered": rows are queued and written behind by a background COPY writer
+INGEST_MODE = os.getenv("INGEST_MODE", "sync")
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "50000"))
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "1000"))
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "0.5"))
+INGEST_FLUSH_RETRIES = 3
+
+READING_COLUMNS = (
+    "sensor_id", "timestamp", "pm25", "pm10", "no2", "co", "so2", "o3", "nh3",
+    "predicted_aqi", "category"
+)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value)
+
+
+class WriteBehindBuffer:
+    """
+    Bounded in-process queue of sensor_readings rows, drained by one
+    background thread that COPYs a batch whenever flush_rows rows are
+    waiting or flush_interval seconds have passed.
+    """
+
+    def __init__(self, max_queue, flush_rows, flush_interval):
+        self.max_queue = max_queue
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._submit_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._stats_lock = threading.Lock()
+        self._rows_enqueued = 0
+        self._rows_written = 0
+        self._rows_rejected = 0
+        self._rows_dropped = 0
+        self._flushes = 0
+        self._flush_errors = 0
+        self._last_flush_size = 0
+        self._max_flush_size = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        """Stop the writer loop after draining everything still queued."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+        if self._thread.is_alive():
+            # Stuck on a flush (e.g. the database is down). Give up on the
+            # rows still queued so they are counted once, as dropped; the
+            # thread is kept so a later stop() can wait for its last batch.
+            remaining = 0
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                remaining += 1
+            with self._stats_lock:
+                self._rows_dropped += remaining
+            logger.warning("Ingest writer still busy after %gs; dropped %d queued readings", timeout, remaining)
+            return
+        self._thread = None
+
+    def submit(self, row):
+        self.submit_many([row])
+
+    def submit_many(self, rows):
+        """Queue rows (tuples in READING_COLUMNS order); all or nothing."""
+        with self._submit_lock:
+            # Only the writer removes items, so free space can only grow
+            # between this check and the puts below.
+            if self._queue.qsize() + len(rows) > self.max_queue:
+                with self._stats_lock:
+                    self._rows_rejected += len(rows)
+                raise QueueFullError("Ingestion queue is full, retry later")
+
+            for row in rows:
+                self._queue.put_nowait(row)
+
+        with self._stats_lock:
+            self._rows_enqueued += len(rows)
+
+    def _take_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.flush_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+            # Grab whatever else is already waiting without blocking
+            while len(batch) < self.flush_rows:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._take_batch()
+            if batch:
+                self._flush(batch)
+
+        # Shutdown: drain whatever is left
+        while True:
+            batch = []
+            while len(batch) < self.flush_rows:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                break
+            self._flush(batch)
+
+    def _copy(self, rows):
+        buf = io.StringIO()
+        for row in rows:
+            buf.write("\t".join(_copy_value(v) for v in row))
+            buf.write("\n")
+        buf.seek(0)
+
+        with db_pool.connection() as conn, stage("ingest_copy"):
+            cursor = conn.cursor()
+            cursor.copy_expert(
+                f"COPY sensor_readings ({', '.join(READING_COLUMNS)}) FROM STDIN",
+                buf
+            )
+            conn.commit()
+            cursor.close()
+
+        response_cache.invalidate("readings")
+        forecast_cache.invalidate({row[0] for row in rows})
+
+    def _flush(self, rows):
+        start = time.perf_counter()
+
+        for attempt in range(1, INGEST_FLUSH_RETRIES + 1):
+            try:
+                self._copy(rows)
+                break
+            except Exception:
+                logger.exception("Flush of %d readings failed (attempt %d)", len(rows), attempt)
+                with self._stats_lock:
+                    self._flush_errors += 1
+                if attempt == INGEST_FLUSH_RETRIES:
+                    with self._stats_lock:
+                        self._rows_dropped += len(rows)
+                    return
+                time.sleep(0.2 * attempt)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._flushes += 1
+            self._rows_written += len(rows)
+            self._last_flush_size = len(rows)
+            self._max_flush_size = max(self._max_flush_size, len(rows))
+            self._last_flush_ms = elapsed_ms
+            self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "mode": INGEST_MODE,
+                "running": self.running,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self.max_queue,
+                "rows_enqueued": self._rows_enqueued,
+                "rows_written": self._rows_written,
+                "rows_rejected": self._rows_rejected,
+                "rows_dropped": self._rows_dropped,
+                "flushes": self._flushes,
+                "flush_errors": self._flush_errors,
+                "last_flush_size": self._last_flush_size,
+                "max_flush_size": self._max_flush_size,
+                "avg_flush_size": round(self._rows_written / self._flushes, 1) if self._flushes else 0.0,
+                "last_flush_ms": round(self._last_flush_ms, 3),
+                "max_flush_ms": round(self._max_flush_ms, 3),
+                "avg_flush_ms": round(self._total_flush_ms / self._flushes, 3) if self._flushes else 0.0,
+            }
+
+
+ingest_buffer = WriteBehindBuffer(INGEST_QUEUE_SIZE, INGEST_FLUSH_ROWS, INGEST_FLUSH_INTERVAL)
+
+
+def buffered_ingest_enabled():
+    return INGEST_MODE == "buffered"
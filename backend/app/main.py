@@ -1,13 +1,77 @@
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel
-import joblib
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from psycopg2.extras import execute_values
+import json
+import time
+from datetime import datetime, timedelta
 import numpy as np
-from app.db import get_connection
+from app.db import get_db, db_pool, run_with_connection, PoolTimeoutError
+from app.adb import async_db_pool, ASYNC_DB_ENABLED
+from app.inference import inference_executor, latency_governor, FAST_MODEL_MODES
+from app.metrics import metrics, stage, MetricsMiddleware, METRICS_ENABLED
+from app.profiling import profiler, ProfilingMiddleware
+from app.cache import response_cache, CACHE_TTL
+from app.ingest import ingest_buffer, buffered_ingest_enabled, QueueFullError
+from app.storage import storage_maintainer
+from app.stream import broadcaster
+from app.forecast import forecast_cache, FORECAST_MAX_HORIZON, FORECAST_DEFAULT_HORIZONS
+from app.model_registry import model_registry, MODEL_LOAD_MODE, MODEL_FILES, ModelNotFoundError
+from app.shadow import shadow_scorer
+from app.aqi_index import get_category, get_categories, category_sql, drift_monitor, SUB_INDEX_MODEL_NAME
+from app.retrain import model_retrainer, RETRAINABLE_MODELS
+from app.spatial import (sensor_index, SPATIAL_DEFAULT_K, SPATIAL_MAX_K, SPATIAL_IDW_POWER,
+                         SPATIAL_MAX_DISTANCE_KM, SPATIAL_MAX_RESULTS)
+from app.tiles import tile_cache, TILE_FORMATS, TILE_MAX_ZOOM, TILE_MAX_AGE
+from app.history import (range_query, resolve_range, bucket_query, align, to_local, HistoryRequestError,
+                         RESOLUTIONS, BUCKET_WIDTHS,
+                         HISTORY_DEFAULT_POINTS, HISTORY_MAX_POINTS, HISTORY_DEFAULT_PAGE, HISTORY_PAGE_MAX,
+                         HISTORY_DEFAULT_RANGE)
 from app.auth import hash_password, verify_password, create_token, verify_token
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    broadcaster.attach(asyncio.get_running_loop())
+    broadcaster.schedule_sensor_region_reload()
+    if MODEL_LOAD_MODE == "eager":
+        model_registry.start_loading()
+    model_registry.start_refresher()
+    shadow_scorer.start()
+    if buffered_ingest_enabled():
+        ingest_buffer.start()
+    storage_maintainer.start()
+    model_retrainer.start()
+    tile_cache.start()
+    yield
+    tile_cache.stop()
+    model_retrainer.stop()
+    shadow_scorer.stop()
+    model_registry.stop_refresher()
+    storage_maintainer.stop()
+    # Drain queued readings before the pool goes away
+    ingest_buffer.stop()
+    await async_db_pool.close()
+    db_pool.close()
+
+
+class TimedJSONResponse(JSONResponse):
+    def render(self, content):
+        with stage("serialization"):
+            return super().render(content)
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=TimedJSONResponse)
+
+# Cached forecasts were made by the previous model
+model_registry.on_swap(lambda name, version: forecast_cache.invalidate() if name == "forecast" else None)
+# Heatmap tiles near sensors whose AQI or location changed are re-rendered
+sensor_index.on_change(tile_cache.mark)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,34 +81,72 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in; captures sampled and slow requests for /admin/profiles
+app.add_middleware(ProfilingMiddleware)
+
+# Outermost, so latency includes CORS and every other middleware
+app.add_middleware(MetricsMiddleware)
+
+# Component stats exposed as gauges on /metrics
+metrics.add_stats("aqi_db_pool", lambda: db_pool.stats())
+metrics.add_stats("aqi_async_db_pool", lambda: async_db_pool.stats())
+metrics.add_stats("aqi_inference", lambda: inference_executor.stats())
+metrics.add_stats("aqi_fast_model", lambda: latency_governor.stats())
+metrics.add_stats("aqi_drift", lambda: drift_monitor.stats())
+metrics.add_stats("aqi_ingest", lambda: ingest_buffer.stats())
+metrics.add_stats("aqi_stream", lambda: broadcaster.stats())
+metrics.add_stats("aqi_forecast_cache", lambda: forecast_cache.stats())
+metrics.add_stats("aqi_shadow", lambda: shadow_scorer.stats())
+metrics.add_stats("aqi_profiling", lambda: profiler.stats())
+metrics.add_stats("aqi_retrain", lambda: model_retrainer.stats())
+metrics.add_stats("aqi_spatial", lambda: sensor_index.stats())
+metrics.add_stats("aqi_tiles", lambda: tile_cache.stats())
+
 # ==============================
 # Security Scheme
 # ==============================
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="admin/login")
 
 
-# ==============================
-# Load Models
-# ==============================
-model = joblib.load("models/aqi_model.pkl")
-forecast_model = joblib.load("models/aqi_forecast_model.pkl")
-
 # ==============================
 # Utility Functions
 # ==============================
-def get_category(aqi):
-    if aqi <= 50:
-        return "Good"
-    elif aqi <= 100:
-        return "Satisfactory"
-    elif aqi <= 200:
-        return "Moderate"
-    elif aqi <= 300:
-        return "Poor"
-    elif aqi <= 400:
-        return "Very Poor"
-    else:
-        return "Severe"
+@app.exception_handler(PoolTimeoutError)
+def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+@app.exception_handler(ModelNotFoundError)
+def model_not_found_handler(request: Request, exc: ModelNotFoundError):
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
+
+
+@app.exception_handler(HistoryRequestError)
+def history_request_handler(request: Request, exc: HistoryRequestError):
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
+
+
+@app.exception_handler(QueueFullError)
+def queue_full_handler(request: Request, exc: QueueFullError):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+
+def reading_event(row):
+    """Shape a (sensor_id, timestamp, pm25 ... nh3, aqi, category) row like a /latest item."""
+    sensor_id, timestamp, pm25, pm10, no2, co, so2, o3, nh3, aqi, category = row
+    return {
+        "sensor_id": sensor_id,
+        "aqi": aqi,
+        "category": category,
+        "timestamp": timestamp,
+        "PM2_5": pm25,
+        "PM10": pm10,
+        "NO2": no2,
+        "CO": co,
+        "SO2": so2,
+        "O3": o3,
+        "NH3": nh3
+    }
 
 
 def get_current_admin(token: str = Depends(oauth2_scheme)):
@@ -74,6 +176,39 @@ class AQIRequest(BaseModel):
     weekday: int
 
 
+AQI_BATCH_ADAPTER = TypeAdapter(list[AQIRequest])
+MAX_BATCH_SIZE = 10000
+
+
+async def parse_batch_body(request: Request):
+    """
+    Accept either a JSON array of AQIRequest objects or NDJSON
+    (one object per line, Content-Type application/x-ndjson).
+    """
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+
+    try:
+        if "ndjson" in content_type:
+            raw = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            raw = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed request body: {e}")
+
+    if not isinstance(raw, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array or NDJSON rows")
+
+    if len(raw) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_SIZE} rows")
+
+    try:
+        with stage("validation"):
+            return AQI_BATCH_ADAPTER.validate_python(raw)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+
 # ==============================
 # Public Routes
 # ==============================
@@ -82,12 +217,27 @@ def home():
     return {"message": "AQI API Running"}
 
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    # Prometheus text exposition format
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/ready")
+def readiness():
+    # Readiness probe: in eager mode, fails until every model is loaded and warmed up
+    if MODEL_LOAD_MODE == "eager" and not model_registry.ready():
+        return JSONResponse(status_code=503, content={"ready": False, **model_registry.stats()})
+    return {"ready": True}
+
+
 # ==============================
 # Admin Authentication
 # ==============================
 @app.post("/admin/register")
-def register_admin(username: str, email: str, password: str):
-    conn = get_connection()
+def register_admin(username: str, email: str, password: str, conn=Depends(get_db)):
     cursor = conn.cursor()
 
     password_hash = hash_password(password)
@@ -102,14 +252,12 @@ def register_admin(username: str, email: str, password: str):
     conn.commit()
 
     cursor.close()
-    conn.close()
 
     return {"message": "Admin registered", "admin_id": admin_id}
 
 
 @app.post("/admin/login")
-def login_admin(form_data: OAuth2PasswordRequestForm = Depends()):
-    conn = get_connection()
+def login_admin(form_data: OAuth2PasswordRequestForm = Depends(), conn=Depends(get_db)):
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -120,7 +268,6 @@ def login_admin(form_data: OAuth2PasswordRequestForm = Depends()):
 
     admin = cursor.fetchone()
     cursor.close()
-    conn.close()
 
     if not admin:
         raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -141,40 +288,91 @@ def login_admin(form_data: OAuth2PasswordRequestForm = Depends()):
 # ==============================
 # Prediction API (Public)
 # ==============================
-@app.post("/predict")
-def predict(data: AQIRequest):
-    features = np.array([[
-        data.PM2_5, data.PM10, data.NO2, data.CO,
-        data.SO2, data.O3, data.NH3,
-        data.hour, data.day, data.month, data.weekday
-    ]])
-
-    prediction = float(model.predict(features)[0])
-    category = get_category(prediction)
+INSERT_READING_SQL = """
+    INSERT INTO sensor_readings
+    (sensor_id, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category)
+    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+"""
 
-    conn = get_connection()
+INSERT_COLUMNS = ["sensor_id", "pm25", "pm10", "no2", "co", "so2", "o3", "nh3", "predicted_aqi", "category"]
+
+
+def insert_reading(conn, values):
     cursor = conn.cursor()
+    with stage("db_query"):
+        cursor.execute(INSERT_READING_SQL, values)
+    with stage("db_commit"):
+        conn.commit()
+    cursor.close()
 
-    cursor.execute("""
-        INSERT INTO sensor_readings
-        (sensor_id, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category)
-        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-    """, (
-        data.sensor_id,
-        data.PM2_5,
-        data.PM10,
-        data.NO2,
-        data.CO,
-        data.SO2,
-        data.O3,
-        data.NH3,
-        prediction,
-        category
-    ))
 
-    conn.commit()
+def insert_readings(conn, values):
+    cursor = conn.cursor()
+
+    # One multi-row INSERT, one transaction
+    with stage("db_query"):
+        execute_values(cursor, f"""
+            INSERT INTO sensor_readings ({", ".join(INSERT_COLUMNS)})
+            VALUES %s
+        """, values, page_size=len(values))
+
+    with stage("db_commit"):
+        conn.commit()
     cursor.close()
-    conn.close()
+
+
+@app.post("/predict")
+async def predict(data: AQIRequest):
+    with stage("feature_build"):
+        features = np.array([[
+            data.PM2_5, data.PM10, data.NO2, data.CO,
+            data.SO2, data.O3, data.NH3,
+            data.hour, data.day, data.month, data.weekday
+        ]])
+
+    with stage("inference"):
+        predictions, predict_ms, served = await inference_executor.predict("aqi", features)
+    shadow_scorer.maybe_submit(served, features, predictions, predict_ms)
+    if served != SUB_INDEX_MODEL_NAME:
+        drift_monitor.maybe_observe(served, features, predictions)
+
+    prediction = float(predictions[0])
+    category = get_category(prediction)
+
+    row = (
+        data.sensor_id, datetime.now(),
+        data.PM2_5, data.PM10, data.NO2, data.CO, data.SO2, data.O3, data.NH3,
+        prediction, category
+    )
+
+    if buffered_ingest_enabled():
+        # Write-behind: respond now, the ingest writer COPYs the row later
+        ingest_buffer.submit(row)
+    else:
+        values = (
+            data.sensor_id,
+            data.PM2_5,
+            data.PM10,
+            data.NO2,
+            data.CO,
+            data.SO2,
+            data.O3,
+            data.NH3,
+            prediction,
+            category
+        )
+
+        if ASYNC_DB_ENABLED:
+            await async_db_pool.execute(INSERT_READING_SQL, *values)
+        else:
+            await run_in_threadpool(run_with_connection, insert_reading, values)
+
+        response_cache.invalidate("readings")
+        forecast_cache.invalidate([data.sensor_id])
+
+    event = reading_event(row)
+    broadcaster.publish([event])
+    sensor_index.apply_readings([event])
 
     return {
         "predicted_AQI": prediction,
@@ -182,183 +380,458 @@ def predict(data: AQIRequest):
     }
 
 
+@app.post("/predict/batch")
+async def predict_batch(rows: list[AQIRequest] = Depends(parse_batch_body)):
+    if not rows:
+        return {"count": 0, "results": [], "elapsed_ms": 0.0, "rows_per_sec": 0.0}
+
+    start = time.perf_counter()
+
+    with stage("feature_build"):
+        features = np.array([
+            [
+                r.PM2_5, r.PM10, r.NO2, r.CO,
+                r.SO2, r.O3, r.NH3,
+                r.hour, r.day, r.month, r.weekday
+            ]
+            for r in rows
+        ], dtype=np.float64)
+
+    with stage("inference"):
+        raw_predictions, predict_ms, served = await inference_executor.predict("aqi", features)
+    shadow_scorer.maybe_submit(served, features, raw_predictions, predict_ms)
+    if served != SUB_INDEX_MODEL_NAME:
+        drift_monitor.maybe_observe(served, features, raw_predictions)
+
+    predictions = raw_predictions.astype(float).tolist()
+    categories = get_categories(predictions)
+
+    now = datetime.now()
+    reading_rows = [
+        (r.sensor_id, now, r.PM2_5, r.PM10, r.NO2, r.CO, r.SO2, r.O3, r.NH3, p, c)
+        for r, p, c in zip(rows, predictions, categories)
+    ]
+
+    if buffered_ingest_enabled():
+        ingest_buffer.submit_many(reading_rows)
+    else:
+        values = [
+            (r.sensor_id, r.PM2_5, r.PM10, r.NO2, r.CO, r.SO2, r.O3, r.NH3, p, c)
+            for r, p, c in zip(rows, predictions, categories)
+        ]
+
+        if ASYNC_DB_ENABLED:
+            # Binary COPY, one round trip
+            await async_db_pool.copy_records("sensor_readings", INSERT_COLUMNS, values)
+        else:
+            await run_in_threadpool(run_with_connection, insert_readings, values)
+
+        response_cache.invalidate("readings")
+        forecast_cache.invalidate({r.sensor_id for r in rows})
+
+    events = [reading_event(row) for row in reading_rows]
+    broadcaster.publish(events)
+    sensor_index.apply_readings(events)
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        "count": len(rows),
+        "results": [
+            {"sensor_id": r.sensor_id, "predicted_AQI": p, "category": c}
+            for r, p, c in zip(rows, predictions, categories)
+        ],
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "rows_per_sec": round(len(rows) / elapsed, 1) if elapsed > 0 else None
+    }
+
+
 # ==============================
 # Public Data APIs
 # ==============================
-@app.get("/latest")
-def get_latest_aqi():
-    conn = get_connection()
+async def cached_read(key, tags, sql_query, *args):
+    """
+    Serve a public read from the response cache, loading it through asyncpg
+    on the event loop, or (ASYNC_DB=false) through the psycopg2 pool on the
+    threadpool. sql_query(*args) returns (sql, params, shape_rows).
+    """
+    ttl = CACHE_TTL[key[0]]
+
+    if ASYNC_DB_ENABLED:
+        async def load():
+            sql, params, shape = sql_query(*args)
+            return shape(await async_db_pool.fetch(sql, *params))
+
+        return await response_cache.get_or_load_async(key, ttl, load, tags=tags)
+
+    return await run_in_threadpool(
+        response_cache.get_or_load, key, ttl,
+        lambda: run_with_connection(run_sql_query, sql_query, *args), tags
+    )
+
+
+def run_sql_query(conn, sql_query, *args):
+    """Run a (sql, params, shape_rows) query on a psycopg2 connection."""
+    sql, params, shape = sql_query(*args)
     cursor = conn.cursor()
+    with stage("db_query"):
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    cursor.close()
+    return shape(rows)
 
-    cursor.execute("""
-        SELECT r.name, s.id, sr.predicted_aqi, sr.category, sr.timestamp,
-               sr.pm25, sr.pm10, sr.no2, sr.co, sr.so2, sr.o3, sr.nh3
-        FROM regions r
-        JOIN sensors s ON s.region_id = r.id
-        JOIN sensor_readings sr ON sr.sensor_id = s.id
-        WHERE sr.timestamp = (
-            SELECT MAX(timestamp)
-            FROM sensor_readings
-            WHERE sensor_id = s.id
-        )
-        ORDER BY sr.predicted_aqi DESC;
-    """)
 
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+@app.get("/latest")
+async def get_latest_aqi():
+    return await cached_read(("latest",), ("readings", "sensors"), latest_aqi_query)
 
-    return [
-        {
-            "region": r[0],
-            "sensor_id": r[1],
-            "aqi": r[2],
-            "category": r[3],
-            "timestamp": r[4],
-            "PM2_5": r[5],
-            "PM10": r[6],
-            "NO2": r[7],
-            "CO": r[8],
-            "SO2": r[9],
-            "O3": r[10],
-            "NH3": r[11]
-        }
-        for r in rows
-    ]
+
+def latest_aqi_query():
+    sql = """
+        SELECT r.name, s.id, sl.predicted_aqi, sl.category, sl.timestamp,
+               sl.pm25, sl.pm10, sl.no2, sl.co, sl.so2, sl.o3, sl.nh3
+        FROM regions r
+        JOIN sensors s ON s.region_id = r.id
+        JOIN sensor_latest sl ON sl.sensor_id = s.id
+        ORDER BY sl.predicted_aqi DESC;
+    """
+
+    def shape(rows):
+        return [
+            {
+                "region": r[0],
+                "sensor_id": r[1],
+                "aqi": r[2],
+                "category": r[3],
+                "timestamp": r[4],
+                "PM2_5": r[5],
+                "PM10": r[6],
+                "NO2": r[7],
+                "CO": r[8],
+                "SO2": r[9],
+                "O3": r[10],
+                "NH3": r[11]
+            }
+            for r in rows
+        ]
+
+    return sql, (), shape
 
 
 @app.get("/public/sensors")
-def get_public_sensors():
-    conn = get_connection()
-    cursor = conn.cursor()
+async def get_public_sensors():
+    return await cached_read(("public_sensors",), ("sensors",), public_sensors_query)
 
-    cursor.execute("""
+
+def public_sensors_query():
+    sql = """
         SELECT s.id, s.sensor_code, s.latitude, s.longitude, s.radius, r.name, s.is_active
         FROM sensors s
         JOIN regions r ON s.region_id = r.id
-    """)
-
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
-
-    return [
-        {
-            "sensor_id": r[0],
-            "sensor_code": r[1],
-            "latitude": float(r[2]) if r[2] is not None else None,
-            "longitude": float(r[3]) if r[3] is not None else None,
-            "radius": float(r[4]) if r[4] is not None else 20.0,
-            "region": r[5],
-            "is_active": r[6]
-        }
-        for r in rows
-    ]
+    """
+
+    def shape(rows):
+        return [
+            {
+                "sensor_id": r[0],
+                "sensor_code": r[1],
+                "latitude": float(r[2]) if r[2] is not None else None,
+                "longitude": float(r[3]) if r[3] is not None else None,
+                "radius": float(r[4]) if r[4] is not None else 20.0,
+                "region": r[5],
+                "is_active": r[6]
+            }
+            for r in rows
+        ]
+
+    return sql, (), shape
+
+
+# Ranges up to HISTORY_RAW_MAX_HOURS come from raw readings, longer ones
+# in hourly buckets, and anything past HISTORY_HOURLY_MAX_HOURS in daily
+# buckets (rollups up to their watermark, raw readings after it).
+HISTORY_RAW_MAX_HOURS = 1
+HISTORY_HOURLY_MAX_HOURS = 24 * 14
+HISTORY_BUCKETS = {"hour": BUCKET_WIDTHS["1h"], "day": BUCKET_WIDTHS["1d"]}
+
+
+@app.get("/history")
+async def get_history_range(
+    from_: datetime | None = Query(None, alias="from"),
+    to: datetime | None = None,
+    sensor_id: int | None = None,
+    region_id: int | None = None,
+    resolution: str = "auto",
+    points: int = HISTORY_DEFAULT_POINTS,
+    limit: int = HISTORY_DEFAULT_PAGE,
+    cursor: str | None = None
+):
+    """
+    AQI between from and to (default: the last 24 hours) for one sensor, a
+    region or every sensor. resolution=auto picks the narrowest bucket that
+    fits in `points`; a bucket width (1m ... 30d) fixes it; lttb keeps
+    `points` raw readings of one sensor; raw pages through readings with
+    `cursor`. Responses stay bounded however long the range.
+    """
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=422, detail=f"resolution must be one of {', '.join(RESOLUTIONS)}")
+    if not 3 <= points <= HISTORY_MAX_POINTS:
+        raise HTTPException(status_code=422, detail=f"points must be between 3 and {HISTORY_MAX_POINTS}")
+    if not 1 <= limit <= HISTORY_PAGE_MAX:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {HISTORY_PAGE_MAX}")
+
+    end = to_local(to) or datetime.now()
+    start = to_local(from_) or end - HISTORY_DEFAULT_RANGE
+
+    # Key on the aligned range the query will read, so a sliding window
+    # (e.g. from=now-24h in milliseconds) keeps hitting the same entry
+    start, end, resolution = resolve_range(start, end, resolution, points)
+    key = ("history", "range", start, end, sensor_id, region_id, resolution, points, limit, cursor)
+    return await cached_read(key, ("readings", "sensors"), range_query,
+                             start, end, sensor_id, region_id, resolution, points, limit, cursor)
 
 
 @app.get("/history/{region_id}")
-def get_history(region_id: int):
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT sr.timestamp, sr.predicted_aqi, sr.pm25, sr.pm10
-        FROM sensor_readings sr
-        JOIN sensors s ON s.id = sr.sensor_id
-        WHERE s.region_id = %s
-        ORDER BY sr.timestamp DESC
-        LIMIT 50;
-    """, (region_id,))
-    
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+async def get_history(region_id: int, hours: int | None = None):
+    return await cached_read(("history", region_id, hours), ("readings", "sensors"), history_query, region_id, hours)
+
+
+def history_query(region_id, hours):
+    if hours is not None and hours > HISTORY_RAW_MAX_HOURS:
+        resolution = "hour" if hours <= HISTORY_HOURLY_MAX_HOURS else "day"
+        width = HISTORY_BUCKETS[resolution]
+        now = datetime.now()
+        # Same series as /history: the newest hours the rollups have not
+        # absorbed yet come from raw readings, so they are never missing
+        sql, params, shape_buckets = bucket_query(
+            align(now - timedelta(hours=hours), width, up=True), now, width, region_id=region_id
+        )
 
-    return [
-        {
-            "timestamp": r[0],
-            "aqi": r[1],
-            "pm25": r[2] if r[2] is not None else 0,
-            "pm10": r[3] if r[3] is not None else 0
-        }
-        for r in rows
-    ]
+        def shape_rollup(rows):
+            return [
+                {
+                    "timestamp": p["timestamp"],
+                    "aqi": p["aqi"],
+                    "pm25": p["pm25"] if p["pm25"] is not None else 0,
+                    "pm10": p["pm10"] if p["pm10"] is not None else 0,
+                    "aqi_min": p["aqi_min"],
+                    "aqi_max": p["aqi_max"],
+                    "resolution": resolution
+                }
+                for p in reversed(shape_buckets(rows))
+            ]
+
+        return sql, params, shape_rollup
+
+    if hours is not None:
+        sql = """
+            SELECT sr.timestamp, sr.predicted_aqi, sr.pm25, sr.pm10
+            FROM sensor_readings sr
+            JOIN sensors s ON s.id = sr.sensor_id
+            WHERE s.region_id = %s
+              AND sr.timestamp >= LOCALTIMESTAMP - %s * interval '1 hour'
+            ORDER BY sr.timestamp DESC;
+        """
+        params = (region_id, float(hours))
+    else:
+        sql = """
+            SELECT sr.timestamp, sr.predicted_aqi, sr.pm25, sr.pm10
+            FROM sensor_readings sr
+            JOIN sensors s ON s.id = sr.sensor_id
+            WHERE s.region_id = %s
+            ORDER BY sr.timestamp DESC
+            LIMIT 50;
+        """
+        params = (region_id,)
+
+    def shape(rows):
+        return [
+            {
+                "timestamp": r[0],
+                "aqi": r[1],
+                "pm25": r[2] if r[2] is not None else 0,
+                "pm10": r[3] if r[3] is not None else 0
+            }
+            for r in rows
+        ]
+
+    return sql, params, shape
 
 
 @app.get("/top-polluted")
-def get_top_polluted():
-    conn = get_connection()
-    cursor = conn.cursor()
+async def get_top_polluted():
+    return await cached_read(("top_polluted",), ("readings", "sensors"), top_polluted_query)
 
-    cursor.execute("""
+
+def top_polluted_query():
+    sql = f"""
         SELECT 
             r.name AS region,
-            AVG(sr.predicted_aqi) AS avg_aqi,
-            CASE
-                WHEN AVG(sr.predicted_aqi) <= 50 THEN 'Good'
-                WHEN AVG(sr.predicted_aqi) <= 100 THEN 'Satisfactory'
-                WHEN AVG(sr.predicted_aqi) <= 200 THEN 'Moderate'
-                WHEN AVG(sr.predicted_aqi) <= 300 THEN 'Poor'
-                WHEN AVG(sr.predicted_aqi) <= 400 THEN 'Very Poor'
-                ELSE 'Severe'
-            END AS category
+            AVG(sl.predicted_aqi) AS avg_aqi,
+            {category_sql("AVG(sl.predicted_aqi)")} AS category
         FROM regions r
         JOIN sensors s ON s.region_id = r.id
-        JOIN sensor_readings sr ON sr.sensor_id = s.id
-        WHERE sr.timestamp = (
-            SELECT MAX(timestamp)
-            FROM sensor_readings
-            WHERE sensor_id = s.id
-        )
+        JOIN sensor_latest sl ON sl.sensor_id = s.id
         GROUP BY r.name
         ORDER BY avg_aqi DESC
         LIMIT 5;
-    """)
+    """
 
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    def shape(rows):
+        return [
+            {
+                "region": r[0],
+                "aqi": float(r[1]),
+                "category": r[2]
+            }
+            for r in rows
+        ]
 
-    return [
-        {
-            "region": r[0],
-            "aqi": float(r[1]),
-            "category": r[2]
-        }
-        for r in rows
-    ]
+    return sql, (), shape
 
 
-@app.get("/forecast/{sensor_id}")
-def forecast_aqi(sensor_id: int):
-    conn = get_connection()
-    cursor = conn.cursor()
+# ==============================
+# Spatial Queries
+# ==============================
+async def loaded_sensor_index():
+    # Only the first call reads the database; later reloads run in the background
+    if not sensor_index.loaded:
+        await run_in_threadpool(sensor_index.ensure_loaded)
+    else:
+        sensor_index.ensure_loaded()
+    return sensor_index
+
+
+@app.get("/aqi/at")
+async def get_aqi_at(lat: float, lon: float, k: int = SPATIAL_DEFAULT_K,
+                     power: float = SPATIAL_IDW_POWER, max_km: float = SPATIAL_MAX_DISTANCE_KM):
+    """
+    AQI at a point, inverse-distance-weighted from the k nearest active
+    sensors with a reading within max_km.
+    """
+    if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        raise HTTPException(status_code=422, detail="lat must be within ±90 and lon within ±180")
+    if not 1 <= k <= SPATIAL_MAX_K:
+        raise HTTPException(status_code=422, detail=f"k must be between 1 and {SPATIAL_MAX_K}")
+    if power <= 0 or max_km <= 0:
+        raise HTTPException(status_code=422, detail="power and max_km must be positive")
+
+    index = await loaded_sensor_index()
+    result = index.interpolate(lat, lon, k, power, max_km)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No sensor with a reading within {max_km:g} km")
+    return result
+
+
+@app.get("/sensors/within")
+async def get_sensors_within(bbox: str, limit: int = SPATIAL_MAX_RESULTS):
+    """Active sensors inside bbox=min_lon,min_lat,max_lon,max_lat (min_lon > max_lon crosses ±180)."""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="bbox must be min_lon,min_lat,max_lon,max_lat")
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise HTTPException(status_code=422, detail="bbox is outside ±180/±90 or has min_lat > max_lat")
+    if not 1 <= limit <= SPATIAL_MAX_RESULTS:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {SPATIAL_MAX_RESULTS}")
+
+    index = await loaded_sensor_index()
+    count, sensors = index.within(min_lon, min_lat, max_lon, max_lat, limit)
+    return {"count": count, "truncated": count > len(sensors), "sensors": sensors}
+
+
+@app.get("/tiles/aqi/{z}/{x}/{y}.{fmt}")
+def get_aqi_tile(z: int, x: int, y: int, fmt: str, request: Request):
+    """
+    Heatmap tile of the latest AQI (Web Mercator z/x/y): a 256px PNG, or a
+    TILE_GRID x TILE_GRID uint16 grid for fmt=bin. Served from the tile
+    cache with an ETag, so unchanged tiles revalidate as 304s.
+    """
+    if fmt not in TILE_FORMATS:
+        raise HTTPException(status_code=404, detail=f"Tile format must be one of {', '.join(TILE_FORMATS)}")
+    if not 0 <= z <= TILE_MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise HTTPException(status_code=404, detail="No such tile")
+
+    sensor_index.ensure_loaded()
+    body, etag = tile_cache.get(z, x, y, fmt)
+
+    headers = {"Cache-Control": f"public, max-age={TILE_MAX_AGE}", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=TILE_FORMATS[fmt], headers=headers)
 
-    cursor.execute("""
-        SELECT predicted_aqi
-        FROM sensor_readings
-        WHERE sensor_id = %s
-        ORDER BY timestamp DESC
-        LIMIT 6
-    """, (sensor_id,))
 
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+# ==============================
+# Live Stream (Server-Sent Events)
+# ==============================
+@app.get("/stream/latest")
+async def stream_latest(request: Request, region_id: list[int] | None = Query(None)):
+    """
+    Pushes a "snapshot" event (current /latest rows) and then one "reading"
+    event per newly ingested reading, optionally limited to region_id(s).
+    """
+    sub = broadcaster.subscribe(region_id)
+
+    try:
+        latest = await get_latest_aqi()
+        snapshot = await run_in_threadpool(broadcaster.filter_snapshot, sub, latest)
+    except Exception:
+        broadcaster.unsubscribe(sub)
+        raise
+
+    return StreamingResponse(
+        broadcaster.events(sub, request, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/forecast")
+def forecast_all(
+    sensor_id: list[int] | None = Query(None),
+    horizon: list[int] | None = Query(None)
+):
+    """
+    Recursive AQI forecasts for every sensor (or the sensor_id(s) given) at
+    each requested horizon in hours, computed in one query and one
+    vectorized predict per step. Paths are cached until a sensor's next reading.
+    """
+    horizons = sorted(set(horizon or FORECAST_DEFAULT_HORIZONS))
+    if horizons[0] < 1 or horizons[-1] > FORECAST_MAX_HORIZON:
+        raise HTTPException(status_code=422, detail=f"horizon must be between 1 and {FORECAST_MAX_HORIZON}")
+
+    paths, insufficient = forecast_cache.get_paths(model_registry.get("forecast"), run_with_connection, sensor_id)
+
+    steps = [h - 1 for h in horizons]
+    forecasts = []
+    for sid in sorted(paths):
+        as_of, path = paths[sid]
+        values = path[steps]
+        forecasts.append({
+            "sensor_id": sid,
+            "as_of": as_of,
+            "forecast": [
+                {"horizon_h": h, "AQI": round(float(v), 2), "category": c}
+                for h, v, c in zip(horizons, values, get_categories(values))
+            ]
+        })
 
-    if len(rows) < 6:
-        return {"error": "Not enough data"}
+    return {
+        "horizons": horizons,
+        "count": len(forecasts),
+        "forecasts": forecasts,
+        "insufficient_data": insufficient
+    }
 
-    values = [r[0] for r in rows][::-1]
 
-    features = [
-        values[-1],
-        values[-2],
-        values[-3],
-        values[-6],
-    ]
+@app.get("/forecast/{sensor_id}")
+def forecast_aqi(sensor_id: int):
+    paths, _ = forecast_cache.get_paths(model_registry.get("forecast"), run_with_connection, [sensor_id])
+
+    if sensor_id not in paths:
+        return {"error": "Not enough data"}
 
-    forecast = float(forecast_model.predict([features])[0])
+    forecast = float(paths[sensor_id][1][0])
     category = get_category(forecast)
 
     return {
@@ -368,12 +841,221 @@ def forecast_aqi(sensor_id: int):
     }
 
 
+# ==============================
+# Admin Diagnostics (Protected)
+# ==============================
+@app.get("/admin/stats/db")
+def get_db_stats(admin_id: int = Depends(get_current_admin)):
+    return db_pool.stats()
+
+
+@app.get("/admin/stats/db/async")
+def get_async_db_stats(admin_id: int = Depends(get_current_admin)):
+    return async_db_pool.stats()
+
+
+@app.get("/admin/stats/inference")
+def get_inference_stats(admin_id: int = Depends(get_current_admin)):
+    return inference_executor.stats() | {"fast_model": latency_governor.stats()}
+
+
+@app.put("/admin/inference/fast-model")
+def configure_fast_model(mode: str | None = None, budget_ms: float | None = None,
+                         load_threshold: int | None = None, admin_id: int = Depends(get_current_admin)):
+    if mode is not None and mode not in FAST_MODEL_MODES:
+        raise HTTPException(status_code=422, detail=f"mode must be one of {', '.join(FAST_MODEL_MODES)}")
+    if budget_ms is not None and budget_ms <= 0:
+        raise HTTPException(status_code=422, detail="budget_ms must be positive")
+    if load_threshold is not None and load_threshold < 0:
+        raise HTTPException(status_code=422, detail="load_threshold must be >= 0")
+
+    if mode is not None:
+        latency_governor.mode = mode
+    if budget_ms is not None:
+        latency_governor.budget_ms = budget_ms
+    if load_threshold is not None:
+        latency_governor.load_threshold = load_threshold
+    return latency_governor.stats()
+
+
+@app.get("/admin/stats/ingest")
+def get_ingest_stats(admin_id: int = Depends(get_current_admin)):
+    return ingest_buffer.stats()
+
+
+@app.get("/admin/stats/cache")
+def get_cache_stats(admin_id: int = Depends(get_current_admin)):
+    return response_cache.stats()
+
+
+@app.get("/admin/stats/models")
+def get_model_stats(admin_id: int = Depends(get_current_admin)):
+    return model_registry.stats()
+
+
+@app.get("/admin/stats/shadow")
+def get_shadow_stats(admin_id: int = Depends(get_current_admin)):
+    return shadow_scorer.stats()
+
+
+@app.get("/admin/stats/forecast")
+def get_forecast_stats(admin_id: int = Depends(get_current_admin)):
+    return forecast_cache.stats()
+
+
+@app.get("/admin/stats/stream")
+def get_stream_stats(admin_id: int = Depends(get_current_admin)):
+    return broadcaster.stats()
+
+
+@app.get("/admin/stats/storage")
+def get_storage_stats(admin_id: int = Depends(get_current_admin)):
+    return {
+        "maintenance_interval_s": storage_maintainer.interval,
+        "last_run": storage_maintainer.last_run
+    }
+
+
+@app.get("/admin/stats/profiling")
+def get_profiling_stats(admin_id: int = Depends(get_current_admin)):
+    return profiler.stats()
+
+
+@app.get("/admin/stats/drift")
+def get_drift_stats(admin_id: int = Depends(get_current_admin)):
+    return drift_monitor.stats()
+
+
+@app.get("/admin/stats/retrain")
+def get_retrain_stats(admin_id: int = Depends(get_current_admin)):
+    return model_retrainer.stats()
+
+
+@app.get("/admin/stats/spatial")
+def get_spatial_stats(admin_id: int = Depends(get_current_admin)):
+    return sensor_index.stats() | {"tiles": tile_cache.stats()}
+
+
+# ==============================
+# Request Profiling (Protected)
+# ==============================
+@app.put("/admin/profiling")
+def configure_profiling(enabled: bool | None = None, sample_rate: float | None = None,
+                        slow_ms: float | None = None, admin_id: int = Depends(get_current_admin)):
+    if sample_rate is not None and not 0 <= sample_rate <= 1:
+        raise HTTPException(status_code=422, detail="sample_rate must be between 0 and 1")
+    if slow_ms is not None and slow_ms <= 0:
+        raise HTTPException(status_code=422, detail="slow_ms must be positive")
+
+    if enabled is not None:
+        profiler.enabled = enabled
+    if sample_rate is not None:
+        profiler.sample_rate = sample_rate
+    if slow_ms is not None:
+        profiler.slow_ms = slow_ms
+    return {"enabled": profiler.enabled, "sample_rate": profiler.sample_rate, "slow_ms": profiler.slow_ms}
+
+
+@app.get("/admin/profiles")
+def list_profiles(route: str | None = None, admin_id: int = Depends(get_current_admin)):
+    captures = [c for c in profiler.captures() if route is None or c["route"] == route]
+    return [profiler.summary(c) for c in reversed(captures)]
+
+
+@app.get("/admin/profiles/folded", response_class=PlainTextResponse)
+def get_profiles_folded(route: str | None = None, admin_id: int = Depends(get_current_admin)):
+    # Every buffered capture (optionally one route) merged into one flamegraph
+    captures = [c for c in profiler.captures() if route is None or c["route"] == route]
+    return profiler.folded(captures)
+
+
+@app.get("/admin/profiles/{capture_id}")
+def get_profile(capture_id: int, admin_id: int = Depends(get_current_admin)):
+    capture = profiler.get(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profiler.summary(capture) | {
+        "statements": capture["statements"],
+        "top_stacks": [
+            {"stack": stack, "samples": count}
+            for stack, count in capture["stacks"].most_common(20)
+        ],
+    }
+
+
+@app.get("/admin/profiles/{capture_id}/folded", response_class=PlainTextResponse)
+def get_profile_folded(capture_id: int, admin_id: int = Depends(get_current_admin)):
+    capture = profiler.get(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profiler.folded([capture])
+
+
+@app.delete("/admin/profiles")
+def clear_profiles(admin_id: int = Depends(get_current_admin)):
+    profiler.clear()
+    return {"message": "Profiles cleared"}
+
+
+# ==============================
+# Model Management (Protected)
+# ==============================
+def check_model_name(name):
+    if name not in MODEL_FILES:
+        raise HTTPException(status_code=404, detail=f"Unknown model {name}")
+
+
+@app.post("/admin/models/{name}/activate")
+def activate_model(name: str, version: str, admin_id: int = Depends(get_current_admin)):
+    check_model_name(name)
+    model_registry.activate(name, version)
+    return {"model": name, "active": model_registry.active_version(name)}
+
+
+@app.post("/admin/models/{name}/candidate")
+def set_candidate_model(name: str, version: str | None = None,
+                        admin_id: int = Depends(get_current_admin)):
+    # Omit version to stop shadow scoring for this model
+    check_model_name(name)
+    model_registry.set_candidate(name, version)
+    candidate = model_registry.candidate(name)
+    return {"model": name, "candidate": candidate[0] if candidate else None}
+
+
+@app.post("/admin/models/retrain", status_code=202)
+def retrain_models(mode: str | None = None, window_hours: float | None = None,
+                   candidate: bool = False, dry_run: bool = False,
+                   admin_id: int = Depends(get_current_admin)):
+    # A run takes minutes; it goes to a background thread and its result
+    # shows up under "triggered" in /admin/stats/retrain
+    if mode is not None and mode not in ("continue", "window"):
+        raise HTTPException(status_code=422, detail="mode must be continue or window")
+    options = {"candidate": candidate, "publish": not dry_run}
+    if mode is not None:
+        options["mode"] = mode
+    if window_hours is not None:
+        options["window_hours"] = window_hours
+
+    run_id = model_retrainer.trigger(**options)
+    if run_id is None:
+        raise HTTPException(status_code=409, detail="Retraining already running")
+    return {"run_id": run_id, "status": "running", "models": list(RETRAINABLE_MODELS),
+            "status_url": "/admin/stats/retrain"}
+
+
+@app.put("/admin/models/shadow")
+def set_shadow_fraction(fraction: float, admin_id: int = Depends(get_current_admin)):
+    if not 0 <= fraction <= 1:
+        raise HTTPException(status_code=422, detail="fraction must be between 0 and 1")
+    shadow_scorer.fraction = fraction
+    return {"fraction": fraction}
+
+
 # ==============================
 # Admin Sensor Management (Protected)
 # ==============================
 @app.get("/admin/sensors")
-def get_sensors(admin_id: int = Depends(get_current_admin)):
-    conn = get_connection()
+def get_sensors(admin_id: int = Depends(get_current_admin), conn=Depends(get_db)):
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -384,7 +1066,6 @@ def get_sensors(admin_id: int = Depends(get_current_admin)):
 
     rows = cursor.fetchall()
     cursor.close()
-    conn.close()
 
     return [
         {
@@ -407,9 +1088,9 @@ def add_sensor(
     latitude: float,
     longitude: float,
     radius: int,
-    admin_id: int = Depends(get_current_admin)
+    admin_id: int = Depends(get_current_admin),
+    conn=Depends(get_db)
 ):
-    conn = get_connection()
     cursor = conn.cursor()
 
     # Step 1: Insert Hardware Node
@@ -468,15 +1149,24 @@ def add_sensor(
 
     conn.commit()
     cursor.close()
-    conn.close()
+
+    response_cache.invalidate("sensors", "readings")
+    forecast_cache.invalidate([new_sensor_id])
+    broadcaster.invalidate_sensor_regions()
+    sensor_index.invalidate()
+    broadcaster.publish([reading_event((
+        new_sensor_id, datetime.now(),
+        pm25, pm10, 15.0, 0.5, 5.0, 20.0, 2.0,
+        generated_aqi, target_level
+    ))])
 
     return {"message": "Sensor deployed successfully", "sensor_id": new_sensor_id}
 
 
 @app.put("/admin/sensor/{sensor_id}/status")
 def update_status(sensor_id: int, is_active: bool,
-                  admin_id: int = Depends(get_current_admin)):
-    conn = get_connection()
+                  admin_id: int = Depends(get_current_admin),
+                  conn=Depends(get_db)):
     cursor = conn.cursor()
 
     cursor.execute("""
@@ -487,15 +1177,45 @@ def update_status(sensor_id: int, is_active: bool,
 
     conn.commit()
     cursor.close()
-    conn.close()
+
+    response_cache.invalidate("sensors")
+    sensor_index.invalidate()
 
     return {"message": "Status updated"}
 
 
+@app.put("/admin/sensor/{sensor_id}/location")
+def move_sensor(sensor_id: int, latitude: float, longitude: float, radius: int | None = None,
+                admin_id: int = Depends(get_current_admin),
+                conn=Depends(get_db)):
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise HTTPException(status_code=422, detail="latitude must be within ±90 and longitude within ±180")
+
+    cursor = conn.cursor()
+
+    cursor.execute("""
+        UPDATE sensors
+        SET latitude = %s, longitude = %s, radius = COALESCE(%s, radius)
+        WHERE id = %s
+    """, (latitude, longitude, radius, sensor_id))
+    updated = cursor.rowcount
+
+    conn.commit()
+    cursor.close()
+
+    if not updated:
+        raise HTTPException(status_code=404, detail="Sensor not found")
+
+    response_cache.invalidate("sensors")
+    sensor_index.invalidate()
+
+    return {"message": "Sensor moved"}
+
+
 @app.delete("/admin/sensor/{sensor_id}")
 def delete_sensor(sensor_id: int,
-                  admin_id: int = Depends(get_current_admin)):
-    conn = get_connection()
+                  admin_id: int = Depends(get_current_admin),
+                  conn=Depends(get_db)):
     cursor = conn.cursor()
 
     # Explicitly clear child dependencies manually to fulfill Foreign Key constraints
@@ -504,6 +1224,10 @@ def delete_sensor(sensor_id: int,
     conn.commit()
 
     cursor.close()
-    conn.close()
+
+    response_cache.invalidate("sensors", "readings")
+    forecast_cache.invalidate()
+    broadcaster.invalidate_sensor_regions()
+    sensor_index.invalidate()
 
     return {"message": "Sensor deleted"}
\ No newline at end of file
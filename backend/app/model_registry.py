@@ -0,0 +1,376 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import joblib
+import numpy as np
+from catboost import CatBoost
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Model Settings
+# ==============================
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+# "eager": load every model in parallel at startup; "lazy": on first use
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "eager")
+# Published versions live in <MODEL_REGISTRY_DIR>/<name>/<version>/
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", os.path.join(MODEL_DIR, "registry"))
+# Seconds between checks for a newly activated version (0 disables)
+MODEL_REFRESH_INTERVAL = float(os.getenv("MODEL_REFRESH_INTERVAL", "10"))
+
+# name -> file stem inside MODEL_DIR; <stem>.cbm wins over <stem>.pkl.
+# Used until a version of that model is published to the registry.
+MODEL_FILES = {
+    "aqi": "aqi_model",
+    "forecast": "aqi_forecast_model",
+    "aqi_fast": "aqi_model_fast",
+}
+# May be missing: the API runs without them and /ready does not wait for them
+OPTIONAL_MODELS = {"aqi_fast"}
+
+ACTIVE = "active"
+CANDIDATE = "candidate"
+
+
+class ModelNotFoundError(Exception):
+    pass
+
+
+# ==============================
+# Versioned Registry (on disk)
+# ==============================
+def _model_dir(name):
+    return os.path.join(MODEL_REGISTRY_DIR, name)
+
+
+def _pointer_path(name, which):
+    return os.path.join(_model_dir(name), which)
+
+
+def list_versions(name):
+    path = _model_dir(name)
+    if not os.path.isdir(path):
+        return []
+    return sorted(
+        v for v in os.listdir(path)
+        if os.path.exists(os.path.join(path, v, "model.cbm"))
+    )
+
+
+def read_version_meta(name, version):
+    with open(os.path.join(_model_dir(name), version, "meta.json")) as f:
+        return json.load(f)
+
+
+def read_pointer(name, which):
+    try:
+        with open(_pointer_path(name, which)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_pointer(name, which, version):
+    """Point `active` or `candidate` at version (None clears it); atomic rename."""
+    if version is not None and version not in list_versions(name):
+        raise ModelNotFoundError(f"{name} has no version {version}")
+
+    path = _pointer_path(name, which)
+    if version is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(version)
+    os.replace(tmp, path)
+
+
+def publish_model(name, model, metadata=None, activate=False, candidate=False):
+    """
+    Save a trained CatBoost model as a new immutable version of `name`.
+    The version directory appears atomically; running APIs pick it up once
+    it is activated (or shadow-score it once it is the candidate).
+    """
+    os.makedirs(_model_dir(name), exist_ok=True)
+
+    version = datetime.now().strftime("v%Y%m%d-%H%M%S")
+    while os.path.exists(os.path.join(_model_dir(name), version)):
+        version += "a"
+
+    tmp_dir = os.path.join(_model_dir(name), f".{version}.tmp")
+    os.makedirs(tmp_dir)
+    try:
+        model.save_model(os.path.join(tmp_dir, "model.cbm"), format="cbm")
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump({
+                "name": name,
+                "version": version,
+                "published_at": datetime.now().isoformat(),
+                **(metadata or {}),
+            }, f, indent=2, default=str)
+        os.rename(tmp_dir, os.path.join(_model_dir(name), version))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    if activate:
+        write_pointer(name, ACTIVE, version)
+    if candidate:
+        write_pointer(name, CANDIDATE, version)
+    return version
+
+
+# ==============================
+# Loading
+# ==============================
+def _load_cbm(path):
+    # CatBoost's own format: no unpickling, and the file can be shared
+    # read-only by every uvicorn worker
+    model = CatBoost()
+    model.load_model(path, format="cbm")
+    return model
+
+
+def _load_legacy(stem):
+    cbm_path = os.path.join(MODEL_DIR, f"{stem}.cbm")
+    if os.path.exists(cbm_path):
+        return _load_cbm(cbm_path), cbm_path, "cbm"
+
+    pkl_path = os.path.join(MODEL_DIR, f"{stem}.pkl")
+    if os.path.exists(pkl_path):
+        return joblib.load(pkl_path), pkl_path, "pickle"
+
+    raise ModelNotFoundError(f"No {stem}.cbm or {stem}.pkl in {MODEL_DIR}")
+
+
+def _load_version(name, version):
+    path = os.path.join(_model_dir(name), version, "model.cbm")
+    if not os.path.exists(path):
+        raise ModelNotFoundError(f"{name} has no version {version}")
+    return _load_cbm(path), path, "cbm"
+
+
+def _warm_up(model):
+    # The first predict pays for CatBoost's lazy model/evaluator setup
+    n_features = len(model.feature_names_)
+    model.predict(np.zeros((1, n_features)))
+
+
+def _load_and_warm(name, stem, version):
+    start = time.perf_counter()
+    if version is None:
+        model, path, fmt = _load_legacy(stem)
+    else:
+        model, path, fmt = _load_version(name, version)
+    loaded = time.perf_counter()
+    _warm_up(model)
+    warmed = time.perf_counter()
+
+    return model, {
+        "loaded": True,
+        "version": version or "legacy",
+        "path": path,
+        "format": fmt,
+        "size_bytes": os.path.getsize(path),
+        "load_ms": round((loaded - start) * 1000, 3),
+        "warmup_ms": round((warmed - loaded) * 1000, 3),
+    }
+
+
+class _Slot:
+    def __init__(self, stem, optional=False):
+        self.stem = stem
+        self.optional = optional
+        self.missing = False  # optional model with nothing to load (yet)
+        self.lock = threading.Lock()
+        self.model = None
+        self.version = None
+        self.info = {"loaded": False}
+        self.candidate = None  # (version, model)
+        self.candidate_info = None
+        self.swaps = 0
+
+
+class ModelRegistry:
+    """
+    Named models loaded on demand or in parallel, each warmed up with one
+    prediction before it is handed out. ready() is True once all are loaded.
+
+    refresh() follows the on-disk `active` / `candidate` pointers: a new
+    version is loaded and warmed up beside the old one, then swapped in with
+    a single reference assignment, so in-flight requests finish on the model
+    they started with.
+    """
+
+    def __init__(self, files):
+        self._slots = {name: _Slot(stem, name in OPTIONAL_MODELS) for name, stem in files.items()}
+        self._listeners = []
+        self._stop = threading.Event()
+        self._refresher = None
+
+    def on_swap(self, callback):
+        """callback(name, version) runs after the active model of `name` changes."""
+        self._listeners.append(callback)
+
+    def _load(self, name):
+        slot = self._slots[name]
+        with slot.lock:
+            if slot.model is not None:
+                return slot.model
+
+            if slot.missing:
+                raise ModelNotFoundError(f"{name} is not available")
+
+            version = read_pointer(name, ACTIVE)
+            try:
+                model, info = _load_and_warm(name, slot.stem, version)
+            except ModelNotFoundError as e:
+                if slot.optional:
+                    # Checked again by refresh() once a version is published
+                    slot.missing = True
+                    slot.info = {"loaded": False, "missing": str(e)}
+                raise
+            slot.model, slot.version, slot.info = model, version, info
+            logger.info("Loaded model %s: %s", name, info)
+            return model
+
+    def get(self, name):
+        slot = self._slots[name]
+        if slot.model is not None:
+            return slot.model
+        return self._load(name)
+
+    def available(self, name):
+        """False once an optional model was found to have no file or published version."""
+        slot = self._slots[name]
+        return slot.model is not None or not slot.missing
+
+    def _load_optional(self, name):
+        try:
+            self._load(name)
+        except ModelNotFoundError as e:
+            logger.info("Optional model %s not loaded: %s", name, e)
+
+    def active_version(self, name):
+        return self._slots[name].version or "legacy"
+
+    def candidate(self, name):
+        """(version, model) of the shadow candidate, or None."""
+        return self._slots[name].candidate
+
+    def load_all(self):
+        required = [name for name, slot in self._slots.items() if not slot.optional]
+        optional = [name for name, slot in self._slots.items() if slot.optional]
+        with ThreadPoolExecutor(max_workers=len(self._slots), thread_name_prefix="model-load") as pool:
+            optional_loads = pool.map(self._load_optional, optional)
+            list(pool.map(self._load, required))
+            list(optional_loads)
+        self.refresh()
+
+    def start_loading(self):
+        """Load everything in the background so the server can answer /ready meanwhile."""
+        def run():
+            try:
+                self.load_all()
+            except Exception:
+                logger.exception("Model loading failed")
+
+        threading.Thread(target=run, name="model-loader", daemon=True).start()
+
+    def ready(self):
+        return all(slot.model is not None for slot in self._slots.values() if not slot.optional)
+
+    # ------------------------------
+    # Hot swap
+    # ------------------------------
+    def refresh(self):
+        """Swap in newly activated versions and (un)load shadow candidates."""
+        for name, slot in self._slots.items():
+            with slot.lock:
+                if slot.missing and read_pointer(name, ACTIVE) is not None:
+                    # An optional model was published since the last attempt
+                    slot.missing = False
+                    slot.info = {"loaded": False}
+                if slot.model is None:
+                    # Lazy mode: picks the pointer up on first use
+                    continue
+
+                active = read_pointer(name, ACTIVE)
+                if active is not None and active != slot.version:
+                    model, info = _load_and_warm(name, slot.stem, active)
+                    slot.model, slot.version, slot.info = model, active, info
+                    slot.swaps += 1
+                    logger.info("Swapped model %s to %s", name, active)
+                    swapped = True
+                else:
+                    swapped = False
+
+                candidate = read_pointer(name, CANDIDATE)
+                current = slot.candidate[0] if slot.candidate else None
+                if candidate is None or candidate == slot.version:
+                    slot.candidate, slot.candidate_info = None, None
+                elif candidate != current:
+                    model, info = _load_and_warm(name, slot.stem, candidate)
+                    slot.candidate, slot.candidate_info = (candidate, model), info
+                    logger.info("Shadow candidate for %s is %s", name, candidate)
+
+            if swapped:
+                for callback in self._listeners:
+                    callback(name, active)
+
+    def activate(self, name, version):
+        write_pointer(name, ACTIVE, version)
+        self.refresh()
+
+    def set_candidate(self, name, version):
+        write_pointer(name, CANDIDATE, version)
+        self.refresh()
+
+    def start_refresher(self, interval=MODEL_REFRESH_INTERVAL):
+        """Poll the pointers so every worker follows an activation made elsewhere."""
+        if interval <= 0 or self._refresher is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception("Model refresh failed")
+
+        self._stop.clear()
+        self._refresher = threading.Thread(target=run, name="model-refresher", daemon=True)
+        self._refresher.start()
+
+    def stop_refresher(self):
+        if self._refresher is None:
+            return
+        self._stop.set()
+        self._refresher.join()
+        self._refresher = None
+
+    def stats(self):
+        return {
+            "load_mode": MODEL_LOAD_MODE,
+            "ready": self.ready(),
+            "models": {
+                name: {
+                    **slot.info,
+                    "swaps": slot.swaps,
+                    "candidate": slot.candidate_info,
+                    "published_versions": list_versions(name),
+                }
+                for name, slot in self._slots.items()
+            },
+        }
+
+
+model_registry = ModelRegistry(MODEL_FILES)
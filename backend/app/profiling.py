@@ -0,0 +1,287 @@
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+
+# ==============================
+# Profiling Settings
+# ==============================
+# Off by default; can also be switched on at runtime via PUT /admin/profiling
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# Fraction of requests captured regardless of latency
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+# Requests slower than this are always captured
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+# Stack samples kept in memory; requests longer than this window lose their oldest samples
+PROFILE_SAMPLE_HISTORY = int(os.getenv("PROFILE_SAMPLE_HISTORY", "20000"))
+PROFILE_MAX_STATEMENTS = int(os.getenv("PROFILE_MAX_STATEMENTS", "200"))
+PROFILE_MAX_STACK_DEPTH = 128
+SQL_TEXT_LIMIT = 500
+# Long-lived or self-referential paths that would always look slow
+PROFILE_EXCLUDE_PATHS = tuple(
+    p.strip() for p in os.getenv("PROFILE_EXCLUDE_PATHS", "/stream/,/metrics,/admin/profil").split(",") if p.strip()
+)
+
+# Leaf frames of worker threads parked with nothing to do
+_IDLE_LEAVES = {
+    ("threading.py", "Condition.wait"),
+    ("thread.py", "_worker"),
+}
+
+# Per-request list of SQL statements, set by ProfilingMiddleware. Copied into
+# the threadpool with the request context, like the metrics stage timings.
+_request_statements = ContextVar("request_statements", default=None)
+
+
+def record_sql(statement, seconds, rows=None):
+    """Attach a statement and its duration to the request being profiled, if any."""
+    statements = _request_statements.get()
+    if statements is None or len(statements) >= PROFILE_MAX_STATEMENTS:
+        return
+
+    if isinstance(statement, bytes):
+        statement = statement.decode("utf-8", "replace")
+    statement = " ".join(str(statement).split())
+    if len(statement) > SQL_TEXT_LIMIT:
+        statement = statement[:SQL_TEXT_LIMIT] + "..."
+
+    statements.append({
+        "sql": statement,
+        "duration_ms": round(seconds * 1000, 3),
+        "rows": rows,
+    })
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+
+class StackSampler:
+    """
+    Statistical profiler: a daemon thread snapshots every thread's stack
+    with sys._current_frames() while requests are in flight.
+
+    Samples go into a bounded deque with their timestamp; a capture takes
+    the samples that fall inside its request's lifetime. Requests served
+    concurrently share the event loop and threadpool, so their samples
+    overlap.
+    """
+
+    def __init__(self, interval_ms, history):
+        self.interval = interval_ms / 1000
+        self._samples = deque(maxlen=history)  # (perf_counter, folded stack)
+        self._active = threading.Event()
+        self._thread = None
+        self._thread_names = {}
+        self._samples_total = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def set_active(self, active):
+        if active:
+            self._active.set()
+        else:
+            self._active.clear()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            now = time.perf_counter()
+
+            frames = sys._current_frames()
+            if any(ident not in self._thread_names for ident in frames):
+                self._thread_names = {t.ident: t.name for t in threading.enumerate()}
+
+            for ident, frame in frames.items():
+                if ident == own_id:
+                    continue
+                stack = self._fold(frame, self._thread_names.get(ident, str(ident)))
+                if stack is not None:
+                    self._samples.append((now, stack))
+                    self._samples_total += 1
+
+    def _fold(self, frame, thread_name):
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_qualname) in _IDLE_LEAVES:
+            return None
+
+        labels = []
+        while frame is not None and len(labels) < PROFILE_MAX_STACK_DEPTH:
+            labels.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        labels.append(thread_name.replace(";", ":"))
+        # Root first, as flamegraph tools expect
+        return ";".join(reversed(labels))
+
+    def collect(self, start, end):
+        """Count folded stacks sampled between two perf_counter() readings."""
+        counts = Counter()
+        for ts, stack in list(self._samples):
+            if start <= ts <= end:
+                counts[stack] += 1
+        return counts
+
+
+class Profiler:
+    """
+    Keeps the last N request captures in a ring buffer.
+
+    Every request pays for a random() call and a list for its SQL
+    statements; only sampled or slow requests fold stack samples into a
+    capture.
+    """
+
+    def __init__(self, enabled, sample_rate, slow_ms, buffer_size, sampler):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.sampler = sampler
+
+        self._lock = threading.Lock()
+        self._captures = deque(maxlen=buffer_size)
+        self._ids = itertools.count(1)
+        self._in_flight = 0
+        self._requests_total = 0
+        self._captured_sampled = 0
+        self._captured_slow = 0
+
+    def begin(self):
+        with self._lock:
+            self._in_flight += 1
+            self._requests_total += 1
+            if self._in_flight == 1:
+                self.sampler.start()
+                self.sampler.set_active(True)
+        statements = []
+        return _request_statements.set(statements), statements, time.perf_counter()
+
+    def end(self, token, statements, start, method, path, route, status):
+        end = time.perf_counter()
+        _request_statements.reset(token)
+        with self._lock:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self.sampler.set_active(False)
+
+        duration_ms = (end - start) * 1000
+        if duration_ms >= self.slow_ms:
+            reason = "slow"
+        elif random.random() < self.sample_rate:
+            reason = "sampled"
+        else:
+            return
+
+        stacks = self.sampler.collect(start, end)
+        capture = {
+            "id": next(self._ids),
+            "captured_at": datetime.now().isoformat(),
+            "reason": reason,
+            "method": method,
+            "path": path,
+            "route": route,
+            "status": status,
+            "duration_ms": round(duration_ms, 3),
+            "samples": sum(stacks.values()),
+            "sql_ms": round(sum(s["duration_ms"] for s in statements), 3),
+            "statements": statements,
+            "stacks": stacks,
+        }
+        with self._lock:
+            self._captures.append(capture)
+            if reason == "slow":
+                self._captured_slow += 1
+            else:
+                self._captured_sampled += 1
+
+    def captures(self):
+        with self._lock:
+            return list(self._captures)
+
+    def get(self, capture_id):
+        for capture in self.captures():
+            if capture["id"] == capture_id:
+                return capture
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._captures.clear()
+
+    @staticmethod
+    def summary(capture):
+        return {k: v for k, v in capture.items() if k not in ("statements", "stacks")} | {
+            "statement_count": len(capture["statements"]),
+        }
+
+    @staticmethod
+    def folded(captures):
+        """Merge captures into folded-stack text (flamegraph.pl, speedscope, inferno)."""
+        counts = Counter()
+        for capture in captures:
+            counts.update(capture["stacks"])
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "sample_rate": self.sample_rate,
+                "slow_ms": self.slow_ms,
+                "interval_ms": self.sampler.interval * 1000,
+                "in_flight": self._in_flight,
+                "requests_total": self._requests_total,
+                "captured_sampled": self._captured_sampled,
+                "captured_slow": self._captured_slow,
+                "buffered": len(self._captures),
+                "buffer_size": self._captures.maxlen,
+                "stack_samples_total": self.sampler._samples_total,
+            }
+
+
+profiler = Profiler(
+    PROFILING_ENABLED,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_SLOW_MS,
+    PROFILE_BUFFER_SIZE,
+    StackSampler(PROFILE_INTERVAL_MS, PROFILE_SAMPLE_HISTORY),
+)
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware: hands sampled and slow requests to the profiler."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not profiler.enabled
+                or scope["path"].startswith(PROFILE_EXCLUDE_PATHS)):
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        token, statements, start = profiler.begin()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            profiler.end(token, statements, start, scope["method"], scope["path"], route, status[0])
@@ -0,0 +1,406 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from catboost import CatBoostRegressor
+
+from app.db import get_connection
+from app.features import FeatureSpec, build_training_frame
+from app.model_registry import model_registry, publish_model, MODEL_REGISTRY_DIR
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Retraining Settings
+# ==============================
+# Seconds between retraining runs inside the API (0 disables; use
+# scripts/retrain_models.py from cron instead)
+RETRAIN_INTERVAL = float(os.getenv("RETRAIN_INTERVAL", "0"))
+# "continue": boost more trees onto the active model (CatBoost init_model)
+# using readings since the checkpoint; "window": train a fresh model on
+# the last RETRAIN_WINDOW_HOURS
+RETRAIN_MODE = os.getenv("RETRAIN_MODE", "continue")
+# Never read further back than this, whatever the checkpoint says
+RETRAIN_WINDOW_HOURS = float(os.getenv("RETRAIN_WINDOW_HOURS", "168"))
+# Hard cap on hourly rows loaded per run (newest kept); bounds memory
+RETRAIN_MAX_ROWS = int(os.getenv("RETRAIN_MAX_ROWS", "2000000"))
+# Fewest new hourly training rows (sensor-hours with a full lag window)
+# a run needs before it trains or publishes anything
+RETRAIN_MIN_ROWS = int(os.getenv("RETRAIN_MIN_ROWS", "500"))
+# Newest fraction of the window held out to compare old and new model
+RETRAIN_HOLDOUT_FRACTION = float(os.getenv("RETRAIN_HOLDOUT_FRACTION", "0.2"))
+# Required relative RMSE improvement on the holdout before publishing
+RETRAIN_MIN_IMPROVEMENT = float(os.getenv("RETRAIN_MIN_IMPROVEMENT", "0.0"))
+RETRAIN_ITERATIONS = int(os.getenv("RETRAIN_ITERATIONS", "200"))
+# CatBoost threads; kept low so a run inside the API leaves cores for requests
+RETRAIN_THREADS = int(os.getenv("RETRAIN_THREADS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+FETCH_BATCH_ROWS = 50_000
+
+# Arbitrary key so only one API worker / cron job retrains at a time
+RETRAIN_LOCK_ID = 7203002
+
+# sensor_readings has no measured AQI, only what the AQI model predicted,
+# so only the forecast model (which forecasts that series) can learn from it.
+# It forecasts hourly steps, so it learns from the hourly rollup
+# (sensor_readings_hourly.aqi_avg), never from raw ~5 s readings.
+RETRAINABLE_MODELS = ("forecast",)
+
+
+# ==============================
+# Checkpoint
+# ==============================
+def _checkpoint_path(name):
+    return os.path.join(MODEL_REGISTRY_DIR, name, "retrain_checkpoint.json")
+
+
+def read_checkpoint(name):
+    try:
+        with open(_checkpoint_path(name)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(name, checkpoint):
+    path = _checkpoint_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f, indent=2, default=str)
+    os.replace(tmp, path)
+
+
+# ==============================
+# Data
+# ==============================
+def fetch_hourly(conn, since, context, max_rows=RETRAIN_MAX_ROWS):
+    """
+    Hourly average AQI per sensor from sensor_readings_hourly: buckets after
+    `since` (newest max_rows), plus each sensor's last `context` buckets at
+    or before it so the first new hours have lags. Streamed through a
+    server-side cursor into numpy arrays.
+    """
+    sensor_ids, timestamps, values = [], [], []
+
+    def drain(cursor):
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_ROWS)
+            if not rows:
+                return
+            sensor_ids.append(np.fromiter((r[0] for r in rows), dtype=np.int32, count=len(rows)))
+            timestamps.append(np.array([r[1] for r in rows], dtype="datetime64[us]"))
+            values.append(np.fromiter((r[2] for r in rows), dtype=np.float32, count=len(rows)))
+
+    cursor = conn.cursor(name="retrain_hourly")
+    cursor.itersize = FETCH_BATCH_ROWS
+    cursor.execute("""
+        SELECT sensor_id, bucket, aqi_avg
+        FROM sensor_readings_hourly
+        WHERE bucket > %s AND aqi_avg IS NOT NULL
+        ORDER BY bucket DESC
+        LIMIT %s
+    """, (since, max_rows))
+    drain(cursor)
+    cursor.close()
+
+    cursor = conn.cursor(name="retrain_context")
+    cursor.execute("""
+        SELECT s.id, c.bucket, c.aqi_avg
+        FROM sensors s
+        CROSS JOIN LATERAL (
+            SELECT h.bucket, h.aqi_avg
+            FROM sensor_readings_hourly h
+            WHERE h.sensor_id = s.id AND h.bucket <= %s AND h.aqi_avg IS NOT NULL
+            ORDER BY h.bucket DESC
+            LIMIT %s
+        ) c
+    """, (since, context))
+    drain(cursor)
+    cursor.close()
+    conn.rollback()
+
+    if not values:
+        return pd.DataFrame({"StationId": [], "Datetime": pd.to_datetime([]), "AQI": []})
+
+    return pd.DataFrame({
+        "StationId": np.concatenate(sensor_ids),
+        "Datetime": np.concatenate(timestamps).astype("datetime64[ns]"),
+        "AQI": np.concatenate(values),
+    })
+
+
+def hourly_grid(df):
+    """
+    One row per sensor per hour from its first to its last hour, AQI NaN for
+    hours with no data, so AQI_lag_k is always k hours back. Rows that are
+    not on the hour are averaged into their hour.
+    """
+    if df.empty:
+        return df
+    hourly = (
+        df.assign(Datetime=df["Datetime"].dt.floor("h"))
+        .set_index("Datetime")
+        .groupby("StationId")["AQI"]
+        .resample("h")
+        .mean()
+    )
+    return hourly.reset_index()
+
+
+def hourly_training_frame(df, spec):
+    """Training rows from hourly data; windows that span a missing hour are dropped."""
+    frame = build_training_frame(hourly_grid(df), spec)
+    return frame.dropna(subset=spec.names + ["AQI"]).reset_index(drop=True)
+
+
+def _rmse(predictions, actual):
+    return float(np.sqrt(np.mean((np.asarray(predictions) - actual) ** 2)))
+
+
+# ==============================
+# Retraining
+# ==============================
+def retrain_model(conn, name="forecast", mode=RETRAIN_MODE, window_hours=RETRAIN_WINDOW_HOURS,
+                  publish=True, candidate=False):
+    """
+    One retraining pass for `name`. Returns a summary dict; "published" is
+    the new version, or None if the model was not better (or publish=False).
+    """
+    if name not in RETRAINABLE_MODELS:
+        raise ValueError(f"{name} cannot be retrained from sensor_readings")
+    if mode not in ("continue", "window"):
+        raise ValueError(f"Unknown retrain mode {mode}")
+
+    start = time.perf_counter()
+    current = model_registry.get(name)
+    parent_version = model_registry.active_version(name)
+    spec = FeatureSpec.for_model(current)
+
+    now = datetime.now()
+    window_start = now - timedelta(hours=window_hours)
+    checkpoint = read_checkpoint(name)
+    since = window_start
+    if mode == "continue" and checkpoint is not None:
+        since = max(window_start, datetime.fromisoformat(checkpoint["until"]))
+
+    summary = {
+        "model": name,
+        "mode": mode,
+        "parent_version": parent_version,
+        "since": since.isoformat(),
+        "published": None,
+    }
+
+    df = fetch_hourly(conn, since, spec.window)
+    frame = hourly_training_frame(df, spec)
+    del df
+    # Context rows only supply lags; targets are the new hours
+    frame = frame[frame["Datetime"] > np.datetime64(since)]
+    summary["rows"] = len(frame)
+
+    if len(frame) < RETRAIN_MIN_ROWS:
+        summary["skipped"] = f"only {len(frame)} new hourly rows (RETRAIN_MIN_ROWS={RETRAIN_MIN_ROWS})"
+        summary["elapsed_s"] = round(time.perf_counter() - start, 3)
+        return summary
+
+    # Holdout = the newest hours, so the comparison is on data neither
+    # model has seen and in the order they would be served
+    cutoff = frame["Datetime"].quantile(1 - RETRAIN_HOLDOUT_FRACTION)
+    train = frame[frame["Datetime"] < cutoff]
+    holdout = frame[frame["Datetime"] >= cutoff]
+    if train.empty or holdout.empty:
+        summary["skipped"] = "new hourly rows do not span enough hours for a holdout"
+        summary["elapsed_s"] = round(time.perf_counter() - start, 3)
+        return summary
+    # Named columns: init_model checks them against the model being extended
+    X_train = pd.DataFrame(train[spec.names].to_numpy(np.float32), columns=spec.names)
+    X_holdout = pd.DataFrame(holdout[spec.names].to_numpy(np.float32), columns=spec.names)
+    y_train = train["AQI"].to_numpy()
+    y_holdout = holdout["AQI"].to_numpy()
+    until = frame["Datetime"].max()
+    del frame, train, holdout
+
+    params = dict(iterations=RETRAIN_ITERATIONS, loss_function="RMSE",
+                  thread_count=RETRAIN_THREADS, verbose=0)
+    if mode == "continue":
+        # init_model needs the same tree depth as the model it extends
+        depth = current.get_all_params().get("depth", 6)
+        model = CatBoostRegressor(depth=depth, learning_rate=0.03, **params)
+        model.fit(X_train, y_train, init_model=current)
+    else:
+        model = CatBoostRegressor(depth=6, learning_rate=0.05, **params)
+        model.fit(X_train, y_train)
+
+    baseline_rmse = _rmse(current.predict(X_holdout), y_holdout)
+    new_rmse = _rmse(model.predict(X_holdout), y_holdout)
+    better = new_rmse < baseline_rmse * (1 - RETRAIN_MIN_IMPROVEMENT)
+
+    summary.update({
+        "until": str(until),
+        "train_rows": len(y_train),
+        "holdout_rows": len(y_holdout),
+        "baseline_rmse": round(baseline_rmse, 4),
+        "new_rmse": round(new_rmse, 4),
+        "improved": bool(better),
+    })
+
+    if better and publish:
+        version = publish_model(
+            name, model,
+            {
+                "rmse": new_rmse,
+                "baseline_rmse": baseline_rmse,
+                "lags": list(spec.lags),
+                "features": spec.to_dict(),
+                "retrain": {k: summary[k] for k in ("mode", "parent_version", "since", "until",
+                                                    "train_rows", "holdout_rows")},
+            },
+            activate=not candidate, candidate=candidate
+        )
+        summary["published"] = version
+        # Only move past these readings once a model has learned from them
+        write_checkpoint(name, {"until": str(until), "version": version, "updated_at": now.isoformat()})
+
+    summary["elapsed_s"] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def run_retraining(conn, **kwargs):
+    """
+    Retrain every retrainable model. Returns a list of summaries, or None if
+    another process holds the lock.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_try_advisory_lock(%s)", (RETRAIN_LOCK_ID,))
+    locked = cursor.fetchone()[0]
+    conn.rollback()
+    cursor.close()
+    if not locked:
+        return None
+
+    try:
+        return [retrain_model(conn, name, **kwargs) for name in RETRAINABLE_MODELS]
+    finally:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (RETRAIN_LOCK_ID,))
+        conn.commit()
+        cursor.close()
+
+
+class ModelRetrainer:
+    """
+    Background thread that runs run_retraining() every interval seconds on
+    its own connection, so a long run never holds a pooled one. trigger()
+    starts a single run on a thread of its own for the admin API.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_run = None
+        self.runs = 0
+        self.published = 0
+
+        self._trigger_lock = threading.Lock()
+        self._triggered = None
+        self._trigger_seq = 0
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="model-retrainer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def run_once(self, **kwargs):
+        """One run on a dedicated connection; None if another process holds the lock."""
+        conn = get_connection()
+        try:
+            summaries = run_retraining(conn, **kwargs)
+        finally:
+            conn.close()
+
+        if summaries is None:
+            return None
+        self.runs += 1
+        self.last_run = summaries
+        if any(s["published"] for s in summaries):
+            self.published += 1
+            # Swap now rather than on the next refresher tick
+            model_registry.refresh()
+        logger.info("Model retraining: %s", summaries)
+        return summaries
+
+    def trigger(self, **kwargs):
+        """
+        Start one run_once(**kwargs) in the background and return its id, or
+        None while an earlier triggered run is still going. Its status and
+        summaries are in stats()["triggered"].
+        """
+        with self._trigger_lock:
+            if self._triggered is not None and self._triggered["status"] == "running":
+                return None
+            self._trigger_seq += 1
+            run = {
+                "id": self._trigger_seq,
+                "status": "running",
+                "options": kwargs,
+                "started_at": datetime.now().isoformat(),
+                "finished_at": None,
+            }
+            self._triggered = run
+
+        threading.Thread(target=self._run_triggered, args=(run, kwargs),
+                         name="model-retrain-run", daemon=True).start()
+        return run["id"]
+
+    def _run_triggered(self, run, kwargs):
+        try:
+            summaries = self.run_once(**kwargs)
+            if summaries is None:
+                run["status"] = "skipped"
+                run["error"] = "another process is retraining"
+            else:
+                run["status"] = "finished"
+                run["runs"] = summaries
+        except Exception as e:
+            logger.exception("Triggered model retraining failed")
+            run["status"] = "failed"
+            run["error"] = str(e)
+        finally:
+            run["finished_at"] = datetime.now().isoformat()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Model retraining failed")
+
+    def stats(self):
+        return {
+            "interval_s": self.interval,
+            "mode": RETRAIN_MODE,
+            "window_hours": RETRAIN_WINDOW_HOURS,
+            "runs": self.runs,
+            "published": self.published,
+            "last_run": self.last_run,
+            "triggered": dict(self._triggered) if self._triggered else None,
+        }
+
+
+model_retrainer = ModelRetrainer(RETRAIN_INTERVAL)
@@ -0,0 +1,170 @@
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from app.model_registry import model_registry
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Shadow Scoring Settings
+# ==============================
+# Fraction of /predict and /forecast traffic re-scored by the candidate model
+MODEL_SHADOW_FRACTION = float(os.getenv("MODEL_SHADOW_FRACTION", "0"))
+MODEL_SHADOW_QUEUE = int(os.getenv("MODEL_SHADOW_QUEUE", "1000"))
+
+
+class _VersionStats:
+    def __init__(self):
+        self.requests = 0
+        self.rows = 0
+        self.candidate_ms_total = 0.0
+        self.candidate_ms_max = 0.0
+        self.primary_ms_total = 0.0
+        self.delta_sum = 0.0
+        self.abs_delta_sum = 0.0
+        self.abs_delta_max = 0.0
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "rows": self.rows,
+            "candidate_latency_avg_ms": round(self.candidate_ms_total / self.requests, 3) if self.requests else 0.0,
+            "candidate_latency_max_ms": round(self.candidate_ms_max, 3),
+            "primary_latency_avg_ms": round(self.primary_ms_total / self.requests, 3) if self.requests else 0.0,
+            "mean_delta": round(self.delta_sum / self.rows, 4) if self.rows else 0.0,
+            "mean_abs_delta": round(self.abs_delta_sum / self.rows, 4) if self.rows else 0.0,
+            "max_abs_delta": round(self.abs_delta_max, 4),
+        }
+
+
+class ShadowScorer:
+    """
+    Re-scores a sample of live requests with each model's shadow candidate.
+
+    Requests only pay for a random() call and a put_nowait; one background
+    thread runs the candidate and records latency and the prediction delta
+    against the primary model. Samples are dropped when the queue is full.
+    """
+
+    def __init__(self, fraction, max_queue):
+        self.fraction = fraction
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+
+        self._lock = threading.Lock()
+        self._stats = defaultdict(_VersionStats)  # (name, primary, candidate) -> stats
+        self._dropped = 0
+        self._skipped = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def maybe_submit(self, name, features, predictions, primary_ms):
+        """
+        Sample this request for shadow scoring; never blocks or raises.
+
+        features is the matrix the primary model scored. When the candidate
+        may need different inputs (forecast feature specs), pass a function
+        candidate_model -> (features, predictions) instead, with predictions
+        None; it runs only for sampled requests and returns None when the
+        request cannot be scored by that candidate.
+        """
+        if self._thread is None or self.fraction <= 0 or random.random() >= self.fraction:
+            return
+        candidate = model_registry.candidate(name)
+        if candidate is None:
+            return
+        version, model = candidate
+
+        if callable(features):
+            try:
+                built = features(model)
+            except Exception:
+                logger.exception("Could not build shadow features for %s %s", name, version)
+                built = None
+            if built is None:
+                with self._lock:
+                    self._skipped += 1
+                return
+            features, predictions = built
+
+        try:
+            self._queue.put_nowait((name, model_registry.active_version(name), version,
+                                    features, predictions, primary_ms))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._score(*item)
+            except Exception:
+                logger.exception("Shadow scoring failed")
+
+    def _score(self, name, primary_version, version, features, predictions, primary_ms):
+        candidate = model_registry.candidate(name)
+        # Features were built for that candidate; a newer one may not accept them
+        if candidate is None or candidate[0] != version:
+            return
+        model = candidate[1]
+
+        start = time.perf_counter()
+        shadow = np.asarray(model.predict(features), dtype=float)
+        candidate_ms = (time.perf_counter() - start) * 1000
+
+        delta = shadow - np.asarray(predictions, dtype=float)
+        abs_delta = np.abs(delta)
+
+        with self._lock:
+            s = self._stats[(name, primary_version, version)]
+            s.requests += 1
+            s.rows += len(delta)
+            s.candidate_ms_total += candidate_ms
+            s.candidate_ms_max = max(s.candidate_ms_max, candidate_ms)
+            s.primary_ms_total += primary_ms
+            s.delta_sum += float(delta.sum())
+            s.abs_delta_sum += float(abs_delta.sum())
+            s.abs_delta_max = max(s.abs_delta_max, float(abs_delta.max(initial=0.0)))
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._dropped = 0
+            self._skipped = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "fraction": self.fraction,
+                "queue_depth": self._queue.qsize(),
+                "dropped": self._dropped,
+                "skipped": self._skipped,
+                "comparisons": [
+                    {"model": name, "primary": primary, "candidate": candidate, **s.as_dict()}
+                    for (name, primary, candidate), s in self._stats.items()
+                ],
+            }
+
+
+shadow_scorer = ShadowScorer(MODEL_SHADOW_FRACTION, MODEL_SHADOW_QUEUE)
@@ -0,0 +1,462 @@
+import heapq
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from app.aqi_index import get_category
+from app.db import run_with_connection
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Spatial Index Settings
+# ==============================
+# Seconds before the index is reloaded from sensors/sensor_latest in the
+# background (picks up other workers' readings and admin changes).
+# Readings served by this worker are applied as they arrive.
+SPATIAL_RELOAD_INTERVAL = float(os.getenv("SPATIAL_RELOAD_INTERVAL", "30"))
+# /aqi/at defaults: sensors to interpolate from, IDW power, and how far a
+# sensor may be from the point and still count
+SPATIAL_DEFAULT_K = int(os.getenv("SPATIAL_DEFAULT_K", "4"))
+SPATIAL_MAX_K = 32
+SPATIAL_IDW_POWER = float(os.getenv("SPATIAL_IDW_POWER", "2"))
+SPATIAL_MAX_DISTANCE_KM = float(os.getenv("SPATIAL_MAX_DISTANCE_KM", "50"))
+# Cap on sensors returned by /sensors/within
+SPATIAL_MAX_RESULTS = int(os.getenv("SPATIAL_MAX_RESULTS", "5000"))
+
+EARTH_RADIUS_KM = 6371.0088
+LEAF_SIZE = 16
+# Closer than this (km) the sensor's own AQI is the answer
+SAME_POINT_KM = 0.001
+
+
+def unit_vectors(lat, lon):
+    """Points on the unit sphere: chord length grows with great-circle distance."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+
+
+def km_to_chord(km):
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+# ==============================
+# KD-tree
+# ==============================
+class KDTree:
+    """
+    Static KD-tree over 3D unit vectors, so nearest-by-chord is nearest on
+    the sphere with no special cases at the poles or the antimeridian.
+
+    Nodes are flat arrays built once: each covers points[order[lo:hi]] with
+    a bounding box; inner nodes split at the median of their widest axis.
+    Queries are best-first on box distance and only visit the leaves that
+    can still hold one of the k nearest points.
+    """
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        n = len(points)
+        self.order = np.arange(n)
+        lo_, hi_, left_, right_, mins_, maxs_ = [], [], [], [], [], []
+
+        def add(lo, hi):
+            idx = self.order[lo:hi]
+            box = points[idx]
+            lo_.append(lo)
+            hi_.append(hi)
+            left_.append(-1)
+            right_.append(-1)
+            mins_.append(box.min(axis=0) if hi > lo else np.zeros(3))
+            maxs_.append(box.max(axis=0) if hi > lo else np.zeros(3))
+            return len(lo_) - 1
+
+        stack = [add(0, n)]
+        while stack:
+            node = stack.pop()
+            lo, hi = lo_[node], hi_[node]
+            if hi - lo <= leaf_size:
+                continue
+            axis = int(np.argmax(maxs_[node] - mins_[node]))
+            mid = (lo + hi) // 2
+            idx = self.order[lo:hi]
+            part = np.argpartition(points[idx, axis], mid - lo)
+            self.order[lo:hi] = idx[part]
+            left_[node] = add(lo, mid)
+            right_[node] = add(mid, hi)
+            stack += [left_[node], right_[node]]
+
+        # Leaf points stored contiguously; node fields as lists, which are
+        # much cheaper than numpy scalars in the per-node query loop
+        self.points = np.ascontiguousarray(points[self.order])
+        self.lo, self.hi = lo_, hi_
+        self.left, self.right = left_, right_
+        self.mins = np.array(mins_).tolist()
+        self.maxs = np.array(maxs_).tolist()
+
+    def _box_distance(self, node, q):
+        d = 0.0
+        for v, a, b in zip(q, self.mins[node], self.maxs[node]):
+            if v < a:
+                d += (a - v) ** 2
+            elif v > b:
+                d += (v - b) ** 2
+        return d
+
+    def query(self, q, k, max_chord=2.0, mask=None):
+        """
+        Up to k nearest points to q within max_chord (optionally only where
+        mask, indexed like the original points, is true). Returns
+        (positions in the original points, chord distances), nearest first.
+        """
+        q = [float(v) for v in q]
+        q_arr = np.array(q)
+        bound = max_chord ** 2
+        best_d = np.empty(0)
+        best_i = np.empty(0, dtype=np.int64)
+        heap = [(self._box_distance(0, q), 0)]
+
+        while heap:
+            d, node = heapq.heappop(heap)
+            if d > bound:
+                break
+            left = self.left[node]
+            if left >= 0:
+                right = self.right[node]
+                for child in (left, right):
+                    cd = self._box_distance(child, q)
+                    if cd <= bound:
+                        heapq.heappush(heap, (cd, child))
+                continue
+
+            lo, hi = self.lo[node], self.hi[node]
+            dist = ((self.points[lo:hi] - q_arr) ** 2).sum(axis=1)
+            pos = np.arange(lo, hi)
+            keep = dist <= bound
+            if mask is not None:
+                keep &= mask[self.order[lo:hi]]
+            best_d = np.concatenate([best_d, dist[keep]])
+            best_i = np.concatenate([best_i, pos[keep]])
+            if len(best_d) >= k:
+                if len(best_d) > k:
+                    top = np.argpartition(best_d, k - 1)[:k]
+                    best_d, best_i = best_d[top], best_i[top]
+                bound = float(best_d.max())
+
+        first = np.argsort(best_d, kind="stable")
+        return self.order[best_i[first]], np.sqrt(best_d[first])
+
+
+# ==============================
+# Sensor Index
+# ==============================
+class SensorIndex:
+    """
+    Active sensors with coordinates, and their latest AQI, in memory:
+    a KD-tree for nearest-k / inverse-distance-weighted AQI at a point, and
+    latitude-sorted arrays for bounding-box queries.
+
+    Built from the database on first use, rebuilt in place when admins add,
+    move, deactivate or delete sensors, and reloaded in the background every
+    SPATIAL_RELOAD_INTERVAL seconds. A rebuild swaps in a new snapshot, so
+    queries never see a half-built index.
+    """
+
+    def __init__(self, reload_interval):
+        self.reload_interval = reload_interval
+        self._snapshot = None
+        self._load_lock = threading.Lock()
+        self._first_load_lock = threading.Lock()
+        self._reloading = False
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._listeners = []
+
+        self._builds = 0
+        self._build_ms = 0.0
+        self._build_errors = 0
+        self._readings_applied = 0
+        self._nearest_queries = 0
+        self._within_queries = 0
+        self._query_ms_total = 0.0
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    def on_change(self, callback):
+        """
+        callback(lat, lon) runs with the old and new positions (arrays) of
+        sensors added, removed, moved or with a new AQI.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, lat, lon):
+        for callback in self._listeners:
+            try:
+                callback(lat, lon)
+            except Exception:
+                logger.exception("Spatial index change listener failed")
+
+    # ------------------------------
+    # Building
+    # ------------------------------
+    def reload(self):
+        def query(conn):
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT s.id, s.sensor_code, s.latitude, s.longitude, s.radius, r.name,
+                       sl.predicted_aqi, sl.timestamp
+                FROM sensors s
+                JOIN regions r ON r.id = s.region_id
+                LEFT JOIN sensor_latest sl ON sl.sensor_id = s.id
+                WHERE s.is_active AND s.latitude IS NOT NULL AND s.longitude IS NOT NULL
+            """)
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+
+        generation = self._generation
+        rows = run_with_connection(query)
+        start = time.perf_counter()
+        snapshot = _Snapshot(rows)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        with self._load_lock:
+            previous = self._snapshot
+            # An invalidate() during the query means these rows may predate
+            # it; its own rebuild replaces them (still better than nothing)
+            swapped = generation == self._generation or previous is None
+            if swapped:
+                self._snapshot = snapshot
+                self._loaded_at = time.monotonic()
+            self._builds += 1
+            self._build_ms = build_ms
+
+        if swapped and previous is not None:
+            changed = snapshot.changed_since(previous)
+            if len(changed[0]):
+                self._notify(*changed)
+
+    def invalidate(self):
+        """
+        Rebuild after an admin sensor change. The rebuild runs on a worker
+        thread, so the caller (still holding its own connection) never waits
+        on a second one; queries keep the current snapshot until it lands.
+        """
+        with self._load_lock:
+            self._generation += 1
+            self._loaded_at = 0.0
+        self._schedule_reload()
+
+    def ensure_loaded(self):
+        """Load synchronously the first time; later reloads happen in the background."""
+        if self._snapshot is None:
+            # Concurrent first requests wait for one load
+            with self._first_load_lock:
+                if self._snapshot is None:
+                    self.reload()
+            return
+
+        if time.monotonic() - self._loaded_at > self.reload_interval:
+            self._schedule_reload()
+
+    def _schedule_reload(self):
+        with self._load_lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._background_reload, name="spatial-index", daemon=True).start()
+
+    def _background_reload(self):
+        while True:
+            generation = self._generation
+            try:
+                self.reload()
+            except Exception:
+                self._build_errors += 1
+                logger.exception("Background reload of the sensor spatial index failed")
+                # Wait a full interval before trying again
+                self._loaded_at = time.monotonic()
+                self._reloading = False
+                return
+
+            # Go again if an invalidate() landed mid-query and discarded the rows
+            with self._load_lock:
+                if generation == self._generation:
+                    self._reloading = False
+                    return
+
+    def apply_readings(self, readings):
+        """readings: /latest-shaped dicts (sensor_id, aqi, timestamp) just stored."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return
+        applied = []
+        for reading in readings:
+            pos = snapshot.positions.get(reading["sensor_id"])
+            if pos is not None and reading["aqi"] is not None:
+                snapshot.aqi[pos] = reading["aqi"]
+                snapshot.timestamps[pos] = reading["timestamp"]
+                applied.append(pos)
+        if applied:
+            self._readings_applied += len(applied)
+            self._notify(snapshot.lat[applied], snapshot.lon[applied])
+
+    # ------------------------------
+    # Queries
+    # ------------------------------
+    def interpolate(self, lat, lon, k=SPATIAL_DEFAULT_K, power=SPATIAL_IDW_POWER,
+                    max_km=SPATIAL_MAX_DISTANCE_KM):
+        """
+        Inverse-distance-weighted AQI at (lat, lon) from the k nearest
+        sensors with a reading within max_km. None if there are none.
+        """
+        start = time.perf_counter()
+        snapshot = self._snapshot
+        positions, chords = snapshot.tree.query(
+            unit_vectors(lat, lon)[0], k, km_to_chord(max_km), mask=~np.isnan(snapshot.aqi)
+        )
+        if not len(positions):
+            self._record("nearest", start)
+            return None
+
+        distances = chord_to_km(chords)
+        values = snapshot.aqi[positions]
+        if distances[0] < SAME_POINT_KM:
+            weights = (distances < SAME_POINT_KM).astype(np.float64)
+        else:
+            weights = 1.0 / distances ** power
+        weights /= weights.sum()
+        aqi = float(np.dot(weights, values))
+
+        result = {
+            "latitude": lat,
+            "longitude": lon,
+            "aqi": round(aqi, 2),
+            "category": get_category(aqi),
+            "power": power,
+            "sensors": [
+                snapshot.describe(pos) | {
+                    "distance_km": round(float(d), 3),
+                    "weight": round(float(w), 4),
+                }
+                for pos, d, w in zip(positions, distances, weights)
+            ],
+        }
+        self._record("nearest", start)
+        return result
+
+    def within(self, min_lon, min_lat, max_lon, max_lat, limit=SPATIAL_MAX_RESULTS):
+        """
+        Sensors inside the box, at most `limit` of them, and how many matched.
+        min_lon > max_lon means the box crosses the antimeridian.
+        """
+        start = time.perf_counter()
+        snapshot = self._snapshot
+        inside = snapshot.in_box(min_lon, min_lat, max_lon, max_lat)
+        sensors = [snapshot.describe(pos) for pos in np.sort(inside[:limit])]
+        self._record("within", start)
+        return len(inside), sensors
+
+    def readings_within(self, min_lon, min_lat, max_lon, max_lat):
+        """(lat, lon, aqi) arrays of the sensors in the box that have a reading."""
+        snapshot = self._snapshot
+        inside = snapshot.in_box(min_lon, min_lat, max_lon, max_lat)
+        inside = inside[~np.isnan(snapshot.aqi[inside])]
+        return snapshot.lat[inside], snapshot.lon[inside], snapshot.aqi[inside]
+
+    def _record(self, kind, start):
+        if kind == "nearest":
+            self._nearest_queries += 1
+        else:
+            self._within_queries += 1
+        self._query_ms_total += (time.perf_counter() - start) * 1000
+
+    def stats(self):
+        snapshot = self._snapshot
+        queries = self._nearest_queries + self._within_queries
+        return {
+            "loaded": int(snapshot is not None),
+            "sensors": len(snapshot.ids) if snapshot is not None else 0,
+            "sensors_with_aqi": int((~np.isnan(snapshot.aqi)).sum()) if snapshot is not None else 0,
+            "age_s": round(time.monotonic() - self._loaded_at, 1) if snapshot is not None else None,
+            "reload_interval_s": self.reload_interval,
+            "builds": self._builds,
+            "last_build_ms": round(self._build_ms, 2),
+            "build_errors": self._build_errors,
+            "readings_applied": self._readings_applied,
+            "nearest_queries": self._nearest_queries,
+            "within_queries": self._within_queries,
+            "avg_query_ms": round(self._query_ms_total / queries, 4) if queries else 0.0,
+        }
+
+
+class _Snapshot:
+    """One immutable build of the index (only aqi/timestamps change in place)."""
+
+    def __init__(self, rows):
+        self.ids = [r[0] for r in rows]
+        self.codes = [r[1] for r in rows]
+        self.radius = [float(r[4]) if r[4] is not None else 20.0 for r in rows]
+        self.regions = [r[5] for r in rows]
+        self.timestamps = [r[7] for r in rows]
+        self.lat = np.array([r[2] for r in rows], dtype=np.float64).reshape(-1)
+        self.lon = np.array([r[3] for r in rows], dtype=np.float64).reshape(-1)
+        self.aqi = np.array([r[6] for r in rows], dtype=np.float64).reshape(-1)  # None -> nan
+        self.positions = {sensor_id: i for i, sensor_id in enumerate(self.ids)}
+
+        self.tree = KDTree(unit_vectors(self.lat, self.lon))
+        self.by_lat = np.argsort(self.lat, kind="stable")
+        self.lat_sorted = self.lat[self.by_lat]
+
+    def in_box(self, min_lon, min_lat, max_lon, max_lat):
+        """Positions inside the box; min_lon > max_lon wraps across ±180."""
+        a = np.searchsorted(self.lat_sorted, min_lat, side="left")
+        b = np.searchsorted(self.lat_sorted, max_lat, side="right")
+        band = self.by_lat[a:b]
+        lon = self.lon[band]
+        if min_lon <= max_lon:
+            return band[(lon >= min_lon) & (lon <= max_lon)]
+        return band[(lon >= min_lon) | (lon <= max_lon)]
+
+    def changed_since(self, previous):
+        """(lat, lon) of sensors added, removed, moved or with a new AQI since `previous`."""
+        old_ids, new_ids = np.array(previous.ids), np.array(self.ids)
+        _, old_pos, new_pos = np.intersect1d(old_ids, new_ids, assume_unique=True, return_indices=True)
+        old_aqi, new_aqi = previous.aqi[old_pos], self.aqi[new_pos]
+        changed = ((previous.lat[old_pos] != self.lat[new_pos])
+                   | (previous.lon[old_pos] != self.lon[new_pos])
+                   | ((old_aqi != new_aqi) & ~(np.isnan(old_aqi) & np.isnan(new_aqi))))
+
+        removed = np.flatnonzero(~np.isin(old_ids, new_ids))
+        added = np.flatnonzero(~np.isin(new_ids, old_ids))
+        old_side = np.concatenate([old_pos[changed], removed]).astype(np.int64)
+        new_side = np.concatenate([new_pos[changed], added]).astype(np.int64)
+        return (np.concatenate([previous.lat[old_side], self.lat[new_side]]),
+                np.concatenate([previous.lon[old_side], self.lon[new_side]]))
+
+    def describe(self, pos):
+        aqi = self.aqi[pos]
+        return {
+            "sensor_id": self.ids[pos],
+            "sensor_code": self.codes[pos],
+            "latitude": float(self.lat[pos]),
+            "longitude": float(self.lon[pos]),
+            "radius": self.radius[pos],
+            "region": self.regions[pos],
+            "aqi": None if np.isnan(aqi) else float(aqi),
+            "timestamp": self.timestamps[pos],
+        }
+
+
+sensor_index = SensorIndex(SPATIAL_RELOAD_INTERVAL)
@@ -0,0 +1,283 @@
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from app.db import db_pool
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Storage Settings
+# ==============================
+STORAGE_PREMAKE_DAYS = int(os.getenv("STORAGE_PREMAKE_DAYS", "7"))
+STORAGE_RAW_RETENTION_DAYS = int(os.getenv("STORAGE_RAW_RETENTION_DAYS", "30"))
+STORAGE_HOURLY_RETENTION_DAYS = int(os.getenv("STORAGE_HOURLY_RETENTION_DAYS", "365"))
+# Seconds between background maintenance runs inside the API (0 disables)
+STORAGE_MAINTENANCE_INTERVAL = float(os.getenv("STORAGE_MAINTENANCE_INTERVAL", "900"))
+
+# Readings can arrive late (write-behind buffer, slow sensors), so the most
+# recent buckets are left open this long and the last closed bucket is
+# always recomputed on the next run.
+ROLLUP_SETTLE = timedelta(minutes=5)
+ROLLUP_CHUNK = timedelta(days=1)
+
+# Arbitrary key so only one API worker / cron job maintains storage at a time
+MAINTENANCE_LOCK_ID = 7203001
+
+ROLLUP_METRICS = {
+    "aqi": "predicted_aqi",
+    "pm25": "pm25",
+    "pm10": "pm10",
+    "no2": "no2",
+    "co": "co",
+    "so2": "so2",
+    "o3": "o3",
+    "nh3": "nh3",
+}
+
+ROLLUP_COLUMNS = [
+    f"{metric}_{stat}"
+    for metric in ROLLUP_METRICS
+    for stat in ("count", "avg", "min", "max")
+]
+
+
+# ==============================
+# Partitions & Retention
+# ==============================
+def ensure_partitions(cursor, premake_days=STORAGE_PREMAKE_DAYS):
+    cursor.execute("""
+        SELECT create_reading_partition(d::date)
+        FROM generate_series(CURRENT_DATE, CURRENT_DATE + %s, interval '1 day') AS d
+    """, (premake_days,))
+    return [r[0] for r in cursor.fetchall() if r[0]]
+
+
+def drop_expired_partitions(cursor, retention_days=STORAGE_RAW_RETENTION_DAYS):
+    # Never drop raw data the hourly rollup has not absorbed yet
+    cursor.execute("""
+        SELECT LEAST(
+            CURRENT_DATE - %s,
+            COALESCE(
+                (SELECT computed_until::date FROM rollup_watermarks WHERE name = 'hourly'),
+                '-infinity'::date
+            )
+        )
+    """, (retention_days,))
+    cutoff = cursor.fetchone()[0]
+
+    cursor.execute("SELECT drop_reading_partitions_before(%s)", (cutoff,))
+    return [r[0] for r in cursor.fetchall()]
+
+
+def drop_expired_rollups(cursor, retention_days=STORAGE_HOURLY_RETENTION_DAYS):
+    cursor.execute("""
+        DELETE FROM sensor_readings_hourly
+        WHERE bucket < CURRENT_DATE - %s
+    """, (retention_days,))
+    return cursor.rowcount
+
+
+# ==============================
+# Rollups
+# ==============================
+def _get_watermark(cursor, name):
+    cursor.execute("SELECT computed_until FROM rollup_watermarks WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _set_watermark(cursor, name, value):
+    cursor.execute("""
+        INSERT INTO rollup_watermarks (name, computed_until)
+        VALUES (%s, %s)
+        ON CONFLICT (name) DO UPDATE SET computed_until = EXCLUDED.computed_until
+    """, (name, value))
+
+
+def _upsert_sql(table):
+    columns = ["bucket", "sensor_id", "region_id", "reading_count"] + ROLLUP_COLUMNS
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns[2:])
+    return f"""
+        INSERT INTO {table} ({", ".join(columns)})
+        {{select}}
+        ON CONFLICT (bucket, sensor_id) DO UPDATE SET {updates}
+    """
+
+
+def _hourly_select():
+    aggregates = ",\n               ".join(
+        f"COUNT(sr.{col}), AVG(sr.{col}), MIN(sr.{col}), MAX(sr.{col})"
+        for col in ROLLUP_METRICS.values()
+    )
+    return f"""
+        SELECT date_trunc('hour', sr.timestamp), sr.sensor_id, s.region_id, COUNT(*),
+               {aggregates}
+        FROM sensor_readings sr
+        JOIN sensors s ON s.id = sr.sensor_id
+        WHERE sr.timestamp >= %s AND sr.timestamp < %s
+        GROUP BY 1, 2, 3
+    """
+
+
+def _daily_select():
+    # Daily averages are weighted by how many readings each hour had of that metric
+    aggregates = ",\n               ".join(
+        f"SUM({m}_count), SUM({m}_avg * {m}_count) / NULLIF(SUM({m}_count), 0), MIN({m}_min), MAX({m}_max)"
+        for m in ROLLUP_METRICS
+    )
+    return f"""
+        SELECT date_trunc('day', bucket), sensor_id, MAX(region_id), SUM(reading_count),
+               {aggregates}
+        FROM sensor_readings_hourly
+        WHERE bucket >= %s AND bucket < %s
+        GROUP BY 1, 2
+    """
+
+
+HOURLY_UPSERT = _upsert_sql("sensor_readings_hourly").format(select=_hourly_select())
+DAILY_UPSERT = _upsert_sql("sensor_readings_daily").format(select=_daily_select())
+
+
+def refresh_hourly_rollup(conn):
+    """Aggregate raw readings into closed hourly buckets since the watermark."""
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT date_trunc('hour', LOCALTIMESTAMP - %s)", (ROLLUP_SETTLE,))
+    end = cursor.fetchone()[0]
+
+    start = _get_watermark(cursor, "hourly")
+    if start is None:
+        cursor.execute("SELECT date_trunc('hour', MIN(timestamp)) FROM sensor_readings")
+        start = cursor.fetchone()[0] or end
+    else:
+        start = start - timedelta(hours=1)
+
+    buckets = 0
+    while start < end:
+        chunk_end = min(start + ROLLUP_CHUNK, end)
+        cursor.execute(HOURLY_UPSERT, (start, chunk_end))
+        buckets += cursor.rowcount
+        _set_watermark(cursor, "hourly", chunk_end)
+        conn.commit()
+        start = chunk_end
+
+    cursor.close()
+    return buckets
+
+
+def refresh_daily_rollup(conn):
+    """Fold closed days of the hourly rollup into the daily rollup."""
+    cursor = conn.cursor()
+
+    hourly_until = _get_watermark(cursor, "hourly")
+    if hourly_until is None:
+        cursor.close()
+        return 0
+
+    cursor.execute("SELECT date_trunc('day', %s::timestamp)", (hourly_until,))
+    end = cursor.fetchone()[0]
+
+    start = _get_watermark(cursor, "daily")
+    if start is None:
+        cursor.execute("SELECT date_trunc('day', MIN(bucket)) FROM sensor_readings_hourly")
+        start = cursor.fetchone()[0] or end
+    else:
+        start = start - timedelta(days=1)
+
+    buckets = 0
+    if start < end:
+        cursor.execute(DAILY_UPSERT, (start, end))
+        buckets = cursor.rowcount
+        _set_watermark(cursor, "daily", end)
+        conn.commit()
+
+    cursor.close()
+    return buckets
+
+
+# ==============================
+# Maintenance Run
+# ==============================
+def run_maintenance(conn):
+    """
+    One full pass: create upcoming partitions, update rollups, then apply
+    retention. Returns a summary, or None if another process holds the lock.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_try_advisory_lock(%s)", (MAINTENANCE_LOCK_ID,))
+    if not cursor.fetchone()[0]:
+        conn.rollback()
+        cursor.close()
+        return None
+
+    try:
+        start = time.perf_counter()
+
+        created = ensure_partitions(cursor)
+        conn.commit()
+
+        hourly = refresh_hourly_rollup(conn)
+        daily = refresh_daily_rollup(conn)
+
+        dropped = drop_expired_partitions(cursor)
+        pruned = drop_expired_rollups(cursor)
+        conn.commit()
+
+        return {
+            "partitions_created": created,
+            "partitions_dropped": dropped,
+            "hourly_buckets": hourly,
+            "daily_buckets": daily,
+            "hourly_rows_pruned": pruned,
+            "elapsed_s": round(time.perf_counter() - start, 3),
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (MAINTENANCE_LOCK_ID,))
+        conn.commit()
+        cursor.close()
+
+
+class StorageMaintainer:
+    """Background thread that runs run_maintenance() every interval seconds."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_run = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="storage-maintainer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with db_pool.connection() as conn:
+                    summary = run_maintenance(conn)
+                if summary is not None:
+                    self.last_run = summary
+                    logger.info("Storage maintenance: %s", summary)
+            except Exception:
+                logger.exception("Storage maintenance failed")
+
+            self._stop.wait(self.interval)
+
+
+storage_maintainer = StorageMaintainer(STORAGE_MAINTENANCE_INTERVAL)
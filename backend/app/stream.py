@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from app.db import run_with_connection
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Stream Settings
+# ==============================
+STREAM_CLIENT_BUFFER = int(os.getenv("STREAM_CLIENT_BUFFER", "256"))
+STREAM_HEARTBEAT_INTERVAL = float(os.getenv("STREAM_HEARTBEAT_INTERVAL", "15"))
+# Unknown sensor ids trigger at most one sensor->region reload per interval
+SENSOR_MAP_RELOAD_INTERVAL = 5.0
+
+_DROPPED = object()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Not JSON serializable: {type(value)}")
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n"
+
+
+class Subscriber:
+    def __init__(self, region_ids, buffer_size):
+        self.region_ids = set(region_ids) if region_ids else None
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+    def wants(self, region_id):
+        return self.region_ids is None or region_id in self.region_ids
+
+
+class LatestBroadcaster:
+    """
+    Single fan-out point for new readings.
+
+    Writers call publish() from any thread; the fan-out itself runs on the
+    event loop and only does put_nowait on each subscriber's bounded queue.
+    A subscriber whose queue is full is dropped instead of slowing writers.
+    """
+
+    def __init__(self, buffer_size, heartbeat_interval):
+        self.buffer_size = buffer_size
+        self.heartbeat_interval = heartbeat_interval
+
+        self._loop = None
+        self._subscribers = set()
+
+        self._sensor_regions = {}
+        self._sensor_map_lock = threading.Lock()
+        self._sensor_map_loaded_at = 0.0
+        self._sensor_map_stale = False
+        self._sensor_map_reloading = False
+
+        self._events_published = 0
+        self._messages_sent = 0
+        self._clients_dropped = 0
+
+    def attach(self, loop):
+        self._loop = loop
+
+    # ------------------------------
+    # Sensor -> region lookup
+    # ------------------------------
+    # publish() runs on the event loop, so lookups never touch the database:
+    # a miss returns (None, None) and schedules a reload on a worker thread.
+    def reload_sensor_regions(self):
+        def query(conn):
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT s.id, r.id, r.name
+                FROM sensors s
+                JOIN regions r ON r.id = s.region_id
+            """)
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+
+        rows = run_with_connection(query)
+        with self._sensor_map_lock:
+            self._sensor_regions = {r[0]: (r[1], r[2]) for r in rows}
+            self._sensor_map_loaded_at = time.monotonic()
+
+    def schedule_sensor_region_reload(self):
+        with self._sensor_map_lock:
+            self._sensor_map_stale = True
+            if self._sensor_map_reloading:
+                return
+            self._sensor_map_reloading = True
+
+        threading.Thread(target=self._background_reload, name="sensor-region-reload", daemon=True).start()
+
+    def _background_reload(self):
+        # Loop so an invalidation that lands mid-query is not lost
+        while True:
+            with self._sensor_map_lock:
+                if not self._sensor_map_stale:
+                    self._sensor_map_reloading = False
+                    return
+                self._sensor_map_stale = False
+            try:
+                self.reload_sensor_regions()
+            except Exception:
+                logger.exception("Could not load sensor regions for the live stream")
+                self._sensor_map_loaded_at = time.monotonic()
+
+    def invalidate_sensor_regions(self):
+        # Keep serving the current map until the reload lands
+        self.schedule_sensor_region_reload()
+
+    def region_for(self, sensor_id):
+        region = self._sensor_regions.get(sensor_id)
+        if region is None and time.monotonic() - self._sensor_map_loaded_at > SENSOR_MAP_RELOAD_INTERVAL:
+            self._sensor_map_loaded_at = time.monotonic()
+            self.schedule_sensor_region_reload()
+        return region or (None, None)
+
+    # ------------------------------
+    # Publishing
+    # ------------------------------
+    def publish(self, readings):
+        """
+        readings: dicts shaped like /latest items (sensor_id, aqi, category,
+        timestamp, PM2_5 ... NH3). Safe to call from any thread.
+        """
+        if self._loop is None or not self._subscribers or not readings:
+            return
+
+        events = []
+        for reading in readings:
+            region_id, region_name = self.region_for(reading["sensor_id"])
+            events.append((region_id, {**reading, "region": region_name}))
+
+        self._loop.call_soon_threadsafe(self._fan_out, events)
+
+    def _fan_out(self, events):
+        self._events_published += len(events)
+
+        for sub in list(self._subscribers):
+            if sub.dropped:
+                continue
+
+            for region_id, event in events:
+                if not sub.wants(region_id):
+                    continue
+                try:
+                    sub.queue.put_nowait(event)
+                    self._messages_sent += 1
+                except asyncio.QueueFull:
+                    self._drop(sub)
+                    break
+
+    def _drop(self, sub):
+        sub.dropped = True
+        self._clients_dropped += 1
+        # Make room for the sentinel so the client's generator wakes up and ends
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(_DROPPED)
+
+    # ------------------------------
+    # Subscribing
+    # ------------------------------
+    def subscribe(self, region_ids=None):
+        sub = Subscriber(region_ids, self.buffer_size)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self._subscribers.discard(sub)
+
+    def filter_snapshot(self, sub, items):
+        # Loads the sensor map synchronously the first time, so call it off the event loop
+        if sub.region_ids is not None and not self._sensor_regions:
+            try:
+                self.reload_sensor_regions()
+            except Exception:
+                logger.exception("Could not load sensor regions for the live stream")
+        return [item for item in items if sub.wants(self.region_for(item["sensor_id"])[0])]
+
+    async def events(self, sub, request, snapshot=None):
+        """Server-Sent Events generator for one subscriber."""
+        try:
+            if snapshot is not None:
+                yield format_sse("snapshot", snapshot)
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": heartbeat\n\n"
+                    continue
+
+                if event is _DROPPED:
+                    yield format_sse("dropped", {"reason": "client too slow, reconnect"})
+                    break
+
+                yield format_sse("reading", event)
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self):
+        return {
+            "subscribers": len(self._subscribers),
+            "client_buffer": self.buffer_size,
+            "heartbeat_interval_s": self.heartbeat_interval,
+            "events_published": self._events_published,
+            "messages_sent": self._messages_sent,
+            "clients_dropped": self._clients_dropped,
+        }
+
+
+broadcaster = LatestBroadcaster(STREAM_CLIENT_BUFFER, STREAM_HEARTBEAT_INTERVAL)
@@ -0,0 +1,467 @@
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from app.spatial import sensor_index, SPATIAL_IDW_POWER, SAME_POINT_KM
+
+logger = logging.getLogger(__name__)
+
+# ==============================
+# Heatmap Tile Settings
+# ==============================
+# Web Mercator z/x/y tiles of the latest AQI, inverse-distance weighted
+# from every sensor within TILE_RADIUS_KM of each sample point.
+TILE_SIZE = 256
+# IDW samples per tile side; the PNG is bilinearly upsampled from them and
+# the .bin grid is exactly this many values per side
+TILE_GRID = int(os.getenv("TILE_GRID", "64"))
+TILE_RADIUS_KM = float(os.getenv("TILE_RADIUS_KM", "25"))
+TILE_MAX_ZOOM = int(os.getenv("TILE_MAX_ZOOM", "16"))
+# More sensors than this around a tile are averaged onto a coarse grid first
+TILE_MAX_POINTS = int(os.getenv("TILE_MAX_POINTS", "1024"))
+TILE_CACHE_MAX_ENTRIES = int(os.getenv("TILE_CACHE_MAX_ENTRIES", "4096"))
+# Cache-Control max-age for tile responses (the map redraws every 30s)
+TILE_MAX_AGE = int(os.getenv("TILE_MAX_AGE", "10"))
+# Seconds between background re-renders of cached tiles that new readings
+# touched (0: drop them instead and render on the next request)
+TILE_REFRESH_INTERVAL = float(os.getenv("TILE_REFRESH_INTERVAL", "2"))
+# Changed points waiting for the next refresh (or tile request) are
+# de-duplicated once there are more than this, so they stay bounded by the
+# number of distinct sensor positions however long nothing applies them
+TILE_PENDING_COMPACT = int(os.getenv("TILE_PENDING_COMPACT", "4096"))
+# Peak heatmap opacity, faded out towards TILE_RADIUS_KM from the nearest sensor
+TILE_OPACITY = float(os.getenv("TILE_OPACITY", "0.6"))
+
+TILE_FORMATS = {"png": "image/png", "bin": "application/octet-stream"}
+# .bin: TILE_GRID x TILE_GRID little-endian uint16 AQI, row-major from the
+# north-west corner; NO_DATA where no sensor is within TILE_RADIUS_KM
+NO_DATA = 65535
+
+MAX_LATITUDE = 85.05112878
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LON = 111.320
+
+# Same colours as the Map View markers, blended between category bounds
+COLOR_STOPS = [0, 50, 100, 200, 300, 400]
+COLORS = np.array([
+    (0x22, 0xc5, 0x5e),  # Good
+    (0x84, 0xcc, 0x16),  # Satisfactory
+    (0xea, 0xb3, 0x08),  # Moderate
+    (0xf9, 0x73, 0x16),  # Poor
+    (0xef, 0x44, 0x44),  # Very Poor
+    (0x9f, 0x12, 0x39),  # Severe
+], dtype=np.float64)
+
+
+# ==============================
+# Tile Geometry
+# ==============================
+def tile_lon(x, n):
+    return np.asarray(x, dtype=np.float64) / n * 360.0 - 180.0
+
+
+def tile_lat(y, n):
+    return np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(y, dtype=np.float64) / n))))
+
+
+def lat_to_tile_y(lat, n):
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    return (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n
+
+
+def lon_radius(lat, km):
+    """Degrees of longitude spanned by `km` at `lat` (capped at 180)."""
+    cos_lat = np.maximum(np.cos(np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))), 1e-6)
+    return np.minimum(km / (KM_PER_DEGREE_LON * cos_lat), 180.0)
+
+
+# ==============================
+# Rendering
+# ==============================
+def _aggregate(lat, lon, aqi, min_lat, max_lat, span_lon, cells):
+    """Mean position and AQI per cell of a cells x cells grid over the box."""
+    row = np.clip(((lat - min_lat) / max(max_lat - min_lat, 1e-9) * cells).astype(np.int64), 0, cells - 1)
+    col = np.clip((lon / max(span_lon, 1e-9) * cells).astype(np.int64), 0, cells - 1)
+    key = row * cells + col
+    counts = np.bincount(key, minlength=cells * cells)
+    used = counts > 0
+    mean = lambda v: (np.bincount(key, weights=v, minlength=cells * cells)[used] / counts[used])
+    return mean(lat), mean(lon), mean(aqi)
+
+
+def render_grid(z, x, y, grid=TILE_GRID, radius_km=TILE_RADIUS_KM, power=SPATIAL_IDW_POWER):
+    """
+    IDW AQI and distance to the nearest sensor at grid x grid sample points
+    (pixel centres, north-west first) of tile z/x/y. None if no sensor with
+    a reading is within radius_km of the tile.
+    """
+    n = 2 ** z
+    centres = (np.arange(grid) + 0.5) / grid
+    sample_lon = tile_lon(x + centres, n)
+    sample_lat = tile_lat(y + centres, n)
+
+    # Sensors that can reach the tile
+    pad_lat = radius_km / KM_PER_DEGREE_LAT
+    min_lat = max(-90.0, float(sample_lat[-1]) - pad_lat)
+    max_lat = min(90.0, float(sample_lat[0]) + pad_lat)
+    pad_lon = float(lon_radius(max(abs(min_lat), abs(max_lat)), radius_km))
+    min_lon = float(tile_lon(x, n)) - pad_lon
+    max_lon = float(tile_lon(x + 1, n)) + pad_lon
+    if max_lon - min_lon >= 360:
+        min_lon, max_lon = -180.0, 180.0
+    wrapped_min = min_lon + 360 if min_lon < -180 else min_lon
+    wrapped_max = max_lon - 360 if max_lon > 180 else max_lon
+
+    lat, lon, aqi = sensor_index.readings_within(wrapped_min, min_lat, wrapped_max, max_lat)
+    if not len(aqi):
+        return None
+
+    # Longitudes relative to the box's west edge, so boxes across ±180 need no special case
+    lon = (lon - min_lon) % 360
+    sample_lon = (sample_lon - min_lon) % 360
+    if len(aqi) > TILE_MAX_POINTS:
+        lat, lon, aqi = _aggregate(lat, lon, aqi, min_lat, max_lat, max_lon - min_lon,
+                                   int(math.sqrt(TILE_MAX_POINTS)))
+
+    values = np.full((grid, grid), np.nan)
+    nearest = np.full((grid, grid), np.inf)
+    for i, row_lat in enumerate(sample_lat):
+        # Equirectangular distances around each sample row: fine at tile scale
+        dy = (row_lat - lat) * KM_PER_DEGREE_LAT
+        dx = (sample_lon[None, :] - lon[:, None]) * (KM_PER_DEGREE_LON * math.cos(math.radians(row_lat)))
+        dist = np.sqrt(dx * dx + (dy * dy)[:, None])
+        weights = np.where(dist <= radius_km, np.maximum(dist, SAME_POINT_KM) ** -power, 0.0)
+        total = weights.sum(axis=0)
+        reached = total > 0
+        values[i, reached] = (weights[:, reached] * aqi[:, None]).sum(axis=0) / total[reached]
+        nearest[i] = dist.min(axis=0)
+
+    return values, nearest
+
+
+def _upsample_matrix(grid, size):
+    """(size, grid) bilinear interpolation weights from sample centres to pixel centres."""
+    t = np.clip((np.arange(size) + 0.5) * grid / size - 0.5, 0, grid - 1)
+    i0 = np.minimum(t.astype(np.int64), grid - 2) if grid > 1 else np.zeros(size, dtype=np.int64)
+    frac = t - i0
+    matrix = np.zeros((size, grid))
+    matrix[np.arange(size), i0] = 1 - frac
+    if grid > 1:
+        matrix[np.arange(size), i0 + 1] += frac
+    return matrix
+
+
+_UPSAMPLE = _upsample_matrix(TILE_GRID, TILE_SIZE)
+
+
+def colorize(values, nearest, radius_km=TILE_RADIUS_KM):
+    """TILE_SIZE x TILE_SIZE x 4 uint8 RGBA for a rendered grid."""
+    filled = np.nan_to_num(values)
+    rgb = np.stack([np.interp(filled, COLOR_STOPS, COLORS[:, c]) for c in range(3)], axis=-1)
+    alpha = TILE_OPACITY * np.clip(1 - (nearest / radius_km) ** 2, 0, 1)
+    alpha[np.isnan(values)] = 0
+
+    # Premultiplied, so transparent samples do not bleed their colour when upsampled
+    premultiplied = np.concatenate([rgb * alpha[..., None], alpha[..., None]], axis=-1)
+    up = np.einsum("pi,ijc,qj->pqc", _UPSAMPLE, premultiplied, _UPSAMPLE, optimize=True)
+    alpha_up = np.clip(up[..., 3], 0, 1)
+    rgb_up = up[..., :3] / np.maximum(alpha_up, 1e-9)[..., None]
+    return np.concatenate([np.clip(rgb_up, 0, 255), alpha_up[..., None] * 255], axis=-1).round().astype(np.uint8)
+
+
+def encode_png(rgba):
+    height, width = rgba.shape[:2]
+    # Filter type 0 (None) before every row
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)]).tobytes()
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+
+def encode_grid(values):
+    out = np.full(values.shape, NO_DATA, dtype="<u2")
+    scored = ~np.isnan(values)
+    out[scored] = np.clip(np.round(values[scored]), 0, NO_DATA - 1)
+    return out.tobytes()
+
+
+EMPTY_PNG = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+EMPTY_GRID = np.full((TILE_GRID, TILE_GRID), NO_DATA, dtype="<u2").tobytes()
+
+
+def _etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+class _Tile:
+    """One rendered tile; formats are encoded on first request."""
+
+    def __init__(self, grid):
+        self.grid = grid  # (values, nearest) or None when empty
+        self.bodies = {}
+        self._encode_lock = threading.Lock()
+
+    def body(self, fmt):
+        encoded = self.bodies.get(fmt)
+        if encoded is not None:
+            return encoded
+        # Per tile, so one slow encode never holds up other tiles
+        with self._encode_lock:
+            encoded = self.bodies.get(fmt)
+            if encoded is None:
+                if fmt == "png":
+                    body = encode_png(colorize(*self.grid)) if self.grid is not None else EMPTY_PNG
+                else:
+                    body = encode_grid(self.grid[0]) if self.grid is not None else EMPTY_GRID
+                encoded = self.bodies[fmt] = (body, _etag(body))
+        return encoded
+
+
+# ==============================
+# Tile Cache
+# ==============================
+class TileCache:
+    """
+    LRU of rendered heatmap tiles.
+
+    The spatial index reports where sensors changed (new readings, admin
+    edits, reloads). Only cached tiles within TILE_RADIUS_KM of those
+    points are affected: a background thread re-renders them every
+    TILE_REFRESH_INTERVAL seconds, so viewers keep getting cached tiles,
+    and every other tile is left alone. Concurrent misses for the same
+    tile share one render.
+    """
+
+    def __init__(self, max_entries, refresh_interval):
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (z, x, y) -> _Tile
+        self._inflight = {}
+        self._pending_lat = []
+        self._pending_lon = []
+        self._pending_count = 0
+        self._compact_at = TILE_PENDING_COMPACT
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._renders = 0
+        self._render_ms = 0.0
+        self._rerendered = 0
+        self._dropped = 0
+        self._evictions = 0
+
+    def start(self):
+        if self.refresh_interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="tile-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def mark(self, lat, lon):
+        """Spatial index listener: sensors at these points changed."""
+        with self._lock:
+            if self._entries or self._inflight:
+                lat = np.asarray(lat, dtype=np.float64).ravel()
+                self._pending_lat.append(lat)
+                self._pending_lon.append(np.asarray(lon, dtype=np.float64).ravel())
+                self._pending_count += len(lat)
+                if self._pending_count > self._compact_at:
+                    self._compact_pending()
+
+    def _compact_pending(self):
+        # Caller holds self._lock
+        points = np.unique(np.column_stack([np.concatenate(self._pending_lat),
+                                            np.concatenate(self._pending_lon)]), axis=0)
+        self._pending_lat, self._pending_lon = [points[:, 0]], [points[:, 1]]
+        self._pending_count = len(points)
+        # Amortized: the next compaction waits for as many new points again
+        self._compact_at = max(TILE_PENDING_COMPACT, 2 * len(points))
+
+    def _take_pending(self):
+        # Caller holds self._lock
+        lat, lon = self._pending_lat, self._pending_lon
+        self._pending_lat, self._pending_lon = [], []
+        self._pending_count = 0
+        self._compact_at = TILE_PENDING_COMPACT
+        return lat, lon
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._take_pending()
+
+    # ------------------------------
+    # Lookups
+    # ------------------------------
+    def get(self, z, x, y, fmt):
+        """(body, etag) of tile z/x/y in fmt ("png" or "bin")."""
+        if self._thread is None:
+            self._apply_pending(rerender=False)
+
+        key = (z, x, y)
+        with self._lock:
+            tile = self._entries.get(key)
+            if tile is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+            else:
+                waiter = self._inflight.get(key)
+                owner = waiter is None
+                if owner:
+                    waiter = self._inflight[key] = threading.Event()
+                    self._misses += 1
+                else:
+                    self._coalesced += 1
+
+        # Encode outside the cache lock; a _Tile serializes its own encodes
+        if tile is not None:
+            return tile.body(fmt)
+
+        if not owner:
+            waiter.wait()
+            with self._lock:
+                tile = self._entries.get(key)
+            if tile is not None:
+                return tile.body(fmt)
+            # The owner's render failed; render without caching
+            return _Tile(render_grid(z, x, y)).body(fmt)
+
+        try:
+            tile = self._render(key)
+            self._store(key, tile)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            waiter.set()
+        return tile.body(fmt)
+
+    def _render(self, key):
+        start = time.perf_counter()
+        tile = _Tile(render_grid(*key))
+        with self._lock:
+            self._renders += 1
+            self._render_ms += (time.perf_counter() - start) * 1000
+        return tile
+
+    def _store(self, key, tile):
+        with self._lock:
+            self._entries[key] = tile
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    # ------------------------------
+    # Touched tiles
+    # ------------------------------
+    def _touched(self, keys, lat, lon):
+        """The keys whose tile (plus TILE_RADIUS_KM) contains any of the points."""
+        keys = np.array(keys, dtype=np.int64)
+        pad_lat = TILE_RADIUS_KM / KM_PER_DEGREE_LAT
+        pad_lon = lon_radius(lat, TILE_RADIUS_KM)
+        touched = np.zeros(len(keys), dtype=bool)
+
+        for z in np.unique(keys[:, 0]):
+            at_zoom = np.flatnonzero(keys[:, 0] == z)
+            n = 2 ** int(z)
+            x0 = (lon - pad_lon + 180) / 360 * n
+            x1 = (lon + pad_lon + 180) / 360 * n
+            y0 = lat_to_tile_y(lat + pad_lat, n)
+            y1 = lat_to_tile_y(lat - pad_lat, n)
+            kx = keys[at_zoom, 1][:, None]
+            ky = keys[at_zoom, 2][:, None]
+            # Bounded (keys x points) blocks
+            for start in range(0, len(lat), 4096):
+                block = slice(start, start + 4096)
+                hit = ((kx <= x1[block]) & (kx + 1 >= x0[block])
+                       & (ky <= y1[block]) & (ky + 1 >= y0[block])).any(axis=1)
+                touched[at_zoom] |= hit
+
+        return [tuple(int(v) for v in k) for k in keys[touched]]
+
+    def _apply_pending(self, rerender):
+        with self._lock:
+            if not self._pending_lat:
+                return
+            lat, lon = self._take_pending()
+            lat, lon = np.concatenate(lat), np.concatenate(lon)
+            keys = list(self._entries)
+        if not keys:
+            return
+
+        touched = self._touched(keys, lat, lon)
+        if not rerender:
+            with self._lock:
+                for key in touched:
+                    if self._entries.pop(key, None) is not None:
+                        self._dropped += 1
+            return
+
+        for key in touched:
+            with self._lock:
+                old = self._entries.get(key)
+            if old is None:
+                continue
+            tile = self._render(key)
+            # Encode what was being served, so requests get finished bytes
+            for fmt in list(old.bodies):
+                tile.body(fmt)
+            with self._lock:
+                # Skip tiles evicted while rendering
+                if key in self._entries:
+                    self._entries[key] = tile
+                    self._rerendered += 1
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self._apply_pending(rerender=True)
+            except Exception:
+                logger.exception("Re-rendering touched heatmap tiles failed")
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses + self._coalesced
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "renders": self._renders,
+                "avg_render_ms": round(self._render_ms / self._renders, 2) if self._renders else 0.0,
+                "rerendered": self._rerendered,
+                "dropped": self._dropped,
+                "evictions": self._evictions,
+                "pending_points": self._pending_count,
+                "refresh_interval_s": self.refresh_interval,
+            }
+
+
+tile_cache = TileCache(TILE_CACHE_MAX_ENTRIES, TILE_REFRESH_INTERVAL)
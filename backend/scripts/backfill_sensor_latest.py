@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import get_connection
+
+# =====================================
+# Backfill sensor_latest from sensor_readings
+# =====================================
+# One-shot: safe to run while the API is ingesting, the upsert only
+# replaces a row when the backfilled reading is at least as new.
+
+BACKFILL_SQL = """
+    INSERT INTO sensor_latest
+        (sensor_id, reading_id, timestamp, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category)
+    SELECT DISTINCT ON (sensor_id)
+        sensor_id, id, timestamp, pm25, pm10, no2, co, so2, o3, nh3, predicted_aqi, category
+    FROM sensor_readings
+    WHERE sensor_id IS NOT NULL AND timestamp IS NOT NULL
+    ORDER BY sensor_id, timestamp DESC, id DESC
+    ON CONFLICT (sensor_id) DO UPDATE SET
+        reading_id = EXCLUDED.reading_id,
+        timestamp = EXCLUDED.timestamp,
+        pm25 = EXCLUDED.pm25,
+        pm10 = EXCLUDED.pm10,
+        no2 = EXCLUDED.no2,
+        co = EXCLUDED.co,
+        so2 = EXCLUDED.so2,
+        o3 = EXCLUDED.o3,
+        nh3 = EXCLUDED.nh3,
+        predicted_aqi = EXCLUDED.predicted_aqi,
+        category = EXCLUDED.category
+    WHERE sensor_latest.timestamp <= EXCLUDED.timestamp
+"""
+
+conn = get_connection()
+cursor = conn.cursor()
+
+cursor.execute("SELECT to_regclass('sensor_latest')")
+if cursor.fetchone()[0] is None:
+    print("sensor_latest does not exist. Apply the sensor_latest section of app/database/schema.sql first.")
+    sys.exit(1)
+
+print("Backfilling sensor_latest...")
+start = time.time()
+
+cursor.execute(BACKFILL_SQL)
+updated = cursor.rowcount
+conn.commit()
+
+cursor.execute("SELECT COUNT(*) FROM sensor_latest")
+total = cursor.fetchone()[0]
+
+cursor.close()
+conn.close()
+
+print(f"Upserted {updated} sensors in {time.time() - start:.2f}s ({total} rows in sensor_latest)")
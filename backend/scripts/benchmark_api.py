@@ -0,0 +1,147 @@
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import requests
+
+# =====================================
+# Concurrency benchmark for the API
+# =====================================
+# Start the API once with ASYNC_DB=true and once with ASYNC_DB=false, run
+# this against each with the same arguments, and compare p50/p99.
+#
+#   python scripts/benchmark_api.py --url http://localhost:8000 --concurrency 64 --duration 30
+
+ENDPOINTS = {
+    "latest": ("GET", "/latest"),
+    "top_polluted": ("GET", "/top-polluted"),
+    "history": ("GET", "/history/1?hours=1"),
+    "predict": ("POST", "/predict"),
+}
+
+
+def reading_payload():
+    now = datetime.now()
+    return {
+        "sensor_id": random.randint(1, 10),
+        "PM2_5": random.uniform(10, 300),
+        "PM10": random.uniform(20, 400),
+        "NO2": random.uniform(5, 100),
+        "CO": random.uniform(0.1, 5),
+        "SO2": random.uniform(1, 50),
+        "O3": random.uniform(5, 120),
+        "NH3": random.uniform(1, 60),
+        "hour": now.hour,
+        "day": now.day,
+        "month": now.month,
+        "weekday": now.weekday()
+    }
+
+
+def worker(base_url, names, deadline, results, lock):
+    session = requests.Session()
+    local = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+
+    while time.perf_counter() < deadline:
+        name = random.choice(names)
+        method, path = ENDPOINTS[name]
+
+        start = time.perf_counter()
+        try:
+            if method == "POST":
+                response = session.post(base_url + path, json=reading_payload(), timeout=30)
+            else:
+                response = session.get(base_url + path, timeout=30)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        if ok:
+            local[name].append(elapsed_ms)
+        else:
+            errors[name] += 1
+
+    with lock:
+        for name in names:
+            results[name]["latencies"].extend(local[name])
+            results[name]["errors"] += errors[name]
+
+
+def summarize(latencies, errors, duration):
+    if not latencies:
+        return {"requests": 0, "errors": errors}
+    values = np.asarray(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rps": round(len(values) / duration, 1),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "max_ms": round(float(values.max()), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API latency under concurrent load")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        help="comma-separated subset of: " + ", ".join(ENDPOINTS))
+    parser.add_argument("--label", default="", help="e.g. async or sync, copied into the report")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.endpoints.split(",") if n.strip()]
+    base_url = args.url.rstrip("/")
+
+    results = {name: {"latencies": [], "errors": 0} for name in names}
+    lock = threading.Lock()
+
+    print(f"Running {args.concurrency} clients for {args.duration}s against {base_url} ({', '.join(names)})")
+    start = time.perf_counter()
+    deadline = start + args.duration
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for _ in range(args.concurrency):
+            pool.submit(worker, base_url, names, deadline, results, lock)
+
+    duration = time.perf_counter() - start
+
+    report = {
+        "label": args.label,
+        "url": base_url,
+        "concurrency": args.concurrency,
+        "duration_s": round(duration, 2),
+        "endpoints": {
+            name: summarize(r["latencies"], r["errors"], duration)
+            for name, r in results.items()
+        },
+        "overall": summarize(
+            [v for r in results.values() for v in r["latencies"]],
+            sum(r["errors"] for r in results.values()),
+            duration
+        ),
+    }
+
+    print(f"\n{'endpoint':<14}{'requests':>10}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in list(report["endpoints"].items()) + [("overall", report["overall"])]:
+        print(f"{name:<14}{row['requests']:>10}{row['errors']:>8}{row.get('rps', 0):>9}"
+              f"{row.get('p50_ms', 0):>10}{row.get('p95_ms', 0):>10}{row.get('p99_ms', 0):>10}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
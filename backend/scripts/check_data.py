@@ -1,12 +1,12 @@
-import pandas as pd
+import os
+import sys
 
-# =====================================
-# Path
-# =====================================
-DATA_PATH = "data/processed/clean_air_quality.csv"
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dataset import load_dataset
 
 print("Loading dataset...")
-df = pd.read_csv(DATA_PATH)
+df = load_dataset()
 
 # =====================================
 # Basic Info
@@ -38,8 +38,6 @@ print("Duplicate rows:", duplicates)
 # Datetime Check
 # =====================================
 if "Datetime" in df.columns:
-    df["Datetime"] = pd.to_datetime(df["Datetime"], errors="coerce")
-    
     print("\n===== DATETIME RANGE =====")
     print("Start:", df["Datetime"].min())
     print("End:", df["Datetime"].max())
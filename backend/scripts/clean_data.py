@@ -1,23 +1,48 @@
-import pandas as pd
-import numpy as np
+import argparse
 import os
+import pickle
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dataset import DatasetWriter, DATASET_DIR, COLUMNS, LEGACY_CSV_PATH, add_derived_columns
+
+# =====================================
+# Streaming cleaner for the raw station dump
+# =====================================
+# Reads the input in chunks, cleans each chunk, writes it as a sorted run
+# to a temp directory, then k-way merges the runs on Datetime into the
+# month-partitioned Parquet dataset described in app/dataset.py. Peak
+# memory depends on --chunksize and --merge-rows, not on the size of the
+# input.
+#
+#   python scripts/clean_data.py --chunksize 250000
+#   python scripts/clean_data.py --csv   # also write the old CSV
 
 # =====================================
 # Paths
 # =====================================
 INPUT_PATH = "data/raw/station_hour.csv"
-OUTPUT_DIR = "data/processed"
-OUTPUT_PATH = os.path.join(OUTPUT_DIR, "clean_air_quality.csv")
-
-os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-print("Loading raw dataset...")
-df = pd.read_csv(INPUT_PATH)
-
-print("Original shape:", df.shape)
+CHUNK_SIZE = 250_000
+# Rows buffered across all runs during the merge
+MERGE_ROWS = 250_000
+# Runs merged at once; more runs are merged in several passes
+MAX_FAN_IN = 64
+MIN_BLOCK_ROWS = 1_000
 
 # =====================================
-# Required Columns (Improved)
+# Required Columns
 # =====================================
 required_columns = [
     "StationId",
@@ -32,25 +57,6 @@ required_columns = [
     "AQI"
 ]
 
-# Keep only required columns
-df = df[required_columns]
-
-print("After column selection:", df.shape)
-
-# =====================================
-# Datetime Cleaning
-# =====================================
-df["Datetime"] = pd.to_datetime(df["Datetime"], errors="coerce")
-
-# Remove invalid datetime rows
-df = df.dropna(subset=["Datetime"])
-
-# Extract hour
-df["hour"] = df["Datetime"].dt.hour
-
-# =====================================
-# Convert numeric columns
-# =====================================
 numeric_cols = [
     "PM2.5",
     "PM10",
@@ -62,42 +68,231 @@ numeric_cols = [
     "AQI"
 ]
 
-for col in numeric_cols:
-    df[col] = pd.to_numeric(df[col], errors="coerce")
+# Pollutants are parsed as they come (a stray string makes a column object)
+# and narrowed to float32 per chunk
+READ_DTYPES = {"StationId": "category", "Datetime": "string"}
+# Fixed, so every chunk parses the same way instead of guessing per chunk
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
-# Remove rows with missing values
-df = df.dropna()
+# Upper bounds of realistic values (exclusive); all values must be >= 0
+OUTLIER_LIMITS = {
+    "PM2.5": 500,
+    "PM10": 800,
+    "NO2": 300,
+    "CO": 10,
+    "SO2": 200,
+    "O3": 300,
+    "NH3": 200,
+    "AQI": 600
+}
 
-print("After removing missing values:", df.shape)
 
 # =====================================
-# Remove unrealistic values (Outliers)
+# Per-chunk Cleaning
 # =====================================
-df = df[
-    (df["PM2.5"] >= 0) & (df["PM2.5"] < 500) &
-    (df["PM10"] >= 0) & (df["PM10"] < 800) &
-    (df["NO2"] >= 0) & (df["NO2"] < 300) &
-    (df["CO"] >= 0) & (df["CO"] < 10) &
-    (df["SO2"] >= 0) & (df["SO2"] < 200) &
-    (df["O3"] >= 0) & (df["O3"] < 300) &
-    (df["NH3"] >= 0) & (df["NH3"] < 200) &
-    (df["AQI"] >= 0) & (df["AQI"] < 600)
-]
+def clean_chunk(df, counts):
+    counts["read"] += len(df)
 
-print("After outlier removal:", df.shape)
+    # Datetime cleaning
+    df["Datetime"] = pd.to_datetime(df["Datetime"], format=DATETIME_FORMAT, errors="coerce")
+    df = df.dropna(subset=["Datetime"])
+    counts["valid_datetime"] += len(df)
+
+    # Convert numeric columns to compact floats
+    for col in numeric_cols:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float32)
+
+    # Remove rows with missing values
+    df = df.dropna()
+    counts["complete"] += len(df)
+
+    # Remove unrealistic values (outliers)
+    mask = np.ones(len(df), dtype=bool)
+    for col, limit in OUTLIER_LIMITS.items():
+        values = df[col].to_numpy()
+        mask &= (values >= 0) & (values < limit)
+    df = df[mask]
+    counts["kept"] += len(df)
+
+    # Stable, so rows with equal timestamps keep their input order
+    return df.sort_values("Datetime", kind="mergesort")
 
-# =====================================
-# Sort Data
-# =====================================
-df = df.sort_values(by="Datetime")
 
 # =====================================
-# Save Clean File
+# Sorted Runs
 # =====================================
-df.to_csv(OUTPUT_PATH, index=False)
+# A run is a file of consecutive pickled DataFrame blocks, each sorted and
+# continuing where the previous block ended. Pickle keeps the compact dtypes
+# and lets the merge read one block at a time.
+def write_run(path, blocks):
+    with open(path, "wb") as f:
+        for block in blocks:
+            if len(block):
+                pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def split_blocks(df, block_rows):
+    for start in range(0, len(df), block_rows):
+        yield df.iloc[start:start + block_rows]
+
+
+def read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def merge_runs(paths, block_rows):
+    """
+    Yield sorted blocks from several sorted runs, holding one block per run.
+
+    Each round emits buffered rows up to the smallest "last timestamp"
+    among the buffers (the cutoff), which no unread row can precede. Rows
+    equal to the cutoff are held back in runs after the one that set it,
+    whose next block may still hold the same timestamp; with the stable
+    sort this keeps ties in input order whatever the chunk size.
+    """
+    readers = [read_run(path) for path in paths]
+    buffers = [next(reader, None) for reader in readers]
+
+    while True:
+        live = [i for i, block in enumerate(buffers) if block is not None]
+        if not live:
+            return
+
+        last = [buffers[i]["Datetime"].iloc[-1] for i in live]
+        cutoff = min(last)
+        first = live[last.index(cutoff)]
+
+        parts = []
+        for i in live:
+            block = buffers[i]
+            side = "right" if i <= first else "left"
+            n = int(block["Datetime"].searchsorted(cutoff, side=side))
+            parts.append(block.iloc[:n])
+            rest = block.iloc[n:]
+            buffers[i] = rest if len(rest) else next(readers[i], None)
+
+        merged = pd.concat(parts, ignore_index=True)
+        merged["StationId"] = merged["StationId"].astype("category")
+        merged = merged.sort_values("Datetime", kind="mergesort")
+        yield from split_blocks(merged, block_rows)
+
+
+def reduce_runs(paths, tmp_dir, merge_rows):
+    """Merge runs in groups of MAX_FAN_IN until one pass can take them all."""
+    generation = 0
+    while len(paths) > MAX_FAN_IN:
+        generation += 1
+        merged_paths = []
+        for g, start in enumerate(range(0, len(paths), MAX_FAN_IN)):
+            group = paths[start:start + MAX_FAN_IN]
+            block_rows = max(MIN_BLOCK_ROWS, merge_rows // len(group))
+            out = os.path.join(tmp_dir, f"merge_{generation}_{g}.pkl")
+            write_run(out, merge_runs(group, block_rows))
+            for path in group:
+                os.remove(path)
+            merged_paths.append(out)
+        print(f"Merge pass {generation}: {len(paths)} runs -> {len(merged_paths)}")
+        paths = merged_paths
+    return paths
+
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is KB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean the raw station dump in bounded memory")
+    parser.add_argument("--input", default=INPUT_PATH)
+    parser.add_argument("--output", default=DATASET_DIR, help="Parquet dataset directory")
+    parser.add_argument("--csv", nargs="?", const=LEGACY_CSV_PATH, default=None,
+                        help=f"also write a single CSV (default path: {LEGACY_CSV_PATH})")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE, help="rows read and cleaned at a time")
+    parser.add_argument("--merge-rows", type=int, default=MERGE_ROWS,
+                        help="rows buffered across all runs while merging")
+    parser.add_argument("--tmp-dir", default=None, help="where sorted runs are spilled (default: system temp)")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.output.rstrip("/\\")) or ".", exist_ok=True)
+    counts = {"read": 0, "valid_datetime": 0, "complete": 0, "kept": 0}
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir, prefix="clean_runs_") as tmp_dir:
+        # =====================================
+        # Pass 1: clean chunks into sorted runs
+        # =====================================
+        print(f"Streaming {args.input} in chunks of {args.chunksize} rows...")
+        runs = []
+        reader = pd.read_csv(args.input, usecols=required_columns, dtype=READ_DTYPES,
+                             chunksize=args.chunksize, low_memory=False)
+        for i, chunk in enumerate(reader):
+            cleaned = clean_chunk(chunk[required_columns], counts)
+            path = os.path.join(tmp_dir, f"run_{i}.pkl")
+            write_run(path, split_blocks(cleaned, args.chunksize))
+            runs.append(path)
+
+            elapsed = time.perf_counter() - start
+            print(f"  chunk {i + 1}: {counts['read']} rows read, {counts['kept']} kept "
+                  f"({counts['read'] / elapsed:,.0f} rows/sec)")
+
+        clean_seconds = time.perf_counter() - start
+
+        print("\nOriginal rows:", counts["read"])
+        print("After datetime cleaning:", counts["valid_datetime"])
+        print("After removing missing values:", counts["complete"])
+        print("After outlier removal:", counts["kept"])
+
+        # =====================================
+        # Pass 2: external merge sort on Datetime
+        # =====================================
+        print(f"\nMerging {len(runs)} sorted runs...")
+        merge_start = time.perf_counter()
+        runs = reduce_runs(runs, tmp_dir, args.merge_rows)
+        block_rows = max(MIN_BLOCK_ROWS, args.merge_rows // max(len(runs), 1))
+
+        writer = DatasetWriter(args.output)
+        csv_file = open(args.csv, "w", newline="") if args.csv else None
+        try:
+            for block in merge_runs(runs, block_rows):
+                writer.write(block)
+                if csv_file is not None:
+                    add_derived_columns(block).to_csv(csv_file, index=False, header=csv_file.tell() == 0,
+                                                      date_format=DATETIME_FORMAT)
+        finally:
+            if csv_file is not None:
+                csv_file.close()
+        writer.close()
+
+        merge_seconds = time.perf_counter() - merge_start
+
+    total_seconds = time.perf_counter() - start
+
+    # =====================================
+    # Report
+    # =====================================
+    written = writer.rows
+    print(f"\nClean dataset saved at: {args.output} ({writer.partitions} monthly partitions)")
+    if args.csv:
+        print("CSV copy saved at:", args.csv)
+    print("Final rows:", written)
+    print(f"Clean pass: {clean_seconds:.1f}s ({counts['read'] / max(clean_seconds, 1e-9):,.0f} rows/sec)")
+    print(f"Merge pass: {merge_seconds:.1f}s ({written / max(merge_seconds, 1e-9):,.0f} rows/sec)")
+    print(f"Total: {total_seconds:.1f}s ({counts['read'] / max(total_seconds, 1e-9):,.0f} rows/sec)")
+
+    peak = peak_memory_mb()
+    if peak is not None:
+        print(f"Peak memory: {peak} MB")
+
+    print("\nColumns:")
+    print(COLUMNS)
 
-print("\nClean dataset saved at:", OUTPUT_PATH)
-print("Final shape:", df.shape)
 
-print("\nColumns:")
-print(df.columns)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import joblib
+
+from app.model_registry import MODEL_DIR, MODEL_FILES, model_registry
+
+# =====================================
+# Convert pickled models to CatBoost .cbm
+# =====================================
+# The API loads <name>.cbm when it exists and falls back to <name>.pkl.
+
+for name, stem in MODEL_FILES.items():
+    pkl_path = os.path.join(MODEL_DIR, f"{stem}.pkl")
+    cbm_path = os.path.join(MODEL_DIR, f"{stem}.cbm")
+
+    if not os.path.exists(pkl_path):
+        print(f"Skipping {name}: {pkl_path} not found")
+        continue
+
+    start = time.time()
+    model = joblib.load(pkl_path)
+    model.save_model(cbm_path, format="cbm")
+    print(f"Wrote {cbm_path} in {time.time() - start:.2f}s")
+
+# Load both formats the way the API does and report the difference
+print("\nLoading through the model registry...")
+model_registry.load_all()
+
+for name, info in model_registry.stats()["models"].items():
+    if not info["loaded"]:
+        print(f"{name}: not loaded ({info.get('missing', 'no model file')})")
+        continue
+    print(f"{name}: {info['format']} {info['size_bytes'] / 1024:.0f} KB, "
+          f"load {info['load_ms']:.1f} ms, warm-up {info['warmup_ms']:.1f} ms")
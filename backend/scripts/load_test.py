@@ -0,0 +1,338 @@
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sensor_simulator import sensors, generate_pollution, get_time_features, get_active_sensors
+
+# =====================================
+# Load test built on the sensor simulator
+# =====================================
+# Simulates N virtual sensors, each sending a reading every --interval
+# seconds (open loop: sends are scheduled, not paced by responses), plus an
+# independent stream of dashboard reads. Latency is measured from each
+# request's scheduled start, so server stalls show up in the tail instead of
+# silently lowering the send rate.
+#
+#   python scripts/load_test.py --sensors 5000 --interval 5 --mode mixed --duration 60 --report reports/run.json
+#   python scripts/load_test.py --compare reports/before.json reports/after.json
+
+READ_ENDPOINTS = ["/latest", "/top-polluted", "/public/sensors", "/history/{region_id}?hours=1", "/forecast"]
+LEVELS = sorted({s["level"] for s in sensors})
+
+# Log-spaced latency buckets from 0.1 ms to 120 s; histograms from every
+# worker process merge by adding counts.
+HISTOGRAM_EDGES_MS = np.logspace(-1, math.log10(120_000), 400)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.rows = defaultdict(int)
+
+    def record(self, name, latency_ms, status, rows=1):
+        self.latencies[name].append(latency_ms)
+        self.statuses[name][str(status)] += 1
+        if isinstance(status, int) and status < 400:
+            self.rows[name] += rows
+
+    def histograms(self):
+        return {
+            name: {
+                "counts": np.histogram(values, bins=np.concatenate(([0], HISTOGRAM_EDGES_MS, [np.inf])))[0].tolist(),
+                "max_ms": float(max(values)),
+                "statuses": dict(self.statuses[name]),
+                "rows": self.rows[name],
+            }
+            for name, values in self.latencies.items()
+        }
+
+
+def reading(sensor_id):
+    level = LEVELS[sensor_id % len(LEVELS)]
+    return {"sensor_id": sensor_id, **generate_pollution(level), **get_time_features()}
+
+
+async def send(client, recorder, name, method, path, scheduled, body=None, rows=1):
+    try:
+        if method == "POST":
+            response = await client.post(path, json=body)
+        else:
+            response = await client.get(path)
+        status = response.status_code
+    except httpx.TimeoutException:
+        status = "timeout"
+    except httpx.HTTPError:
+        status = "error"
+
+    recorder.record(name, (time.perf_counter() - scheduled) * 1000, status, rows)
+
+
+async def virtual_sensor(client, recorder, sensor_id, interval, deadline, inflight):
+    # Spread sensors over the interval so they do not fire in lockstep
+    next_at = time.perf_counter() + random.uniform(0, interval)
+    while next_at < deadline:
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        async with inflight:
+            await send(client, recorder, "predict", "POST", "/predict", next_at, reading(sensor_id))
+        next_at += interval
+
+
+async def gateway(client, recorder, sensor_ids, interval, deadline, inflight):
+    # A gateway forwards one /predict/batch per interval for all of its sensors
+    next_at = time.perf_counter() + random.uniform(0, interval)
+    while next_at < deadline:
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        body = [reading(sid) for sid in sensor_ids]
+        async with inflight:
+            await send(client, recorder, "predict_batch", "POST", "/predict/batch", next_at, body, rows=len(body))
+        next_at += interval
+
+
+async def reader(client, recorder, rate, deadline, region_ids, inflight):
+    # Poisson arrivals at `rate` reads/sec across the read endpoints
+    next_at = time.perf_counter()
+    tasks = set()
+    while True:
+        next_at += random.expovariate(rate)
+        if next_at >= deadline:
+            break
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+        template = random.choice(READ_ENDPOINTS)
+        name = template.split("?")[0].strip("/").split("/")[0].replace("-", "_")
+        path = template.format(region_id=random.choice(region_ids))
+
+        async def one(scheduled=next_at, name=name, path=path):
+            async with inflight:
+                await send(client, recorder, name, "GET", path, scheduled)
+
+        task = asyncio.create_task(one())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def run_worker(config, sensor_ids, read_rate):
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=config["connections"], max_keepalive_connections=config["connections"])
+    inflight = asyncio.Semaphore(config["connections"])
+
+    async with httpx.AsyncClient(base_url=config["url"], limits=limits, timeout=config["timeout"]) as client:
+        deadline = time.perf_counter() + config["duration"]
+        tasks = []
+
+        mode = config["mode"]
+        if mode in ("predict", "mixed"):
+            singles = sensor_ids if mode == "predict" else sensor_ids[: len(sensor_ids) // 2]
+            tasks += [virtual_sensor(client, recorder, sid, config["interval"], deadline, inflight) for sid in singles]
+        if mode in ("batch", "mixed"):
+            batched = sensor_ids if mode == "batch" else sensor_ids[len(sensor_ids) // 2:]
+            size = config["batch_size"]
+            tasks += [
+                gateway(client, recorder, batched[i:i + size], config["interval"], deadline, inflight)
+                for i in range(0, len(batched), size)
+            ]
+        if read_rate > 0:
+            tasks.append(reader(client, recorder, read_rate, deadline, config["region_ids"], inflight))
+
+        await asyncio.gather(*tasks)
+
+    return recorder.histograms()
+
+
+def worker_main(config, sensor_ids, read_rate, out_queue):
+    out_queue.put(asyncio.run(run_worker(config, sensor_ids, read_rate)))
+
+
+# =====================================
+# Reporting
+# =====================================
+def percentile_from_counts(counts, q):
+    total = sum(counts)
+    if total == 0:
+        return None
+    rank = q / 100 * total
+    seen = 0
+    for i, c in enumerate(counts):
+        seen += c
+        if seen >= rank:
+            # Upper edge of the bucket the rank falls in (within ~4%)
+            return round(float(HISTOGRAM_EDGES_MS[min(i, len(HISTOGRAM_EDGES_MS) - 1)]), 3)
+    return round(float(HISTOGRAM_EDGES_MS[-1]), 3)
+
+
+def merge(parts):
+    merged = {}
+    for part in parts:
+        for name, h in part.items():
+            m = merged.setdefault(name, {"counts": [0] * len(h["counts"]), "max_ms": 0.0, "statuses": defaultdict(int), "rows": 0})
+            m["counts"] = [a + b for a, b in zip(m["counts"], h["counts"])]
+            m["max_ms"] = max(m["max_ms"], h["max_ms"])
+            m["rows"] += h["rows"]
+            for status, n in h["statuses"].items():
+                m["statuses"][status] += n
+    return merged
+
+
+def summarize(merged, duration):
+    endpoints = {}
+    for name, h in sorted(merged.items()):
+        requests_total = sum(h["counts"])
+        ok = sum(n for s, n in h["statuses"].items() if s.isdigit() and int(s) < 400)
+        endpoints[name] = {
+            "requests": requests_total,
+            "ok": ok,
+            "errors": requests_total - ok,
+            "statuses": dict(h["statuses"]),
+            "requests_per_sec": round(requests_total / duration, 1),
+            "rows_per_sec": round(h["rows"] / duration, 1),
+            "p50_ms": percentile_from_counts(h["counts"], 50),
+            "p95_ms": percentile_from_counts(h["counts"], 95),
+            "p99_ms": percentile_from_counts(h["counts"], 99),
+            "max_ms": round(h["max_ms"], 3),
+            # Sparse histogram: {bucket upper edge ms: count}
+            "histogram": {
+                f"{HISTOGRAM_EDGES_MS[min(i, len(HISTOGRAM_EDGES_MS) - 1)]:.3f}": c
+                for i, c in enumerate(h["counts"]) if c
+            },
+        }
+    return endpoints
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_table(endpoints):
+    print(f"\n{'endpoint':<16}{'requests':>10}{'errors':>8}{'req/s':>9}{'rows/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, e in endpoints.items():
+        print(f"{name:<16}{e['requests']:>10}{e['errors']:>8}{e['requests_per_sec']:>9}{e['rows_per_sec']:>10}"
+              f"{e['p50_ms'] or 0:>10.2f}{e['p95_ms'] or 0:>10.2f}{e['p99_ms'] or 0:>10.2f}")
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    print(f"\n{'endpoint':<16}{'metric':<18}{'before':>12}{'after':>12}{'change':>10}")
+    for name in sorted(set(before["endpoints"]) | set(after["endpoints"])):
+        b, a = before["endpoints"].get(name, {}), after["endpoints"].get(name, {})
+        for metric in ("requests_per_sec", "rows_per_sec", "p50_ms", "p95_ms", "p99_ms", "errors"):
+            bv, av = b.get(metric), a.get(metric)
+            change = f"{(av - bv) / bv * 100:+.1f}%" if bv and av is not None else ""
+            print(f"{name:<16}{metric:<18}{bv if bv is not None else '-':>12}{av if av is not None else '-':>12}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API with simulated sensors")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--sensors", type=int, default=1000, help="virtual sensors")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between readings per sensor")
+    parser.add_argument("--mode", choices=["predict", "batch", "mixed"], default="predict",
+                        help="one /predict per reading, gateways posting /predict/batch, or half of each")
+    parser.add_argument("--batch-size", type=int, default=100, help="sensors per gateway in batch mode")
+    parser.add_argument("--read-rate", type=float, default=20.0, help="dashboard reads per second")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes sharing the load")
+    parser.add_argument("--connections", type=int, default=500, help="max open connections per process")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--sensor-ids", help="comma-separated real sensor ids to map virtual sensors onto "
+                                             "(default: active sensors from the local database)")
+    parser.add_argument("--region-ids", default="1,2,3,4,5,6,7,8,9,10")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--report", help="write the JSON report to this path")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="diff two reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    # sensor_readings.sensor_id is a foreign key, so virtual sensors reuse real ids
+    if args.sensor_ids:
+        real_ids = [int(x) for x in args.sensor_ids.split(",")]
+    else:
+        real_ids = get_active_sensors()
+    if not real_ids:
+        print("No sensor ids to send readings for.")
+        sys.exit(1)
+
+    virtual_ids = [real_ids[i % len(real_ids)] for i in range(args.sensors)]
+    config = {
+        "url": args.url.rstrip("/"),
+        "mode": args.mode,
+        "interval": args.interval,
+        "batch_size": args.batch_size,
+        "duration": args.duration,
+        "connections": args.connections,
+        "timeout": args.timeout,
+        "region_ids": [int(x) for x in args.region_ids.split(",")],
+    }
+
+    print(f"{args.sensors} virtual sensors every {args.interval}s ({args.sensors / args.interval:.0f} readings/s, "
+          f"mode={args.mode}), {args.read_rate} reads/s, {args.processes} process(es), {args.duration}s")
+
+    start = time.perf_counter()
+    if args.processes <= 1:
+        parts = [asyncio.run(run_worker(config, virtual_ids, args.read_rate))]
+    else:
+        out_queue = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(
+                target=worker_main,
+                args=(config, virtual_ids[i::args.processes], args.read_rate / args.processes, out_queue)
+            )
+            for i in range(args.processes)
+        ]
+        for p in procs:
+            p.start()
+        parts = [out_queue.get() for _ in procs]
+        for p in procs:
+            p.join()
+    duration = time.perf_counter() - start
+
+    endpoints = summarize(merge(parts), duration)
+    print_table(endpoints)
+
+    if args.report:
+        report = {
+            "label": args.label,
+            "commit": git_commit(),
+            "started_at": datetime.now().isoformat(),
+            "duration_s": round(duration, 2),
+            "config": {**config, "sensors": args.sensors, "read_rate": args.read_rate, "processes": args.processes},
+            "endpoints": endpoints,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import get_connection
+from app.storage import run_maintenance
+
+# =====================================
+# One-off storage maintenance (for cron)
+# =====================================
+# Creates upcoming sensor_readings partitions, updates the hourly/daily
+# rollups and applies retention. The API runs the same pass in the
+# background every STORAGE_MAINTENANCE_INTERVAL seconds.
+
+conn = get_connection()
+
+try:
+    summary = run_maintenance(conn)
+finally:
+    conn.close()
+
+if summary is None:
+    print("Another process is running storage maintenance, skipping.")
+    sys.exit(0)
+
+print("Partitions created:", ", ".join(summary["partitions_created"]) or "none")
+print("Partitions dropped:", ", ".join(summary["partitions_dropped"]) or "none")
+print("Hourly buckets updated:", summary["hourly_buckets"])
+print("Daily buckets updated:", summary["daily_buckets"])
+print("Hourly rows pruned:", summary["hourly_rows_pruned"])
+print(f"Done in {summary['elapsed_s']}s")
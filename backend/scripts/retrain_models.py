@@ -0,0 +1,55 @@
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import get_connection
+from app.retrain import run_retraining, RETRAIN_MODE, RETRAIN_WINDOW_HOURS
+
+# =====================================
+# Incremental model retraining (for cron)
+# =====================================
+# Trains on the hourly rollup since the last published retrain, compares the
+# result with the active model on the newest hours and publishes it only
+# if it is better. The API runs the same pass every RETRAIN_INTERVAL seconds.
+#
+#   python scripts/retrain_models.py --mode continue
+#   python scripts/retrain_models.py --mode window --window-hours 72 --dry-run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrain models from recent sensor readings")
+    parser.add_argument("--mode", choices=["continue", "window"], default=RETRAIN_MODE,
+                        help="continue: add trees to the active model; window: train fresh")
+    parser.add_argument("--window-hours", type=float, default=RETRAIN_WINDOW_HOURS,
+                        help="never read hours older than this")
+    parser.add_argument("--candidate", action="store_true",
+                        help="publish as the shadow candidate instead of activating")
+    parser.add_argument("--dry-run", action="store_true", help="evaluate but never publish")
+    args = parser.parse_args()
+
+    conn = get_connection()
+    try:
+        summaries = run_retraining(conn, mode=args.mode, window_hours=args.window_hours,
+                                   publish=not args.dry_run, candidate=args.candidate)
+    finally:
+        conn.close()
+
+    if summaries is None:
+        print("Another process is retraining, skipping.")
+        sys.exit(0)
+
+    for summary in summaries:
+        print(f"{summary['model']} ({summary['mode']}, since {summary['since']}):")
+        if "skipped" in summary:
+            print("  skipped:", summary["skipped"])
+            continue
+        print(f"  rows: {summary['train_rows']} train, {summary['holdout_rows']} holdout")
+        print(f"  holdout RMSE: {summary['baseline_rmse']} active -> {summary['new_rmse']} retrained")
+        print("  published:", summary["published"] or "no")
+        print(f"  done in {summary['elapsed_s']}s")
+
+
+if __name__ == "__main__":
+    main()
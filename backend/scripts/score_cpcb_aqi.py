@@ -0,0 +1,220 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from psycopg2.extras import execute_values
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.aqi_index import POLLUTANTS, CATEGORY_BOUNDS, compute_aqi, get_categories
+from app.dataset import DATASET_DIR, LEGACY_CSV_PATH
+from app.db import get_connection
+
+# =====================================
+# Bulk CPCB sub-index AQI scoring
+# =====================================
+# Scores readings with the breakpoint formula in app/aqi_index.py and
+# compares it with the AQI already stored next to them.
+#
+#   dataset:  the processed dataset vs its AQI column; --output writes the
+#             scored rows as Parquet
+#   readings: sensor_readings vs predicted_aqi, per day (model drift);
+#             --fill-missing sets predicted_aqi/category where they are NULL
+#
+#   python scripts/score_cpcb_aqi.py --source dataset --output data/processed/cpcb_aqi.parquet
+#   python scripts/score_cpcb_aqi.py --source readings --since 2024-01-01 --fill-missing
+
+BATCH_ROWS = 1_000_000
+READINGS_COLUMNS = ["pm25", "pm10", "no2", "co", "so2", "o3", "nh3"]
+
+
+class Comparison:
+    """Running formula-vs-stored AQI totals, overall and per group."""
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, group, formula, stored):
+        scored = ~np.isnan(formula) & ~np.isnan(stored)
+        formula, stored = formula[scored], stored[scored]
+        delta = stored - formula
+        same = (np.searchsorted(CATEGORY_BOUNDS, formula, side="left")
+                == np.searchsorted(CATEGORY_BOUNDS, stored, side="left"))
+        totals = self.groups.setdefault(group, np.zeros(4))
+        totals += (len(delta), delta.sum(), np.abs(delta).sum(), same.sum())
+
+    def rows(self):
+        out = []
+        for group, (n, delta, abs_delta, same) in sorted(self.groups.items()):
+            if n:
+                out.append((group, int(n), delta / n, abs_delta / n, same / n))
+        return out
+
+    def total(self):
+        n, delta, abs_delta, same = sum(self.groups.values(), np.zeros(4))
+        return int(n), (delta / n if n else 0.0), (abs_delta / n if n else 0.0), (same / n if n else 0.0)
+
+
+# =====================================
+# Processed Dataset
+# =====================================
+def dataset_batches(path):
+    columns = ["StationId", "Datetime"] + POLLUTANTS + ["AQI"]
+    if os.path.isdir(path):
+        dataset = ds.dataset(path, format="parquet", partitioning="hive")
+        for batch in dataset.to_batches(columns=columns, batch_size=BATCH_ROWS):
+            yield batch.to_pandas()
+    elif os.path.exists(LEGACY_CSV_PATH):
+        yield from pd.read_csv(LEGACY_CSV_PATH, usecols=columns, chunksize=BATCH_ROWS, parse_dates=["Datetime"])
+    else:
+        sys.exit(f"{path} not found; run scripts/clean_data.py first")
+
+
+def score_dataset(args):
+    comparison = Comparison()
+    writer = None
+    rows = 0
+    score_seconds = 0.0
+
+    for df in dataset_batches(args.dataset):
+        start = time.perf_counter()
+        formula = compute_aqi(df[POLLUTANTS].to_numpy(np.float64))
+        score_seconds += time.perf_counter() - start
+        rows += len(df)
+
+        stored = df["AQI"].to_numpy(np.float64)
+        if args.by_month:
+            months = df["Datetime"].dt.year.to_numpy() * 100 + df["Datetime"].dt.month.to_numpy()
+            for month in np.unique(months):
+                mask = months == month
+                comparison.add(f"{month // 100}-{month % 100:02d}", formula[mask], stored[mask])
+        else:
+            comparison.add("all", formula, stored)
+
+        if args.output:
+            categories = np.array(get_categories(np.nan_to_num(formula)), dtype=object)
+            categories[np.isnan(formula)] = None
+            scored = pd.DataFrame({
+                "StationId": df["StationId"].astype(str),
+                "Datetime": df["Datetime"],
+                "AQI": df["AQI"].astype(np.float32),
+                "cpcb_aqi": formula.astype(np.float32),
+                "cpcb_category": categories,
+            })
+            table = pa.Table.from_pandas(scored, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(args.output, table.schema, compression="zstd")
+            writer.write_table(table)
+
+        print(f"  {rows:,} rows scored ({rows / max(score_seconds, 1e-9):,.0f} rows/sec in compute_aqi)")
+
+    if writer is not None:
+        writer.close()
+        print("Scored rows saved at:", args.output)
+    return comparison, rows, score_seconds
+
+
+# =====================================
+# sensor_readings
+# =====================================
+def score_readings(args):
+    conn = get_connection()
+    comparison = Comparison()
+    rows = 0
+    filled = 0
+    score_seconds = 0.0
+
+    cursor = conn.cursor(name="cpcb_readings")
+    cursor.itersize = BATCH_ROWS
+    cursor.execute(f"""
+        SELECT id, timestamp, {", ".join(READINGS_COLUMNS)}, predicted_aqi
+        FROM sensor_readings
+        WHERE timestamp >= %s AND timestamp < %s
+        ORDER BY timestamp
+    """, (args.since, args.until))
+
+    missing = []
+    while True:
+        batch = cursor.fetchmany(BATCH_ROWS)
+        if not batch:
+            break
+        data = np.array([r[2:] for r in batch], dtype=np.float64)  # None -> nan
+        start = time.perf_counter()
+        formula = compute_aqi(data[:, :len(READINGS_COLUMNS)])
+        score_seconds += time.perf_counter() - start
+        stored = data[:, -1]
+        rows += len(batch)
+
+        days = np.array([r[1].date().isoformat() for r in batch])
+        for day in np.unique(days):
+            mask = days == day
+            comparison.add(day, formula[mask], stored[mask])
+
+        if args.fill_missing:
+            fill = np.isnan(stored) & ~np.isnan(formula)
+            categories = get_categories(formula[fill])
+            missing += [
+                (batch[i][0], batch[i][1], float(formula[i]), category)
+                for i, category in zip(np.flatnonzero(fill), categories)
+            ]
+    cursor.close()
+
+    if missing:
+        # After the named cursor is done: it lives in this same transaction
+        update = conn.cursor()
+        for start in range(0, len(missing), 10_000):
+            execute_values(update, """
+                UPDATE sensor_readings sr
+                SET predicted_aqi = v.aqi, category = v.category
+                FROM (VALUES %s) AS v(id, timestamp, aqi, category)
+                WHERE sr.id = v.id AND sr.timestamp = v.timestamp AND sr.predicted_aqi IS NULL
+            """, missing[start:start + 10_000])
+            filled += update.rowcount
+        update.close()
+    conn.commit()
+    conn.close()
+
+    if args.fill_missing:
+        print(f"Filled predicted_aqi on {filled} readings that had none")
+    return comparison, rows, score_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score readings with the CPCB sub-index AQI formula")
+    parser.add_argument("--source", choices=["dataset", "readings"], default="dataset")
+    parser.add_argument("--dataset", default=DATASET_DIR, help="processed dataset directory")
+    parser.add_argument("--output", default=None, help="dataset only: write scored rows to this Parquet file")
+    parser.add_argument("--by-month", action="store_true", help="dataset only: compare per month")
+    parser.add_argument("--since", default="1970-01-01", help="readings only")
+    parser.add_argument("--until", default="9999-12-31", help="readings only")
+    parser.add_argument("--fill-missing", action="store_true",
+                        help="readings only: store the formula AQI where predicted_aqi is NULL")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.source == "dataset":
+        comparison, rows, score_seconds = score_dataset(args)
+        stored = "dataset AQI"
+    else:
+        comparison, rows, score_seconds = score_readings(args)
+        stored = "predicted_aqi"
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{'group':<12} {'rows':>10} {'bias':>8} {'MAE':>8} {'same category':>14}")
+    for group, n, bias, mae, same in comparison.rows():
+        print(f"{group:<12} {n:>10} {bias:>8.2f} {mae:>8.2f} {same:>14.1%}")
+
+    n, bias, mae, same = comparison.total()
+    print(f"\n{stored} vs formula over {n:,} scored rows: bias {bias:+.2f}, MAE {mae:.2f}, "
+          f"same category {same:.1%}")
+    print(f"{rows:,} rows in {elapsed:.1f}s; compute_aqi alone {rows / max(score_seconds, 1e-9):,.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,10 @@ import psycopg2
 # =============================
 
 API_URL = "http://127.0.0.1:8000/predict"
+API_BATCH_URL = "http://127.0.0.1:8000/predict/batch"
+
+# Send the whole cycle in one /predict/batch call instead of one request per sensor
+BATCH_MODE = True
 
 DB_CONFIG = {
     "host": "localhost",
@@ -157,44 +161,72 @@ def get_time_features():
 # MAIN LOOP
 # =============================
 
-print("Starting Maharashtra Sensor Network...\n")
+def run_simulation():
+    print("Starting Maharashtra Sensor Network...\n")
 
-while True:
+    while True:
 
-    try:
-        active_sensors = get_active_sensors()
-    except Exception as e:
-        print("Database error:", e)
-        time.sleep(5)
-        continue
+        try:
+            active_sensors = get_active_sensors()
+        except Exception as e:
+            print("Database error:", e)
+            time.sleep(5)
+            continue
 
-    for sensor in sensors:
+        cycle = []
 
-        # Skip inactive sensors
-        if sensor["sensor_id"] not in active_sensors:
-            continue
+        for sensor in sensors:
 
-        pollution = generate_pollution(sensor["level"])
-        time_data = get_time_features()
+            # Skip inactive sensors
+            if sensor["sensor_id"] not in active_sensors:
+                continue
 
-        payload = {
-            "sensor_id": sensor["sensor_id"],
-            **pollution,
-            **time_data
-        }
+            pollution = generate_pollution(sensor["level"])
+            time_data = get_time_features()
 
-        try:
-            response = requests.post(API_URL, json=payload)
-            result = response.json()
+            payload = {
+                "sensor_id": sensor["sensor_id"],
+                **pollution,
+                **time_data
+            }
 
-            print(
-                f"Sensor {sensor['sensor_id']} | "
-                f"{sensor['region']} | Level: {sensor['level']} | "
-                f"AQI: {result['predicted_AQI']} | {result['category']}"
-            )
+            cycle.append((sensor, payload))
+
+        if BATCH_MODE and cycle:
+            try:
+                response = requests.post(API_BATCH_URL, json=[payload for _, payload in cycle])
+                batch = response.json()
+
+                for (sensor, _), result in zip(cycle, batch["results"]):
+                    print(
+                        f"Sensor {sensor['sensor_id']} | "
+                        f"{sensor['region']} | Level: {sensor['level']} | "
+                        f"AQI: {result['predicted_AQI']} | {result['category']}"
+                    )
+
+                print(f"Batch of {batch['count']} scored at {batch['rows_per_sec']} rows/sec")
+
+            except Exception as e:
+                print(f"API error for batch of {len(cycle)} sensors: {e}")
+
+        else:
+            for sensor, payload in cycle:
+                try:
+                    response = requests.post(API_URL, json=payload)
+                    result = response.json()
+
+                    print(
+                        f"Sensor {sensor['sensor_id']} | "
+                        f"{sensor['region']} | Level: {sensor['level']} | "
+                        f"AQI: {result['predicted_AQI']} | {result['category']}"
+                    )
+
+                except Exception as e:
+                    print(f"API error for sensor {sensor['sensor_id']}: {e}")
+
+        print("---- Next cycle in 5 seconds ----\n")
+        time.sleep(5)
 
-        except Exception as e:
-            print(f"API error for sensor {sensor['sensor_id']}: {e}")
 
-    print("---- Next cycle in 5 seconds ----\n")
-    time.sleep(5)
\ No newline at end of file
+if __name__ == "__main__":
+    run_simulation()
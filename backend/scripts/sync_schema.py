@@ -0,0 +1,75 @@
+import argparse
+import os
+import re
+import sys
+
+# =====================================
+# Keep the migration's DDL in step with schema.sql
+# =====================================
+# schema.sql is the one place the partitioned sensor_readings table, its
+# partition functions and the rollup tables are defined. Blocks between
+#   -- >>> shared:<name> ...   and   -- <<< shared:<name>
+# are copied from it into the migrations listed below.
+#
+#   python scripts/sync_schema.py          # rewrite the copies
+#   python scripts/sync_schema.py --check  # exit 1 if any copy has drifted
+
+DATABASE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "database")
+SOURCE = os.path.join(DATABASE_DIR, "schema.sql")
+TARGETS = [os.path.join(DATABASE_DIR, "migrations", "partition_sensor_readings.sql")]
+
+BLOCK = re.compile(r"^(-- >>> shared:(\S+)[^\n]*\n)(.*?)(^-- <<< shared:\2$)", re.M | re.S)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def shared_blocks(text):
+    blocks = {}
+    for match in BLOCK.finditer(text):
+        blocks[match.group(2)] = match.group(3)
+    return blocks
+
+
+def synced(text, blocks, path):
+    """text with every shared block replaced by the schema.sql version."""
+    missing = set(shared_blocks(text)) - set(blocks)
+    if missing:
+        raise SystemExit(f"{path}: shared blocks not in schema.sql: {', '.join(sorted(missing))}")
+    return BLOCK.sub(lambda m: m.group(1) + blocks[m.group(2)] + m.group(4), text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy shared DDL blocks from schema.sql into migrations")
+    parser.add_argument("--check", action="store_true", help="only report drift, exit 1 if any")
+    args = parser.parse_args()
+
+    blocks = shared_blocks(read(SOURCE))
+    drifted = []
+
+    for path in TARGETS:
+        text = read(path)
+        if not shared_blocks(text):
+            raise SystemExit(f"{path}: no shared blocks found")
+        updated = synced(text, blocks, path)
+        if updated == text:
+            continue
+        drifted.append(os.path.relpath(path, DATABASE_DIR))
+        if not args.check:
+            with open(path, "w") as f:
+                f.write(updated)
+
+    if not drifted:
+        print("Migrations match schema.sql")
+    elif args.check:
+        print("Out of sync with schema.sql:", ", ".join(drifted))
+        print("Run python scripts/sync_schema.py to update them.")
+        sys.exit(1)
+    else:
+        print("Updated:", ", ".join(drifted))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,91 @@
-import pandas as pd
+import argparse
+import os
+import sys
+import time
 import numpy as np
 from catboost import CatBoostRegressor
 import joblib
 
-print("Loading dataset...")
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-df = pd.read_csv("data/processed/clean_air_quality.csv")
+from app.dataset import load_dataset
+from app.features import FeatureSpec, DEFAULT_LAGS, FEATURE_WORKERS, build_training_frame
+from app.model_registry import publish_model
 
-# Convert datetime
-df["Datetime"] = pd.to_datetime(df["Datetime"])
 
-# Sort by station and time
-df = df.sort_values(["StationId", "Datetime"])
+def int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
 
-print("Creating lag features...")
 
-# Create lag features per station
-lags = [1, 2, 3, 6]   # last 1,2,3,6 hours
+def main():
+    parser = argparse.ArgumentParser(description="Train the recursive AQI forecast model")
+    parser.add_argument("--lags", type=int_list, default=list(DEFAULT_LAGS), help="e.g. 1,2,3,6,12,24")
+    parser.add_argument("--rolling", type=int_list, default=[], help="rolling mean/std windows, e.g. 3,6,24")
+    parser.add_argument("--time-of-day", action="store_true", help="add hour-of-day features")
+    parser.add_argument("--workers", type=int, default=FEATURE_WORKERS, help="feature-building threads")
+    parser.add_argument("--candidate", action="store_true",
+                        help="publish as the shadow candidate instead of activating")
+    args = parser.parse_args()
 
-for lag in lags:
-    df[f"AQI_lag_{lag}"] = df.groupby("StationId")["AQI"].shift(lag)
+    spec = FeatureSpec(args.lags, args.rolling, args.time_of_day)
 
-# Drop rows with NaN (initial lag rows)
-df = df.dropna()
+    print("Loading dataset...")
 
-# Features and target
-features = [f"AQI_lag_{lag}" for lag in lags]
-X = df[features]
-y = df["AQI"]
+    df = load_dataset(["StationId", "Datetime", "AQI"])
 
-print("Dataset shape:", X.shape)
+    # Same feature code as the /forecast routes (app/features.py), one
+    # worker per partition of stations
+    print(f"Creating features {spec.names} with {args.workers} workers...")
+    start = time.perf_counter()
+    df = build_training_frame(df, spec, workers=args.workers)
+    print(f"Features built in {time.perf_counter() - start:.1f}s")
 
-# Train-test split
-split = int(len(X) * 0.9)
-X_train, X_test = X[:split], X[split:]
-y_train, y_test = y[:split], y[split:]
+    # Features and target
+    features = spec.names
+    X = df[features]
+    y = df["AQI"]
 
-print("Training Forecast Model...")
+    print("Dataset shape:", X.shape)
 
-model = CatBoostRegressor(
-    iterations=500,
-    depth=6,
-    learning_rate=0.05,
-    loss_function="RMSE",
-    verbose=100
-)
+    # Train-test split
+    split = int(len(X) * 0.9)
+    X_train, X_test = X[:split], X[split:]
+    y_train, y_test = y[:split], y[split:]
 
-model.fit(X_train, y_train)
+    print("Training Forecast Model...")
 
-# Evaluate
-preds = model.predict(X_test)
-rmse = np.sqrt(np.mean((preds - y_test) ** 2))
+    model = CatBoostRegressor(
+        iterations=500,
+        depth=6,
+        learning_rate=0.05,
+        loss_function="RMSE",
+        verbose=100
+    )
 
-print("Forecast RMSE:", rmse)
+    model.fit(X_train, y_train)
 
-# Save model
-joblib.dump(model, "models/aqi_forecast_model.pkl")
+    # Evaluate
+    preds = model.predict(X_test)
+    rmse = np.sqrt(np.mean((preds - y_test) ** 2))
 
-print("Forecast model saved at models/aqi_forecast_model.pkl")
\ No newline at end of file
+    print("Forecast RMSE:", rmse)
+
+    # Save model
+    joblib.dump(model, "models/aqi_forecast_model.pkl")
+    # Native format, preferred by the API's model registry
+    model.save_model("models/aqi_forecast_model.cbm", format="cbm")
+
+    print("Forecast model saved at models/aqi_forecast_model.pkl and .cbm")
+
+    # Publish to the model registry; running APIs hot-swap to it within
+    # MODEL_REFRESH_INTERVAL. With --candidate it is only shadow-scored.
+    version = publish_model(
+        "forecast", model,
+        {"rmse": float(rmse), "lags": list(spec.lags), "features": spec.to_dict()},
+        activate=not args.candidate, candidate=args.candidate
+    )
+    print(f"Published forecast {version} ({'candidate' if args.candidate else 'active'})")
+
+
+if __name__ == "__main__":
+    main()
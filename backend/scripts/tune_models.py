@@ -0,0 +1,381 @@
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import pandas as pd
+from catboost import CatBoostRegressor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dataset import load_dataset
+from app.features import FeatureSpec, DEFAULT_LAGS, build_training_frame
+from app.model_registry import publish_model
+
+# =====================================
+# Hyperparameter search for the AQI models
+# =====================================
+# Time-series cross-validation (expanding window: every fold trains on the
+# past and is scored on the block that follows) over a process pool, one
+# CatBoost trial per process with --threads-per-trial threads each.
+#
+# Every finished trial is appended to <out>/trials.jsonl, so an interrupted
+# search picks up where it stopped when run again with the same arguments.
+# <out>/leaderboard.csv ranks the configs by mean RMSE.
+#
+#   python scripts/tune_models.py --model aqi --trials 30 --workers 4
+#   python scripts/tune_models.py --model forecast --lags 1,2,3,6,24 --grid
+#   python scripts/tune_models.py --model aqi --trials 30 --publish-best
+
+SEARCH_DIR = "models/search"
+
+AQI_FEATURES = ["PM2.5", "PM10", "NO2", "CO", "SO2", "O3", "NH3", "hour", "day", "month", "weekday"]
+
+# Values each trial samples from (or every combination with --grid)
+SEARCH_SPACE = {
+    "depth": [4, 6, 8, 10],
+    "learning_rate": [0.03, 0.05, 0.1, 0.2],
+    "l2_leaf_reg": [1, 3, 5, 9],
+    "border_count": [64, 128, 254],
+}
+
+# Upper bound on trees; early stopping decides the actual number
+MAX_ITERATIONS = 2000
+EARLY_STOPPING_ROUNDS = 50
+# Tail of each fold's training rows used for early stopping, so the
+# fold's test block is never seen while fitting
+EARLY_STOPPING_FRACTION = 0.1
+
+LATENCY_REPEATS = 200
+THROUGHPUT_ROWS = 10_000
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+# =====================================
+# Data
+# =====================================
+def load_training_data(args):
+    """Feature matrix and target in time order, plus the feature names."""
+    if args.model == "aqi":
+        df = load_dataset(["Datetime"] + AQI_FEATURES + ["AQI"])
+        features = AQI_FEATURES
+    else:
+        spec = FeatureSpec(args.lags, args.rolling, args.time_of_day)
+        df = build_training_frame(load_dataset(["StationId", "Datetime", "AQI"]), spec)
+        features = spec.names
+
+    # The dataset is stored in time order; forecast rows come out per station
+    df = df.sort_values("Datetime", kind="mergesort")
+    if args.max_rows and len(df) > args.max_rows:
+        # Most recent rows: closest to what the model will be served on
+        df = df.iloc[-args.max_rows:]
+
+    X = df[features].to_numpy(np.float32)
+    y = df["AQI"].to_numpy(np.float32)
+    return X, y, features
+
+
+def time_series_folds(n, folds, min_train_fraction):
+    """
+    (train_end, test_end) row indices of expanding-window folds: the first
+    min_train_fraction of rows is only ever trained on, the rest is cut into
+    `folds` consecutive test blocks.
+    """
+    start = int(n * min_train_fraction)
+    bounds = np.linspace(start, n, folds + 1).astype(int)
+    return [(int(bounds[i]), int(bounds[i + 1])) for i in range(folds)]
+
+
+# =====================================
+# Search Space
+# =====================================
+def trial_id(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:10]
+
+
+def search_configs(grid, trials, seed):
+    keys = sorted(SEARCH_SPACE)
+    if grid:
+        configs = [dict(zip(keys, values)) for values in itertools.product(*(SEARCH_SPACE[k] for k in keys))]
+    else:
+        # Seeded, so a resumed search samples the same configs in the same order
+        rng = random.Random(seed)
+        configs, seen = [], set()
+        limit = np.prod([len(v) for v in SEARCH_SPACE.values()])
+        while len(configs) < min(trials, limit):
+            params = {k: rng.choice(SEARCH_SPACE[k]) for k in keys}
+            if trial_id(params) not in seen:
+                seen.add(trial_id(params))
+                configs.append(params)
+    return configs
+
+
+# =====================================
+# Trials (run in worker processes)
+# =====================================
+_data = {}
+
+
+def _init_worker(data_dir):
+    # Memory-mapped: every worker shares the page cache instead of a copy
+    _data["X"] = np.load(os.path.join(data_dir, "X.npy"), mmap_mode="r")
+    _data["y"] = np.load(os.path.join(data_dir, "y.npy"), mmap_mode="r")
+
+
+def measure_latency(model, X):
+    """Median single-row predict time (ms) and batch cost per row (us)."""
+    row = np.ascontiguousarray(X[-1:])
+    timings = []
+    for _ in range(LATENCY_REPEATS):
+        start = time.perf_counter()
+        model.predict(row)
+        timings.append(time.perf_counter() - start)
+
+    batch = np.ascontiguousarray(X[-THROUGHPUT_ROWS:])
+    start = time.perf_counter()
+    model.predict(batch)
+    per_row = (time.perf_counter() - start) / len(batch)
+    return float(np.median(timings) * 1000), float(per_row * 1e6)
+
+
+def run_trial(params, folds, threads, prune_above):
+    """
+    Cross-validate one config. Stops after a fold whose RMSE is above
+    prune_above (the search's best mean times --prune-factor), since the
+    config can no longer win.
+    """
+    X, y = _data["X"], _data["y"]
+    result = {"id": trial_id(params), "params": params, "folds": []}
+
+    model = None
+    for train_end, test_end in folds:
+        es_start = int(train_end * (1 - EARLY_STOPPING_FRACTION))
+        model = CatBoostRegressor(
+            iterations=MAX_ITERATIONS,
+            loss_function="RMSE",
+            thread_count=threads,
+            random_seed=42,
+            verbose=0,
+            **params
+        )
+        start = time.perf_counter()
+        model.fit(X[:es_start], y[:es_start], eval_set=(X[es_start:train_end], y[es_start:train_end]),
+                  early_stopping_rounds=EARLY_STOPPING_ROUNDS, use_best_model=True)
+        train_s = time.perf_counter() - start
+
+        best_iteration = model.get_best_iteration()
+        if best_iteration is None:
+            best_iteration = MAX_ITERATIONS - 1
+
+        y_test = np.asarray(y[train_end:test_end], dtype=np.float64)
+        pred = model.predict(X[train_end:test_end])
+        rmse = float(np.sqrt(np.mean((pred - y_test) ** 2)))
+        r2 = float(1 - np.sum((pred - y_test) ** 2) / np.sum((y_test - y_test.mean()) ** 2))
+        result["folds"].append({
+            "rmse": rmse, "r2": r2, "train_s": train_s,
+            "best_iteration": best_iteration + 1,
+        })
+
+        if prune_above is not None and rmse > prune_above:
+            result["status"] = "pruned"
+            return result
+
+    result["status"] = "complete"
+    result["latency_ms"], result["batch_us_per_row"] = measure_latency(model, X)
+    return result
+
+
+# =====================================
+# Checkpoint and Leaderboard
+# =====================================
+def read_trials(path):
+    if not os.path.exists(path):
+        return {}
+    trials = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                trial = json.loads(line)
+                trials[trial["id"]] = trial
+    return trials
+
+
+def append_trial(path, trial):
+    # One line per trial, flushed, so a crash loses at most the running ones
+    with open(path, "a") as f:
+        f.write(json.dumps(trial) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def summarize(trial):
+    folds = trial["folds"]
+    row = dict(trial["params"])
+    row.update({
+        "id": trial["id"],
+        "status": trial["status"],
+        "folds": len(folds),
+        "rmse": np.mean([f["rmse"] for f in folds]),
+        "rmse_std": np.std([f["rmse"] for f in folds]),
+        "r2": np.mean([f["r2"] for f in folds]),
+        "train_s": np.mean([f["train_s"] for f in folds]),
+        "iterations": int(np.mean([f["best_iteration"] for f in folds])),
+        "latency_ms": trial.get("latency_ms"),
+        "batch_us_per_row": trial.get("batch_us_per_row"),
+    })
+    return row
+
+
+def leaderboard(trials):
+    rows = [summarize(t) for t in trials.values()]
+    if not rows:
+        return pd.DataFrame()
+    board = pd.DataFrame(rows)
+    # Complete trials first, best mean RMSE on top
+    board["_pruned"] = board["status"] != "complete"
+    board = board.sort_values(["_pruned", "rmse"]).drop(columns="_pruned")
+    return board.reset_index(drop=True)
+
+
+def best_rmse(trials):
+    scores = [summarize(t)["rmse"] for t in trials.values() if t["status"] == "complete"]
+    return min(scores) if scores else None
+
+
+# =====================================
+# Search
+# =====================================
+def check_setup(out_dir, setup, fresh):
+    """A checkpoint is only resumed with the settings it was started with."""
+    path = os.path.join(out_dir, "search.json")
+    trials_path = os.path.join(out_dir, "trials.jsonl")
+    if fresh:
+        for p in (path, trials_path):
+            if os.path.exists(p):
+                os.remove(p)
+    if os.path.exists(path):
+        with open(path) as f:
+            previous = json.load(f)
+        if previous != json.loads(json.dumps(setup)):
+            sys.exit(f"{out_dir} holds a search with other settings; use --fresh or another --out")
+    else:
+        with open(path, "w") as f:
+            json.dump(setup, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-validated hyperparameter search")
+    parser.add_argument("--model", choices=["aqi", "forecast"], default="aqi")
+    parser.add_argument("--trials", type=int, default=20, help="random configs to try")
+    parser.add_argument("--grid", action="store_true", help="try every config in SEARCH_SPACE")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--min-train-fraction", type=float, default=0.5,
+                        help="share of rows only used for training (before the first test block)")
+    parser.add_argument("--max-rows", type=int, default=None, help="use only the most recent rows")
+    parser.add_argument("--workers", type=int, default=None, help="trials run at once (processes)")
+    parser.add_argument("--threads-per-trial", type=int, default=None,
+                        help="CatBoost threads per trial (default: cores / workers)")
+    parser.add_argument("--prune-factor", type=float, default=1.25,
+                        help="stop a trial once a fold is this much worse than the best mean RMSE (0 disables)")
+    parser.add_argument("--out", default=None, help=f"checkpoint directory (default: {SEARCH_DIR}/<model>)")
+    parser.add_argument("--fresh", action="store_true", help="discard an existing checkpoint")
+    parser.add_argument("--publish-best", action="store_true",
+                        help="refit the best config on all rows and publish it as the shadow candidate")
+    parser.add_argument("--lags", type=int_list, default=list(DEFAULT_LAGS), help="forecast only")
+    parser.add_argument("--rolling", type=int_list, default=[], help="forecast only")
+    parser.add_argument("--time-of-day", action="store_true", help="forecast only")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    workers = args.workers or max(1, cores // 2)
+    threads = args.threads_per_trial or max(1, cores // workers)
+    out_dir = args.out or os.path.join(SEARCH_DIR, args.model)
+    os.makedirs(out_dir, exist_ok=True)
+
+    print("Loading dataset...")
+    X, y, features = load_training_data(args)
+    print(f"{len(X)} rows, features: {features}")
+
+    folds = time_series_folds(len(X), args.folds, args.min_train_fraction)
+    setup = {
+        "model": args.model, "features": features, "rows": len(X), "folds": folds,
+        "seed": args.seed, "grid": args.grid, "search_space": SEARCH_SPACE,
+    }
+    check_setup(out_dir, setup, args.fresh)
+
+    data_dir = os.path.join(out_dir, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    np.save(os.path.join(data_dir, "X.npy"), X)
+    np.save(os.path.join(data_dir, "y.npy"), y)
+
+    trials_path = os.path.join(out_dir, "trials.jsonl")
+    trials = read_trials(trials_path)
+    configs = search_configs(args.grid, args.trials, args.seed)
+    pending = [c for c in configs if trial_id(c) not in trials]
+    print(f"{len(configs)} configs, {len(configs) - len(pending)} already done; "
+          f"{workers} workers x {threads} threads")
+
+    start = time.perf_counter()
+    # spawn: CatBoost's thread pool does not survive fork reliably
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(data_dir,)) as pool:
+        running = {}
+        while pending or running:
+            # Submit as slots free up, so pruning uses the latest best score
+            while pending and len(running) < workers:
+                params = pending.pop(0)
+                best = best_rmse(trials)
+                prune_above = best * args.prune_factor if best and args.prune_factor > 0 else None
+                running[pool.submit(run_trial, params, folds, threads, prune_above)] = params
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                params = running.pop(future)
+                trial = future.result()
+                trials[trial["id"]] = trial
+                append_trial(trials_path, trial)
+                row = summarize(trial)
+                print(f"  [{len(trials)}/{len(configs)}] {params} -> RMSE {row['rmse']:.3f} "
+                      f"R2 {row['r2']:.3f} ({trial['status']}, {row['train_s']:.1f}s/fold)")
+
+    print(f"Search done in {time.perf_counter() - start:.1f}s")
+
+    board = leaderboard(trials)
+    board_path = os.path.join(out_dir, "leaderboard.csv")
+    board.to_csv(board_path, index=False)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print("\nLeaderboard:")
+        print(board.head(10).to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+    print("\nLeaderboard saved at:", board_path)
+
+    if args.publish_best:
+        best = board[board["status"] == "complete"].iloc[0]
+        params = trials[best["id"]]["params"]
+        print(f"\nRefitting {params} on all rows ({best['iterations']} iterations)...")
+        model = CatBoostRegressor(iterations=int(best["iterations"]), loss_function="RMSE",
+                                  thread_count=cores, random_seed=42, verbose=0, **params)
+        model.fit(pd.DataFrame(X, columns=features), y)
+        metadata = {"rmse": float(best["rmse"]), "r2": float(best["r2"]), "params": params,
+                    "cv_folds": args.folds, "features": features}
+        if args.model == "forecast":
+            spec = FeatureSpec(args.lags, args.rolling, args.time_of_day)
+            metadata.update({"lags": list(spec.lags), "features": spec.to_dict()})
+        version = publish_model(args.model, model, metadata, candidate=True)
+        print(f"Published {args.model} {version} (candidate)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.aqi_index import (
+    BREAKPOINTS, CATEGORY_BOUNDS, CATEGORY_LABELS, POLLUTANTS, DriftMonitor,
+    category_sql, compute_aqi, get_categories, get_category, prominent_pollutants, sub_indices,
+)
+
+NAN = float("nan")
+
+
+def row(**values):
+    return [values.get(p.replace(".", ""), NAN) for p in POLLUTANTS]
+
+
+@pytest.mark.parametrize("pollutant", POLLUTANTS)
+def test_breakpoints_map_to_index_points(pollutant):
+    column = POLLUTANTS.index(pollutant)
+    concentrations = np.full((6, len(POLLUTANTS)), NAN)
+    concentrations[:, column] = [0] + BREAKPOINTS[pollutant]
+
+    assert sub_indices(concentrations)[:, column] == pytest.approx([0, 50, 100, 200, 300, 400])
+
+
+def test_sub_index_is_linear_within_a_band_and_beyond_the_last():
+    pm25 = POLLUTANTS.index("PM2.5")
+    concentrations = np.full((3, len(POLLUTANTS)), NAN)
+    concentrations[:, pm25] = [15, 75, 380]
+
+    # 0-30 -> 0-50, 60-90 -> 100-200, and above 250 the 120-250 slope continues
+    assert sub_indices(concentrations)[:, pm25] == pytest.approx([25, 150, 500])
+
+
+def test_compute_aqi_is_the_highest_sub_index():
+    aqi = compute_aqi([row(PM25=75, PM10=50, NO2=20)])
+    assert aqi == pytest.approx([150])
+    assert prominent_pollutants([row(PM25=75, PM10=50, NO2=20)]) == ["PM2.5"]
+
+
+def test_compute_aqi_needs_three_pollutants_including_a_particulate():
+    aqi = compute_aqi([
+        row(PM25=75, PM10=50),
+        row(NO2=20, CO=1.0, SO2=10),
+        row(PM10=120, NO2=20, CO=1.0),
+    ])
+    assert math.isnan(aqi[0])
+    assert math.isnan(aqi[1])
+    assert aqi[2] == pytest.approx(100 + 20 * 100 / 150)
+    assert prominent_pollutants([row(PM25=75, PM10=50)]) == [None]
+
+
+def test_category_bounds_are_inclusive():
+    assert [get_category(b) for b in CATEGORY_BOUNDS] == CATEGORY_LABELS[:-1].tolist()
+    assert get_category(400.01) == "Severe"
+    assert get_categories([0, 50, 50.5, 401]) == ["Good", "Good", "Satisfactory", "Severe"]
+
+
+def test_missing_aqi_has_no_category():
+    assert get_category(NAN) is None
+    assert get_category(math.inf) is None
+    assert get_category(None) is None
+    assert get_categories(np.array([NAN, 120.0, -math.inf])) == [None, "Moderate", None]
+    assert category_sql("x").startswith("CASE WHEN x IS NULL OR x = 'NaN' THEN NULL ")
+
+
+def test_drift_monitor_ignores_rows_without_a_prediction():
+    monitor = DriftMonitor(sample=1.0, window=4, threshold=50)
+    features = [row(PM25=75, PM10=50, NO2=20)] * 2
+    monitor.observe("m", features, [NAN, 160.0])
+
+    stats = monitor.stats()
+    assert stats["rows"] == 1
+    assert stats["mean_delta"] == pytest.approx(10)
+    assert stats["category_mismatch_rate"] == 0
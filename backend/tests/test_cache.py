@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import app.cache as cache_module
+from app.cache import ResponseCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    monkeypatch.setattr(cache_module, "CACHE_INVALIDATE_INTERVAL", {"readings": 1.0})
+    return clock
+
+
+def counting_loader(value="v"):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return f"{value}{len(calls)}"
+
+    return loader, calls
+
+
+def test_entries_are_served_until_their_ttl(clock):
+    cache = ResponseCache(max_entries=8)
+    loader, calls = counting_loader()
+
+    assert cache.get_or_load(("latest",), 5, loader) == "v1"
+    clock.now += 4.9
+    assert cache.get_or_load(("latest",), 5, loader) == "v1"
+    clock.now += 0.2
+    assert cache.get_or_load(("latest",), 5, loader) == "v2"
+    stats = cache.stats()["endpoints"]["latest"]
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 2, 0.333)
+
+
+def test_lru_evicts_the_least_recently_used(clock):
+    cache = ResponseCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.get_or_load(("history", key), 60, lambda: key)
+    cache.get_or_load(("history", "a"), 60, lambda: "reloaded")  # a is now the newest
+    cache.get_or_load(("history", "c"), 60, lambda: "c")
+
+    assert list(cache._entries) == [("history", "a"), ("history", "c")]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_concurrent_misses_share_one_load():
+    cache = ResponseCache(max_entries=8)
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load(("latest",), 5, loader)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    deadline = time.monotonic() + 5
+    while cache.stats()["endpoints"].get("latest", {}).get("coalesced", 0) < 7 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert calls == [1]
+    assert results == ["value"] * 8
+
+
+def test_load_errors_reach_every_waiter_and_are_not_cached():
+    cache = ResponseCache(max_entries=8)
+
+    def failing():
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load(("latest",), 5, failing)
+    assert cache.get_or_load(("latest",), 5, lambda: "ok") == "ok"
+
+
+def test_async_misses_share_one_load():
+    cache = ResponseCache(max_entries=8)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_load_async(("latest",), 5, loader) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["value"] * 5
+    assert calls == [1]
+
+
+def test_invalidate_drops_tagged_entries_only(clock):
+    cache = ResponseCache(max_entries=8)
+    cache.get_or_load(("public_sensors",), 60, lambda: "sensors", tags=("sensors",))
+    cache.get_or_load(("top_polluted",), 60, lambda: "top", tags=("sensors", "regions"))
+    cache.get_or_load(("regions",), 60, lambda: "regions", tags=("regions",))
+
+    cache.invalidate("sensors")
+
+    assert list(cache._entries) == [("regions",)]
+
+
+def test_readings_invalidations_are_coalesced(clock):
+    cache = ResponseCache(max_entries=8)
+    loader, calls = counting_loader()
+
+    def read():
+        return cache.get_or_load(("latest",), 60, loader, tags=("readings",))
+
+    read()
+    cache.invalidate("readings")  # first one applies immediately
+    assert read() == "v2"
+
+    for _ in range(10):
+        cache.invalidate("readings")
+    clock.now += 0.5
+    assert read() == "v2"  # held back within the interval
+
+    clock.now += 0.5
+    assert read() == "v3"  # applied on the next read once it has passed
+
+    stats = cache.stats()
+    assert stats["invalidations"] == {"readings": 11}
+    assert stats["invalidations_coalesced"] == {"readings": 10}
+
+
+def test_invalidation_during_a_load_keeps_the_result_out(clock):
+    cache = ResponseCache(max_entries=8)
+
+    def loader():
+        cache.invalidate("sensors")  # a write lands while the query runs
+        return "stale"
+
+    assert cache.get_or_load(("public_sensors",), 60, loader, tags=("sensors",)) == "stale"
+    assert cache.get_or_load(("public_sensors",), 60, lambda: "fresh", tags=("sensors",)) == "fresh"
+
+
+def test_disabled_cache_always_loads():
+    cache = ResponseCache(max_entries=8, enabled=False)
+    loader, calls = counting_loader()
+
+    cache.get_or_load(("latest",), 5, loader)
+    cache.get_or_load(("latest",), 5, loader)
+    assert len(calls) == 2
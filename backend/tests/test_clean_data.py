@@ -0,0 +1,91 @@
+import importlib.util
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts", "clean_data.py")
+
+spec = importlib.util.spec_from_file_location("clean_data", SCRIPT)
+clean_data = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(clean_data)
+
+
+def readings(n, seed):
+    rng = np.random.default_rng(seed)
+    # Few distinct hours, so many rows tie on Datetime within and across runs
+    return pd.DataFrame({
+        "StationId": pd.Categorical(rng.choice(["MH001", "MH002", "DL001"], n)),
+        "Datetime": pd.Timestamp("2026-01-01") + pd.to_timedelta(rng.integers(0, 12, n), unit="h"),
+        "AQI": np.arange(n, dtype=np.float32),  # input position, to check tie order
+    })
+
+
+def write_runs(tmp_path, frames, block_rows):
+    paths = []
+    for i, df in enumerate(frames):
+        path = str(tmp_path / f"run_{i}.pkl")
+        run = df.sort_values("Datetime", kind="mergesort")
+        clean_data.write_run(path, clean_data.split_blocks(run, block_rows))
+        paths.append(path)
+    return paths
+
+
+def expected(frames):
+    # One stable sort of the whole input: ties keep input order
+    return pd.concat(frames, ignore_index=True).sort_values("Datetime", kind="mergesort")
+
+
+def merged(blocks):
+    return pd.concat(list(blocks), ignore_index=True)
+
+
+def chunks(n_runs, rows, seed=3):
+    whole = readings(n_runs * rows, seed)
+    return [whole.iloc[i * rows:(i + 1) * rows] for i in range(n_runs)]
+
+
+@pytest.mark.parametrize("block_rows", [1, 7, 50, 10_000])
+def test_merge_runs_is_a_stable_sort_of_the_input(tmp_path, block_rows):
+    frames = chunks(5, 120)
+    paths = write_runs(tmp_path, frames, block_rows=13)
+
+    result = merged(clean_data.merge_runs(paths, block_rows))
+
+    want = expected(frames)
+    assert result["AQI"].tolist() == want["AQI"].tolist()
+    assert result["Datetime"].tolist() == want["Datetime"].tolist()
+    assert result["StationId"].astype(str).tolist() == want["StationId"].astype(str).tolist()
+
+
+def test_merge_runs_bounds_block_size(tmp_path):
+    paths = write_runs(tmp_path, chunks(3, 200), block_rows=50)
+    sizes = [len(block) for block in clean_data.merge_runs(paths, 40)]
+    assert max(sizes) <= 40
+    assert sum(sizes) == 600
+
+
+def test_merge_runs_skips_empty_runs(tmp_path):
+    frames = chunks(2, 30)
+    paths = write_runs(tmp_path, frames, block_rows=8)
+    empty = str(tmp_path / "empty.pkl")
+    clean_data.write_run(empty, [])
+
+    result = merged(clean_data.merge_runs([empty] + paths, 10))
+    assert result["AQI"].tolist() == expected(frames)["AQI"].tolist()
+
+
+def test_reduce_runs_merges_in_passes(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(clean_data, "MAX_FAN_IN", 3)
+    monkeypatch.setattr(clean_data, "MIN_BLOCK_ROWS", 1)
+    frames = chunks(10, 40)
+    paths = write_runs(tmp_path, frames, block_rows=9)
+
+    reduced = clean_data.reduce_runs(paths, str(tmp_path), merge_rows=30)
+
+    assert len(reduced) <= 3
+    assert not any(os.path.exists(p) for p in paths)
+    assert "Merge pass 2" in capsys.readouterr().out
+    result = merged(clean_data.merge_runs(reduced, 25))
+    assert result["AQI"].tolist() == expected(frames)["AQI"].tolist()
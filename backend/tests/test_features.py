@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.features import FeatureSpec, build_features, build_training_frame, station_features
+
+SPEC = FeatureSpec(lags=(1, 2, 24), rolling=(3, 6), time_of_day=True)
+
+
+def hourly_frame(stations=("A", "B", "C"), hours=60, seed=17):
+    rng = np.random.default_rng(seed)
+    frames = [
+        pd.DataFrame({
+            "StationId": station,
+            "Datetime": pd.date_range("2026-01-01", periods=hours, freq="h"),
+            "AQI": rng.uniform(20, 400, hours).round(1),
+        })
+        for station in stations
+    ]
+    # Shuffled, so the frame builder has to sort by station and time itself
+    return pd.concat(frames).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def test_names_round_trip():
+    assert SPEC.names[:3] == ["AQI_lag_1", "AQI_lag_2", "AQI_lag_24"]
+    assert FeatureSpec.from_names(SPEC.names) == SPEC
+    assert SPEC.window == 24
+
+
+@pytest.mark.parametrize("names", [
+    ["AQI_lag_2", "AQI_lag_1"],
+    ["AQI_lag_1", "PM2.5"],
+    ["AQI_roll_mean_3"],
+])
+def test_from_names_rejects_unknown_or_reordered_features(names):
+    with pytest.raises(ValueError):
+        FeatureSpec.from_names(names)
+
+
+def test_for_model_falls_back_to_the_default_lags():
+    class Unnamed:
+        feature_names_ = ["0", "1", "2", "3"]
+
+    assert FeatureSpec.for_model(Unnamed()) == FeatureSpec()
+
+
+def test_training_rows_match_pandas_definitions():
+    df = hourly_frame()
+    frame = build_training_frame(df, SPEC, workers=1)
+
+    for station, group in df.sort_values("Datetime").groupby("StationId"):
+        aqi = group.set_index("Datetime")["AQI"]
+        expected = pd.DataFrame({
+            "AQI_lag_1": aqi.shift(1),
+            "AQI_lag_2": aqi.shift(2),
+            "AQI_lag_24": aqi.shift(24),
+            "AQI_roll_mean_3": aqi.rolling(3).mean().shift(1),
+            "AQI_roll_std_3": aqi.rolling(3).std(ddof=0).shift(1),
+            "AQI_roll_mean_6": aqi.rolling(6).mean().shift(1),
+            "AQI_roll_std_6": aqi.rolling(6).std(ddof=0).shift(1),
+            "hour": aqi.index.hour.astype(float),
+            "AQI": aqi,
+        }).iloc[SPEC.window:]
+
+        got = frame[frame["StationId"] == station].set_index("Datetime")
+        np.testing.assert_allclose(got[expected.columns].to_numpy(), expected.to_numpy(), atol=1e-9)
+
+
+def test_serving_features_equal_training_features():
+    df = hourly_frame(stations=("A",))
+    frame = build_training_frame(df, SPEC, workers=1)
+    series = df.sort_values("Datetime")
+    values, times = series["AQI"].to_numpy(), series["Datetime"].to_numpy()
+
+    # /forecast builds the row for the next reading from the last `window` values
+    for i in (SPEC.window, len(values) - 1):
+        served = build_features([values[i - SPEC.window:i]], [times[i]], SPEC)
+        trained = frame.loc[frame["Datetime"] == times[i], SPEC.names].to_numpy()
+        np.testing.assert_allclose(served, trained)
+
+
+def test_worker_count_does_not_change_the_frame():
+    df = hourly_frame(stations=tuple("ABCDEFG"), hours=40)
+    pd.testing.assert_frame_equal(build_training_frame(df, SPEC, workers=1), build_training_frame(df, SPEC, workers=4))
+
+
+def test_short_series_give_no_rows():
+    X, y, times = station_features(np.arange(5.0), np.arange(5).astype("datetime64[h]"), SPEC)
+    assert X.shape == (0, len(SPEC.names))
+    assert len(y) == len(times) == 0
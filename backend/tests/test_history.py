@@ -0,0 +1,132 @@
+import os
+import re
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import app.storage as storage
+from app.history import (
+    BUCKET_WIDTHS, HistoryRequestError, bucket_query, decode_cursor, encode_cursor, lttb,
+    raw_page_query, resolve_range,
+)
+
+SCHEMA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "database", "schema.sql")
+
+
+def _weights(sql):
+    return dict(re.findall(r"SUM\((\w+)_sum\) / NULLIF\(SUM\((\w+)\), 0\)", sql))
+
+
+def test_bucket_averages_are_weighted_by_non_null_counts():
+    start, end = datetime(2026, 1, 1), datetime(2026, 1, 3)
+    sql, params, _ = bucket_query(start, end, BUCKET_WIDTHS["1d"], region_id=1)
+
+    assert _weights(sql) == {"aqi": "aqi_n", "pm25": "pm25_n", "pm10": "pm10_n"}
+    # Daily and hourly rollups carry per-metric counts; raw rows count only non-NULL values
+    assert sql.count("aqi_count AS aqi_n") == 2
+    assert sql.count("pm25_count AS pm25_n") == 2
+    assert "(predicted_aqi IS NOT NULL)::int AS aqi_n" in sql
+    assert "(pm25 IS NOT NULL)::int AS pm25_n" in sql
+    assert sql.count("%s") == len(params)
+
+
+def test_rollups_store_a_count_per_metric():
+    assert "COUNT(sr.predicted_aqi), AVG(sr.predicted_aqi)" in storage.HOURLY_UPSERT
+    assert "SUM(aqi_avg * aqi_count) / NULLIF(SUM(aqi_count), 0)" in storage.DAILY_UPSERT
+    with open(SCHEMA) as f:
+        schema = f.read()
+    for column in storage.ROLLUP_COLUMNS:
+        assert schema.count(f"{column} ") == 2, column
+
+
+def reference_lttb(x, y, threshold):
+    # Textbook LTTB, one bucket at a time; the last point is a bucket of its own
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    buckets = [(int(i * every) + 1, int((i + 1) * every) + 1) for i in range(threshold - 2)]
+    buckets[-1] = (buckets[-1][0], n - 1)
+    buckets.append((n - 1, n))
+
+    selected, a = [0], 0
+    for (lo, hi), (nlo, nhi) in zip(buckets, buckets[1:]):
+        nx, ny = np.mean(x[nlo:nhi]), np.mean(y[nlo:nhi])
+        areas = [abs((x[a] - nx) * (y[j] - y[a]) - (x[a] - x[j]) * (ny - y[a])) for j in range(lo, hi)]
+        a = lo + int(np.argmax(areas))
+        selected.append(a)
+    return selected + [n - 1]
+
+
+def test_lttb_keeps_endpoints_and_size():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.sin(x / 50) * 100
+
+    selected = lttb(x, y, 100)
+    assert len(selected) == 100
+    assert selected[0] == 0 and selected[-1] == 999
+    assert np.all(np.diff(selected) > 0)
+
+
+def test_lttb_matches_the_reference():
+    rng = np.random.default_rng(7)
+    x = np.cumsum(rng.uniform(1, 10, 503))
+    y = rng.normal(100, 30, 503)
+
+    assert lttb(x, y, 40).tolist() == reference_lttb(x, y, 40)
+
+
+def test_lttb_keeps_a_spike():
+    x = np.arange(10000, dtype=np.float64)
+    y = np.full(10000, 80.0)
+    y[6543] = 450.0
+
+    assert 6543 in lttb(x, y, 50)
+
+
+def test_lttb_short_series_are_returned_whole():
+    assert lttb([1, 2, 3], [4, 5, 6], 10).tolist() == [0, 1, 2]
+    assert lttb(list(range(10)), list(range(10)), 2).tolist() == list(range(10))
+
+
+def test_cursor_round_trip():
+    ts = datetime(2026, 3, 4, 5, 6, 7, 891011)
+    assert decode_cursor(encode_cursor(ts, 123456789)) == (ts, 123456789)
+    assert "=" not in encode_cursor(ts, 1)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor(datetime(2026, 1, 1), 1)[:-3]])
+def test_bad_cursors_are_rejected(cursor):
+    with pytest.raises(HistoryRequestError):
+        decode_cursor(cursor)
+
+
+def test_keyset_pages_cover_every_row_once():
+    base = datetime(2026, 1, 1)
+    # Several readings share a timestamp, so paging needs the id tiebreak
+    table = sorted(((base + timedelta(seconds=i // 3), i) for i in range(50)))
+    limit, cursor, seen = 7, None, []
+
+    while True:
+        sql, params, shape = raw_page_query(base, base + timedelta(hours=1), limit, cursor, sensor_id=1)
+        assert sql.count("%s") == len(params)
+        after = tuple(params[3:5]) if cursor else None
+        rows = [(rid, 1, ts, 100.0, "Moderate") + (None,) * 7
+                for ts, rid in table if after is None or (ts, rid) > after][:params[-1]]
+        page = shape(rows)
+        seen += [p["timestamp"] for p in page["points"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 50
+    assert seen == [ts for ts, _ in table]
+
+
+def test_resolve_range_aligns_and_picks_a_width():
+    start, end = datetime(2026, 1, 1, 0, 7), datetime(2026, 1, 3, 5, 50)
+
+    assert resolve_range(start, end, "1h") == (datetime(2026, 1, 1), datetime(2026, 1, 3, 6), "1h")
+    assert resolve_range(start, end, "auto", points=500)[2] == "15m"
+    assert resolve_range(start, end, "auto", points=10)[2] == "6h"
+    with pytest.raises(HistoryRequestError):
+        resolve_range(end, start)
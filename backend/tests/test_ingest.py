@@ -0,0 +1,115 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+import app.ingest as ingest
+from app.ingest import QueueFullError, WriteBehindBuffer, _copy_value
+
+
+def reading(i):
+    return (i, datetime(2026, 1, 1, 12, 0, i % 60), 40.0, 80.0, None, 1.0, 10.0, 20.0, 5.0, 90.0, "Satisfactory")
+
+
+def recording_buffer(max_queue=100, flush_rows=10, flush_interval=0.05):
+    buffer = WriteBehindBuffer(max_queue, flush_rows, flush_interval)
+    buffer.batches = []
+    buffer._copy = buffer.batches.append
+    return buffer
+
+
+def test_take_batch_stops_at_flush_rows():
+    buffer = recording_buffer(flush_rows=10)
+    buffer.submit_many([reading(i) for i in range(25)])
+
+    assert [len(buffer._take_batch()) for _ in range(3)] == [10, 10, 5]
+    assert buffer._queue.qsize() == 0
+
+
+def test_take_batch_waits_at_most_flush_interval():
+    buffer = recording_buffer(flush_interval=0.05)
+
+    start = time.monotonic()
+    assert buffer._take_batch() == []
+    assert time.monotonic() - start < 1
+
+
+def test_take_batch_keeps_submission_order():
+    buffer = recording_buffer(flush_rows=100)
+    rows = [reading(i) for i in range(30)]
+    buffer.submit_many(rows)
+    assert buffer._take_batch() == rows
+
+
+def test_submit_many_is_all_or_nothing():
+    buffer = recording_buffer(max_queue=10)
+    buffer.submit_many([reading(i) for i in range(8)])
+
+    with pytest.raises(QueueFullError):
+        buffer.submit_many([reading(i) for i in range(3)])
+    buffer.submit_many([reading(i) for i in range(2)])
+
+    stats = buffer.stats()
+    assert (stats["queue_depth"], stats["rows_enqueued"], stats["rows_rejected"]) == (10, 10, 3)
+
+
+def test_stop_drains_the_queue():
+    buffer = recording_buffer(flush_rows=10, flush_interval=0.2)
+    buffer.submit_many([reading(i) for i in range(25)])
+    buffer.start()
+    buffer.stop()
+
+    assert sum(len(b) for b in buffer.batches) == 25
+    stats = buffer.stats()
+    assert (stats["rows_written"], stats["rows_dropped"], stats["queue_depth"]) == (25, 0, 0)
+    assert not stats["running"]
+
+
+def test_stop_with_a_stuck_flush_counts_every_row_once():
+    buffer = WriteBehindBuffer(max_queue=100, flush_rows=10, flush_interval=0.01)
+    release = threading.Event()
+    copying = threading.Event()
+
+    def copy(rows):
+        copying.set()
+        release.wait(5)
+
+    buffer._copy = copy
+    buffer.start()
+    buffer.submit_many([reading(i) for i in range(10)])
+    assert copying.wait(5)
+    buffer.submit_many([reading(i) for i in range(15)])
+
+    buffer.stop(timeout=0.05)
+    assert buffer.stats()["rows_dropped"] == 15
+
+    release.set()
+    buffer.stop()
+    stats = buffer.stats()
+    assert (stats["rows_written"], stats["rows_dropped"]) == (10, 15)
+    assert stats["rows_written"] + stats["rows_dropped"] == stats["rows_enqueued"]
+
+
+def test_failed_flush_is_retried_then_dropped(monkeypatch):
+    monkeypatch.setattr(ingest, "INGEST_FLUSH_RETRIES", 2)
+    monkeypatch.setattr(ingest.time, "sleep", lambda s: None)
+    buffer = WriteBehindBuffer(max_queue=100, flush_rows=10, flush_interval=0.01)
+    attempts = []
+
+    def copy(rows):
+        attempts.append(len(rows))
+        raise ConnectionError("database is down")
+
+    buffer._copy = copy
+    buffer._flush([reading(i) for i in range(4)])
+
+    assert attempts == [4, 4]
+    stats = buffer.stats()
+    assert (stats["flush_errors"], stats["rows_dropped"], stats["rows_written"]) == (2, 4, 0)
+
+
+def test_copy_values():
+    assert _copy_value(None) == "\\N"
+    assert _copy_value(datetime(2026, 1, 1, 12, 30)) == "2026-01-01 12:30:00"
+    assert _copy_value(12.5) == "12.5"
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from app.features import FeatureSpec
+from app.retrain import hourly_grid, hourly_training_frame
+
+
+def readings(times, values, sensor_id=1):
+    return pd.DataFrame({
+        "StationId": [sensor_id] * len(times),
+        "Datetime": pd.to_datetime(times),
+        "AQI": np.asarray(values, dtype=np.float32),
+    })
+
+
+def test_raw_readings_are_averaged_per_hour():
+    df = readings(["2026-01-01 00:00:05", "2026-01-01 00:30:00", "2026-01-01 01:10:00"], [10, 20, 40])
+    grid = hourly_grid(df)
+
+    assert list(grid["Datetime"]) == list(pd.to_datetime(["2026-01-01 00:00", "2026-01-01 01:00"]))
+    assert list(grid["AQI"]) == [15, 40]
+
+
+def test_lags_are_hours_and_gaps_drop_rows():
+    hours = pd.date_range("2026-01-01", periods=8, freq="h").delete(3)
+    df = readings(hours, np.arange(len(hours)))
+    frame = hourly_training_frame(df, FeatureSpec(lags=(1, 2)))
+
+    # 03:00 is missing, so targets whose two-hour window touches it are gone
+    assert list(frame["Datetime"].dt.hour) == [2, 6, 7]
+    gap_free = frame.iloc[1]
+    assert (gap_free["AQI_lag_1"], gap_free["AQI_lag_2"], gap_free["AQI"]) == (4, 3, 5)
+
+
+def test_sensors_are_kept_apart():
+    hours = pd.date_range("2026-01-01", periods=4, freq="h")
+    df = pd.concat([readings(hours, [1, 2, 3, 4], 1), readings(hours, [10, 20, 30, 40], 2)])
+    frame = hourly_training_frame(df, FeatureSpec(lags=(1,)))
+
+    assert len(frame) == 6
+    assert set(frame.loc[frame["StationId"] == 2, "AQI_lag_1"]) == {10, 20, 30}
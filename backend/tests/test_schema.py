@@ -0,0 +1,31 @@
+import importlib.util
+import os
+import subprocess
+import sys
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts", "sync_schema.py")
+
+spec = importlib.util.spec_from_file_location("sync_schema", SCRIPT)
+sync_schema = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(sync_schema)
+
+
+def test_migration_ddl_matches_schema():
+    result = subprocess.run([sys.executable, SCRIPT, "--check"], capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout
+
+
+def test_every_shared_block_is_copied():
+    source = sync_schema.shared_blocks(sync_schema.read(sync_schema.SOURCE))
+    copied = sync_schema.shared_blocks(sync_schema.read(sync_schema.TARGETS[0]))
+    assert set(source) == {"partitioning", "rollups"}
+    assert copied == source
+
+
+def test_drifted_copy_is_restored():
+    source = sync_schema.shared_blocks(sync_schema.read(sync_schema.SOURCE))
+    text = sync_schema.read(sync_schema.TARGETS[0])
+    drifted = text.replace("aqi_avg FLOAT,", "aqi_avg REAL,", 1)
+
+    assert drifted != text
+    assert sync_schema.synced(drifted, source, "migration") == text
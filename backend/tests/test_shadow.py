@@ -0,0 +1,64 @@
+import numpy as np
+
+from app.features import FeatureSpec, build_features
+from app.forecast import FORECAST_STEP, candidate_first_step
+from app.shadow import ShadowScorer
+
+
+class FakeModel:
+    def __init__(self, spec, offset=0.0):
+        self.feature_names_ = spec.names
+        self.offset = offset
+
+    def predict(self, features):
+        features = np.asarray(features)
+        assert features.shape[1] == len(self.feature_names_)
+        return features[:, 0] + self.offset
+
+
+LAST_TIMES = np.array(["2026-01-01T10:00", "2026-01-01T11:00"], dtype="datetime64[ns]")
+
+
+def test_candidate_features_follow_its_own_spec():
+    spec = FeatureSpec(lags=(1, 6), rolling=(3,), time_of_day=True)
+    histories = [list(range(10)), list(range(100, 110))]
+
+    features, primary = candidate_first_step(FakeModel(spec), histories, LAST_TIMES, np.array([1.0, 2.0]))
+
+    expected = build_features([h[-6:] for h in histories], LAST_TIMES + FORECAST_STEP, spec)
+    assert features.shape == (2, len(spec.names))
+    np.testing.assert_array_equal(features, expected)
+    np.testing.assert_array_equal(primary, [1.0, 2.0])
+
+
+def test_sensors_too_short_for_the_candidate_are_left_out():
+    spec = FeatureSpec(lags=(1, 8))
+    histories = [list(range(4)), list(range(12))]
+
+    features, primary = candidate_first_step(FakeModel(spec), histories, LAST_TIMES, np.array([1.0, 2.0]))
+    assert features.shape == (1, 2)
+    np.testing.assert_array_equal(primary, [2.0])
+
+    assert candidate_first_step(FakeModel(FeatureSpec(lags=(24,))), histories, LAST_TIMES, np.zeros(2)) is None
+
+
+def test_scorer_builds_features_for_the_candidate(monkeypatch):
+    import app.shadow as shadow
+
+    candidate = FakeModel(FeatureSpec(lags=(1, 2, 3)), offset=1.0)
+    monkeypatch.setattr(shadow.model_registry, "candidate", lambda name: ("v2", candidate))
+    monkeypatch.setattr(shadow.model_registry, "active_version", lambda name: "v1")
+
+    scorer = ShadowScorer(fraction=1.0, max_queue=10)
+    scorer._thread = object()  # sampled, but scored by hand below
+
+    histories = [[5.0, 6.0, 7.0]]
+    scorer.maybe_submit("forecast", lambda model: candidate_first_step(model, histories, LAST_TIMES[:1],
+                                                                        np.array([7.0])), None, 1.0)
+    scorer.maybe_submit("forecast", lambda model: None, None, 1.0)
+
+    scorer._score(*scorer._queue.get_nowait())
+    stats = scorer.stats()
+    assert stats["skipped"] == 1
+    [comparison] = stats["comparisons"]
+    assert (comparison["primary"], comparison["candidate"], comparison["mean_delta"]) == ("v1", "v2", 1.0)
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+import app.spatial as spatial
+from app.spatial import KDTree, SensorIndex, chord_to_km, km_to_chord, unit_vectors
+
+
+def brute_force(points, q, k, max_chord=2.0, mask=None):
+    dist = np.sqrt(((points - q) ** 2).sum(axis=1))
+    keep = dist <= max_chord
+    if mask is not None:
+        keep &= mask
+    candidates = np.flatnonzero(keep)
+    order = candidates[np.argsort(dist[candidates], kind="stable")][:k]
+    return order, dist[order]
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(23)
+    return unit_vectors(rng.uniform(-90, 90, 2000), rng.uniform(-180, 180, 2000))
+
+
+@pytest.mark.parametrize("k", [1, 4, 17, 50])
+def test_kdtree_matches_brute_force(points, k):
+    tree = KDTree(points)
+    rng = np.random.default_rng(k)
+    for q in unit_vectors(rng.uniform(-90, 90, 25), rng.uniform(-180, 180, 25)):
+        positions, chords = tree.query(q, k)
+        expected, expected_chords = brute_force(points, q, k)
+        assert chords == pytest.approx(expected_chords)
+        assert set(positions) == set(expected)
+
+
+def test_kdtree_respects_max_chord_and_mask(points):
+    tree = KDTree(points)
+    mask = np.arange(len(points)) % 3 == 0
+    q = unit_vectors(18.52, 73.86)[0]
+    max_chord = km_to_chord(3000)
+
+    positions, chords = tree.query(q, 10, max_chord, mask=mask)
+    expected, expected_chords = brute_force(points, q, 10, max_chord, mask)
+    assert positions.tolist() == expected.tolist()
+    assert np.all(chords <= max_chord)
+    assert np.all(mask[positions])
+
+
+def test_kdtree_empty_and_tiny():
+    assert len(KDTree(np.empty((0, 3))).query([1.0, 0.0, 0.0], 3)[0]) == 0
+    positions, _ = KDTree(unit_vectors([10.0, 20.0], [30.0, 40.0])).query(unit_vectors(11, 31)[0], 5)
+    assert positions.tolist() == [0, 1]
+
+
+def test_chord_distance_round_trip():
+    pune, mumbai = unit_vectors([18.5204, 19.0760], [73.8567, 72.8777])
+    km = float(chord_to_km(np.linalg.norm(pune - mumbai)))
+    assert km == pytest.approx(120, abs=2)
+    assert float(chord_to_km(km_to_chord(km))) == pytest.approx(km)
+
+
+def sensor_row(sensor_id, lat, lon, aqi=None):
+    return (sensor_id, f"S{sensor_id}", lat, lon, 20, "region", aqi, None)
+
+
+@pytest.fixture
+def index(monkeypatch):
+    rows = [
+        sensor_row(1, 18.52, 73.85, 100),
+        sensor_row(2, 18.60, 73.90, 200),
+        sensor_row(3, 19.07, 72.88),
+        sensor_row(4, 10.00, 179.5, 50),
+        sensor_row(5, 10.20, -179.5, 60),
+        sensor_row(6, -33.87, 151.21, 30),
+    ]
+    monkeypatch.setattr(spatial, "run_with_connection", lambda query: rows)
+    index = SensorIndex(reload_interval=3600)
+    index.ensure_loaded()
+    return index
+
+
+def test_within_returns_sensors_in_the_box(index):
+    count, sensors = index.within(72.5, 18.0, 74.0, 19.5)
+    assert count == 3
+    assert [s["sensor_id"] for s in sensors] == [1, 2, 3]
+    assert sensors[2]["aqi"] is None
+
+
+def test_within_wraps_across_the_antimeridian(index):
+    count, sensors = index.within(179.0, 9.0, -179.0, 11.0)
+    assert count == 2
+    assert sorted(s["sensor_id"] for s in sensors) == [4, 5]
+    assert index.within(-179.0, 9.0, 179.0, 11.0)[0] == 0
+
+
+def test_within_applies_the_limit_after_counting(index):
+    count, sensors = index.within(-180, -90, 180, 90, limit=2)
+    assert count == 6
+    assert len(sensors) == 2
+
+
+def test_interpolate_skips_sensors_without_a_reading(index):
+    result = index.interpolate(19.07, 72.88, k=1, max_km=200)
+    assert [s["sensor_id"] for s in result["sensors"]] == [1]
+    assert index.interpolate(18.52, 73.85)["aqi"] == 100
+    assert index.interpolate(0.0, 0.0) is None
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+import app.stream as stream
+
+
+READING = {
+    "sensor_id": 987654, "PM2_5": 35.0, "PM10": 60.0, "NO2": 15.0, "CO": 0.5,
+    "SO2": 5.0, "O3": 20.0, "NH3": 2.0, "hour": 10, "day": 1, "month": 1, "weekday": 0,
+}
+
+
+class RecordingLoop:
+    """Stands in for the event loop the broadcaster fans out on."""
+
+    def __init__(self):
+        self.fanned_out = []
+
+    def call_soon_threadsafe(self, callback, events):
+        self.fanned_out.extend(events)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    loop_threads = set()
+    region_queries = []
+
+    async def fake_predict(name, features):
+        # Runs on the event loop; remember which thread that is
+        loop_threads.add(threading.get_ident())
+        return [42.0], 1.0, name
+
+    def fake_region_query(fn):
+        region_queries.append(threading.get_ident())
+        return [(1, 1, "Central")]
+
+    monkeypatch.setattr(main.inference_executor, "predict", fake_predict)
+    monkeypatch.setattr(main, "buffered_ingest_enabled", lambda: False)
+    monkeypatch.setattr(main, "ASYNC_DB_ENABLED", False)
+    monkeypatch.setattr(main, "run_with_connection", lambda fn, *args: None)
+    monkeypatch.setattr(stream, "run_with_connection", fake_region_query)
+
+    broadcaster = main.broadcaster
+    loop = RecordingLoop()
+    monkeypatch.setattr(broadcaster, "_loop", loop)
+    monkeypatch.setattr(broadcaster, "_sensor_regions", {})
+    monkeypatch.setattr(broadcaster, "_sensor_map_loaded_at", 0.0)
+    sub = broadcaster.subscribe()
+
+    yield TestClient(main.app), loop, loop_threads, region_queries
+
+    broadcaster.unsubscribe(sub)
+
+
+def wait_for_region_reload(timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while main.broadcaster._sensor_map_reloading and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_predict_unknown_sensor_does_not_query_on_event_loop(client):
+    http, loop, loop_threads, region_queries = client
+
+    response = http.post("/predict", json=READING)
+    assert response.status_code == 200
+    wait_for_region_reload()
+
+    # The event went out without a region instead of waiting on the database
+    assert [event["sensor_id"] for _, event in loop.fanned_out] == [READING["sensor_id"]]
+    assert loop.fanned_out[0][0] is None
+
+    # The miss scheduled exactly one reload, and it ran off the event loop
+    assert len(region_queries) == 1
+    assert loop_threads and not loop_threads & set(region_queries)
+
+
+def test_region_miss_reloads_at_most_once_per_interval(client):
+    http, loop, loop_threads, region_queries = client
+
+    for _ in range(5):
+        assert http.post("/predict", json=READING).status_code == 200
+    wait_for_region_reload()
+
+    assert len(region_queries) == 1
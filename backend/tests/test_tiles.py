@@ -0,0 +1,53 @@
+import numpy as np
+
+import app.tiles as tiles
+from app.tiles import TileCache, _Tile
+
+
+def test_tile_is_encoded_outside_the_cache_lock(monkeypatch):
+    cache = TileCache(max_entries=8, refresh_interval=0)
+    cache._thread = object()  # pretend the refresher runs, so get() skips _apply_pending
+    cache._entries[(3, 1, 2)] = _Tile((np.zeros((4, 4)), np.zeros((4, 4))))
+    held = []
+
+    def encode_grid(values):
+        held.append(cache._lock.locked())
+        return b"grid"
+
+    monkeypatch.setattr(tiles, "encode_grid", encode_grid)
+
+    body, etag = cache.get(3, 1, 2, "bin")
+    assert body == b"grid"
+    assert held == [False]
+
+    # Encoded once per format, then served from the tile
+    assert cache.get(3, 1, 2, "bin") == (body, etag)
+    assert held == [False]
+
+
+def test_pending_points_stay_bounded_without_refreshes(monkeypatch):
+    monkeypatch.setattr(tiles, "TILE_PENDING_COMPACT", 100)
+    cache = TileCache(max_entries=8, refresh_interval=0)
+    cache._entries[(3, 1, 2)] = _Tile(None)
+
+    sensors_lat = np.linspace(10, 20, 50)
+    sensors_lon = np.linspace(70, 80, 50)
+    for _ in range(1000):
+        cache.mark(sensors_lat, sensors_lon)
+
+    assert cache.stats()["pending_points"] <= 100 + 50
+    lat = np.concatenate(cache._pending_lat)
+    assert set(np.round(lat, 6)) == set(np.round(sensors_lat, 6))
+
+
+def test_touched_tiles_are_dropped_when_not_refreshing(monkeypatch):
+    cache = TileCache(max_entries=8, refresh_interval=0)
+    near, far = (10, 722, 458), (10, 100, 100)  # Pune at z10, and somewhere else
+    cache._entries[near] = _Tile(None)
+    cache._entries[far] = _Tile(None)
+
+    cache.mark(np.array([18.52]), np.array([73.85]))
+    cache._apply_pending(rerender=False)
+
+    assert list(cache._entries) == [far]
+    assert cache.stats()["pending_points"] == 0
@@ -1,8 +1,8 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useMemo, useRef, useState } from 'react';
 import { MapContainer, TileLayer, Marker, Popup, Circle, Tooltip } from 'react-leaflet';
 import 'leaflet/dist/leaflet.css';
 import { useAppContext } from '../context/AppContext';
-import { fetchPublicSensors, fetchLatestAQI } from '../services/api';
+import { fetchPublicSensors, fetchLatestAQI, openLatestStream, AQI_TILE_URL } from '../services/api';
 import { Activity, Radio } from 'lucide-react';
 import { getHealthAdvisory } from '../utils/health';
 
@@ -18,53 +18,92 @@ function fixLeafletIcon() {
 
 export default function MapView() {
     const { liveData } = useAppContext();
-    const [sensors, setSensors] = useState([]);
+    const [dbSensors, setDbSensors] = useState([]);
+    const [latestBySensor, setLatestBySensor] = useState({});
     const [loading, setLoading] = useState(true);
+    const heatmapRef = useRef(null);
 
     useEffect(() => { fixLeafletIcon(); }, []);
 
+    // Refetch heatmap tiles periodically; unchanged tiles come back from the browser cache or as 304s
     useEffect(() => {
-        const loadMapData = async () => {
+        const interval = setInterval(() => heatmapRef.current?.redraw(), 30000);
+        return () => clearInterval(interval);
+    }, []);
+
+    useEffect(() => {
+        // Fetch physical sensor locations and radius from backend database
+        // This ensures admin portal modifications dynamically sync with the public frontend
+        const loadSensors = async () => {
             try {
-                // Fetch physical sensor locations and radius from backend database
-                // This ensures admin portal modifications dynamically sync with the public frontend
                 const sensorsRes = await fetchPublicSensors();
-                const dbSensors = sensorsRes.data;
-
-                // Always fetch latest global AQI to fallback for sensors that aren't actively pinging in the 50-item liveData array
-                let fallbackData = [];
-                try {
-                    const latestRes = await fetchLatestAQI();
-                    fallbackData = latestRes.data || [];
-                } catch (e) { }
-
-                // Map live or latest AQI data onto the physical hardware nodes
-                const mappedSensors = dbSensors.map(sensor => {
-                    let activeNode = liveData.find(d => d.sensor_id === sensor.sensor_id);
-                    if (!activeNode) activeNode = fallbackData.find(d => d.sensor_id === sensor.sensor_id);
-
-                    return {
-                        ...sensor,
-                        aqi: activeNode?.aqi || null,
-                        category: activeNode?.category || 'Unknown',
-                        pm25: activeNode?.PM2_5 || null,
-                        pm10: activeNode?.PM10 || null,
-                        timestamp: activeNode?.timestamp ? new Date(activeNode.timestamp).toLocaleString() : 'No recent data'
-                    };
-                });
-
-                setSensors(mappedSensors);
-                setLoading(false);
+                setDbSensors(sensorsRes.data);
             } catch (error) {
                 console.error("Error loading geospatial map data:", error);
+            } finally {
                 setLoading(false);
             }
         };
 
-        loadMapData();
-        const interval = setInterval(loadMapData, 10000); // 10s auto-refresh sync
+        loadSensors();
+        const interval = setInterval(loadSensors, 60000);
         return () => clearInterval(interval);
-    }, [liveData]);
+    }, []);
+
+    useEffect(() => {
+        const toMap = (rows) => Object.fromEntries(rows.map(r => [r.sensor_id, r]));
+
+        // Latest AQI is pushed by the server; polling is only the fallback when the stream is unavailable
+        let pollTimer = null;
+        const pollLatest = async () => {
+            try {
+                const latestRes = await fetchLatestAQI();
+                setLatestBySensor(toMap(latestRes.data || []));
+            } catch (e) { }
+        };
+        const startPolling = () => {
+            if (pollTimer) return;
+            pollLatest();
+            pollTimer = setInterval(pollLatest, 10000);
+        };
+        const stopPolling = () => {
+            clearInterval(pollTimer);
+            pollTimer = null;
+        };
+
+        const stream = openLatestStream({
+            onSnapshot: (rows) => {
+                stopPolling();
+                setLatestBySensor(toMap(rows));
+            },
+            onReading: (reading) => {
+                setLatestBySensor(prev => ({ ...prev, [reading.sensor_id]: reading }));
+            },
+            // EventSource reconnects on its own and gets a fresh snapshot; poll in the meantime
+            onError: startPolling,
+        });
+        if (!stream) startPolling();
+
+        return () => {
+            stopPolling();
+            if (stream) stream.close();
+        };
+    }, []);
+
+    // Map live or latest AQI data onto the physical hardware nodes
+    const sensors = useMemo(() => dbSensors.map(sensor => {
+        let activeNode = liveData.find(d => d.sensor_id === sensor.sensor_id);
+        if (!activeNode) activeNode = latestBySensor[sensor.sensor_id];
+
+        return {
+            ...sensor,
+            aqi: activeNode?.aqi || null,
+            category: activeNode?.category || 'Unknown',
+            pm25: activeNode?.PM2_5 || null,
+            pm10: activeNode?.PM10 || null,
+            timestamp: activeNode?.timestamp ? new Date(activeNode.timestamp).toLocaleString() : 'No recent data'
+        };
+    }), [dbSensors, latestBySensor, liveData]);
 
     const getColor = (aqi) => {
         if (!aqi) return '#64748b'; // Gray/Offline
@@ -92,6 +131,8 @@ export default function MapView() {
 
                 <MapContainer center={[19.6, 75.8]} zoom={6} className="h-full w-full">
                     <TileLayer url="https://{s}.basemaps.cartocdn.com/rastertiles/voyager/{z}/{x}/{y}{r}.png" />
+                    {/* Interpolated AQI surface, rendered server-side from the latest readings */}
+                    <TileLayer ref={heatmapRef} url={AQI_TILE_URL} maxNativeZoom={16} zIndex={2} />
 
                     {sensors.filter(s => s.latitude != null && s.longitude != null).map((sensor, i) => (
                         <React.Fragment key={`sensor - ${sensor.sensor_id} -${i} `}>
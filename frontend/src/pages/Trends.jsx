@@ -1,12 +1,16 @@
 import React, { useEffect, useState } from 'react';
 import { LineChart, Line, AreaChart, Area, XAxis, YAxis, CartesianGrid, Tooltip, ReferenceArea, ResponsiveContainer } from 'recharts';
 import ChartContainer from '../components/ChartContainer';
-import { fetchHistory, fetchForecast } from '../services/api';
+import { fetchHistoryRange, fetchForecast } from '../services/api';
 import { Activity, TrendingUp, TrendingDown, Minus } from 'lucide-react';
 import { useAppContext } from '../context/AppContext';
 
+// Chart ranges in hours; the backend buckets each one down to at most 300 points
+const RANGES = { '24H': 24, '7D': 24 * 7, '30D': 24 * 30 };
+
 export default function Trends() {
     const { liveData } = useAppContext();
+    const [range, setRange] = useState('24H');
     const [historyData, setHistoryData] = useState([]);
     const [currentAQI, setCurrentAQI] = useState(null);
     const [peakAQI, setPeakAQI] = useState(null);
@@ -29,11 +33,20 @@ export default function Trends() {
         const fetchDashboardData = async () => {
             try {
                 // Fetch history from API (fallback to region 1)
-                const histRes = await fetchHistory(1);
+                const hours = RANGES[range];
+                const histRes = await fetchHistoryRange({
+                    region_id: 1,
+                    from: new Date(Date.now() - hours * 3600 * 1000).toISOString(),
+                    points: 300
+                });
+                const points = (histRes.data?.points || []).filter(d => d.aqi != null);
+                const formatTime = (ts) => hours > 24
+                    ? new Date(ts).toLocaleString([], { month: 'short', day: 'numeric', hour: '2-digit' })
+                    : new Date(ts).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
                 let data = [];
-                if (histRes.data && histRes.data.length > 0) {
-                    data = histRes.data.map(d => ({
-                        time: new Date(d.timestamp).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' }),
+                if (points.length > 0) {
+                    data = points.map(d => ({
+                        time: formatTime(d.timestamp),
                         timestamp: new Date(d.timestamp).getTime(),
                         AQI: parseFloat(d.aqi.toFixed(1)),
                         pm25: d.pm25 ? parseFloat(d.pm25.toFixed(1)) : 0,
@@ -87,7 +100,7 @@ export default function Trends() {
         fetchDashboardData();
         const inv = setInterval(fetchDashboardData, 30000); // 30s auto-refresh
         return () => clearInterval(inv);
-    }, []);
+    }, [range]);
 
     if (loading) {
         return (
@@ -126,13 +139,24 @@ export default function Trends() {
                             </span>
                         </div>
                     </div>
-                    <div className="flex gap-8 text-right">
+                    <div className="flex gap-8 text-right items-center">
+                        <div className="flex gap-1 bg-slate-800/60 rounded-lg p-1">
+                            {Object.keys(RANGES).map(key => (
+                                <button
+                                    key={key}
+                                    onClick={() => setRange(key)}
+                                    className={`px-2.5 py-1 rounded-md text-xs font-bold ${range === key ? 'bg-slate-600 text-white' : 'text-slate-400 hover:text-white'}`}
+                                >
+                                    {key}
+                                </button>
+                            ))}
+                        </div>
                         <div>
                             <p className="text-slate-400 text-[10px] font-bold uppercase tracking-widest mb-1">Current</p>
                             <p className="text-4xl font-black text-white">{currentAQI?.toFixed(1) || '--'}</p>
                         </div>
                         <div>
-                            <p className="text-slate-400 text-[10px] font-bold uppercase tracking-widest mb-1">24H Peak</p>
+                            <p className="text-slate-400 text-[10px] font-bold uppercase tracking-widest mb-1">{range} Peak</p>
                             <p className="text-4xl font-black text-slate-300">{peakAQI?.toFixed(1) || '--'}</p>
                         </div>
                     </div>
@@ -19,11 +19,31 @@ api.interceptors.request.use(config => {
 
 export const fetchLatestAQI = () => api.get('/latest');
 export const fetchHistory = (regionId) => api.get(`/history/${regionId}`);
+// Bucketed AQI over a time range; params: from, to, sensor_id, region_id, resolution, points, cursor
+export const fetchHistoryRange = (params) => api.get('/history', { params });
 export const predictAQI = (data) => api.post('/predict', data);
 export const fetchForecast = (sensorId) => api.get(`/forecast/${sensorId}`);
 export const fetchTopPolluted = () => api.get('/top-polluted');
 export const fetchPublicSensors = () => api.get('/public/sensors');
 
+// Heatmap tiles of the latest AQI, rendered and cached by the backend
+export const AQI_TILE_URL = `${API_BASE_URL}/tiles/aqi/{z}/{x}/{y}.png`;
+
+// Server-Sent Events feed of new readings; returns null if EventSource is unavailable
+export const openLatestStream = ({ regionIds = [], onSnapshot, onReading, onError } = {}) => {
+    if (typeof EventSource === 'undefined') return null;
+
+    const params = new URLSearchParams();
+    regionIds.forEach(id => params.append('region_id', id));
+    const query = params.toString();
+
+    const source = new EventSource(`${API_BASE_URL}/stream/latest${query ? `?${query}` : ''}`);
+    if (onSnapshot) source.addEventListener('snapshot', e => onSnapshot(JSON.parse(e.data)));
+    if (onReading) source.addEventListener('reading', e => onReading(JSON.parse(e.data)));
+    if (onError) source.onerror = onError;
+    return source;
+};
+
 export const registerAdmin = (username, email, password) =>
     api.post(`/admin/register?username=${encodeURIComponent(username)}&email=${encodeURIComponent(email)}&password=${encodeURIComponent(password)}`);
 